@@ -9,34 +9,552 @@ Requirements:
 - transformers
 - datasets
 - torch
-- torchaudio
 - librosa
 - numpy
-- pandas
 - json
+
+transformers, torch, datasets and matplotlib are imported where they are
+first needed, so a run limited to the librosa features never loads the
+model processors.
 """
 
+from __future__ import annotations
+
 import os
 import json
+import hashlib
+import pickle
+import shutil
+from functools import cached_property
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait, as_completed
 import numpy as np
-import pandas as pd
-import torch
-import torchaudio
 import librosa
+import soundfile as sf
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
-from datasets import Dataset, DatasetDict
-from transformers import (
-    MusicgenProcessor, 
-    MusicgenForConditionalGeneration,
-    WhisperFeatureExtractor,
-    AutoProcessor
-)
-import matplotlib.pyplot as plt
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple, Any, Iterator
 from tqdm import tqdm
+from audio_store import write_audio_store
+from pipeline_profiling import StageProfiler, stage
 import warnings
 warnings.filterwarnings('ignore')
 
+if TYPE_CHECKING:
+    import pyarrow as pa
+    from datasets import Dataset, DatasetDict, Features
+
+# Bump when a change to the processing code makes previously cached items stale
+PIPELINE_VERSION = 6
+
+WHISPER_MODEL = "openai/whisper-small"
+WHISPER_MEL_BINS = 80
+WHISPER_SAMPLE_RATE = 16000
+WHISPER_HOP_LENGTH = 160
+
+# MusicGen's audio tokenizer; its 2048-entry codebooks fit in int16
+ENCODEC_MODEL = "facebook/encodec_32khz"
+
+# Storage dtypes for processed_audio; int16 stores samples scaled by INT16_SCALE
+AUDIO_DTYPES = ("float32", "int16")
+INT16_SCALE = 32767
+
+# Resampler used for each resample_quality, fastest last; "high" is librosa's default
+RESAMPLE_QUALITIES = {
+    'best': 'soxr_vhq',
+    'high': 'soxr_hq',
+    'medium': 'soxr_mq',
+    'low': 'soxr_lq',
+    'polyphase': 'polyphase'
+}
+
+# Seconds decoded beyond max_audio_length, so leading silence can be trimmed without a second read
+DECODE_MARGIN = 5.0
+# Reads of load_audio_file, doubling the decoded length each time, before it settles for what it has
+MAX_DECODE_READS = 16
+
+# Frames quieter than this many dB below the loudest frame of a recording count as silent when segmenting
+SILENCE_TOP_DB = 40
+
+# Parts of each row process_dataset can produce: librosa features, MusicGen text tokens,
+# Whisper log-mel features and the processed waveform
+STAGES = ("features", "musicgen", "whisper", "audio")
+
+# Size in inches of the quality control figures; each panel is half as wide
+VIZ_FIGSIZE = (15, 10)
+# Rows rendered per pool task, small enough for steady progress updates
+VIZ_CHUNK_SIZE = 8
+
+# Percentiles and histogram bins reported for every scalar audio feature in the dataset summary
+SUMMARY_PERCENTILES = (5, 25, 50, 75, 95)
+SUMMARY_HISTOGRAM_BINS = 10
+
+AUDIO_FEATURE_SCALARS = [
+    'duration', 'spectral_centroid', 'spectral_bandwidth', 'spectral_rolloff',
+    'tempo', 'harmonic_ratio', 'zero_crossing_rate', 'rms_energy'
+]
+
+# Pipeline owned by each pool worker, created once by _init_worker
+_worker_pipeline = None
+
+
+def _init_worker(config: Dict[str, Any]):
+    """Process pool initializer: build a pipeline and load its processors once per worker"""
+    global _worker_pipeline
+    _worker_pipeline = AudioPreprocessingPipeline(**config, verbose=False)
+    if _worker_pipeline.needs_processors():
+        import torch
+        # One worker per core; letting torch start a thread per core in every worker oversubscribes the CPU
+        torch.set_num_threads(1)
+    _worker_pipeline.load_processors()
+
+
+def _process_in_worker(entries: List[Tuple[str, Dict[str, Any]]]) -> Tuple[List[Tuple[Optional[List[Dict[str, Any]]], Optional[str]]], List[Dict[str, Any]]]:
+    """Results of process_entries, plus the profiling records of the chunk for the parent"""
+    return _worker_pipeline.process_entries(entries), _worker_pipeline.profiler.take_records()
+
+
+def _init_codec_worker(config: Dict[str, Any]):
+    """Process pool initializer for audio code shards: build a pipeline and load the codec once per worker"""
+    global _worker_pipeline
+    import torch
+    torch.set_num_threads(1)
+    _worker_pipeline = AudioPreprocessingPipeline(**config, verbose=False)
+    _worker_pipeline.load_audio_codec()
+
+
+def _encode_codes_in_worker(shard: Dataset, path: Path) -> int:
+    return _worker_pipeline.write_codes_shard(shard, path)
+
+
+def dataset_features(audio_dtype: str = "float32", stages: Iterable[str] = STAGES) -> Features:
+    """
+    Schema of the processed dataset
+    
+    Arrays are stored as typed Arrow columns rather than lists of Python numbers.
+    Whisper features are stored frames-major, (frames, WHISPER_MEL_BINS), because
+    only the first dimension of an Arrow array column may vary between rows.
+    Columns of stages not in ``stages`` are left out.
+    """
+    from datasets import Features, Sequence, Value, Array2D
+    
+    if audio_dtype not in AUDIO_DTYPES:
+        raise ValueError(f"Unsupported audio dtype: {audio_dtype} (expected one of {AUDIO_DTYPES})")
+    
+    audio_features = {name: Value('float64') for name in AUDIO_FEATURE_SCALARS}
+    audio_features.update({
+        'sample_rate': Value('int32'),
+        'mfcc_mean': Sequence(Value('float32')),
+        'mfcc_std': Sequence(Value('float32'))
+    })
+    
+    columns = {
+        'audio_file': Value('string'),
+        'segment_index': Value('int32'),
+        'segment_start': Value('float32'),
+        'text': Value('string'),
+        'style': Value('string'),
+        'duration': Value('string'),
+        'emotion': Value('string'),
+        'instruments': Sequence(Value('string')),
+        'therapeutic_benefit': Value('string'),
+        'audio_features': audio_features,
+        'musicgen_features': {
+            'input_ids': Sequence(Value('int32')),
+            'attention_mask': Sequence(Value('int8'))
+        },
+        'whisper_features': {
+            'input_features': Array2D(shape=(None, WHISPER_MEL_BINS), dtype='float32')
+        },
+        'processed_audio': Sequence(Value(audio_dtype)),
+        'sample_rate': Value('int32')
+    }
+    
+    stage_columns = {
+        'features': 'audio_features',
+        'musicgen': 'musicgen_features',
+        'whisper': 'whisper_features',
+        'audio': 'processed_audio'
+    }
+    for name, column in stage_columns.items():
+        if name not in stages:
+            del columns[column]
+    
+    return Features(columns)
+
+
+def waveform_envelope(audio_array: np.ndarray, width: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Min/max envelope of a waveform in ``width`` bins, all a plot ``width`` pixels wide can show
+    
+    Returns:
+        Tuple of (first sample of each bin, bin minima, bin maxima); waveforms
+        of at most 2 * ``width`` samples are returned as they are
+    """
+    if len(audio_array) <= 2 * width:
+        return np.arange(len(audio_array)), audio_array, audio_array
+    
+    starts = np.linspace(0, len(audio_array), width, endpoint=False).astype(np.int64)
+    return starts, np.minimum.reduceat(audio_array, starts), np.maximum.reduceat(audio_array, starts)
+
+
+def _render_samples(dataset: Dataset, indices: List[int], viz_dir: str, dpi: int) -> int:
+    """
+    Save the quality control figure of each row in ``indices``, in this process or a pool worker
+    
+    Figures are drawn on the Agg canvas directly, without pyplot's global
+    state or an interactive backend. The spectrogram panel shows the stored
+    Whisper log-mel features rather than a freshly computed STFT.
+    
+    Returns:
+        Number of figures saved
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    
+    columns = ['audio_file', 'processed_audio', 'sample_rate', 'audio_features', 'whisper_features']
+    rows = dataset.select_columns(
+        [name for name in columns if name in dataset.column_names]
+    ).with_format("numpy", dtype=None)
+    width = int(VIZ_FIGSIZE[0] / 2 * dpi)
+    
+    for i in indices:
+        sample = rows[i]
+        sample_rate = int(sample['sample_rate'])
+        
+        fig = Figure(figsize=VIZ_FIGSIZE)
+        FigureCanvasAgg(fig)
+        axes = fig.subplots(2, 2)
+        fig.suptitle(f'Sample {i+1}: {sample["audio_file"]}', fontsize=16)
+        
+        # Plot 1: Waveform, as its min/max envelope at the panel's resolution
+        audio_array = decode_audio(sample['processed_audio'])
+        starts, minima, maxima = waveform_envelope(audio_array, width)
+        axes[0, 0].fill_between(starts / sample_rate, minima, maxima, linewidth=0.5)
+        axes[0, 0].set_title('Waveform')
+        axes[0, 0].set_xlabel('Time (s)')
+        axes[0, 0].set_ylabel('Amplitude')
+        
+        # Plot 2: Spectrogram, reused from the Whisper features when present
+        input_features = (sample.get('whisper_features') or {}).get('input_features')
+        if input_features is not None and np.size(input_features):
+            spectrogram = np.asarray(input_features).T
+            duration = spectrogram.shape[1] * WHISPER_HOP_LENGTH / WHISPER_SAMPLE_RATE
+        else:
+            spectrogram = FeatureEngine(audio_array, sample_rate).log_mel
+            duration = len(audio_array) / sample_rate
+        axes[0, 1].imshow(spectrogram, origin='lower', aspect='auto', extent=(0, duration, 0, spectrogram.shape[0]))
+        axes[0, 1].set_title('Log-mel Spectrogram')
+        axes[0, 1].set_xlabel('Time (s)')
+        axes[0, 1].set_ylabel('Mel bin')
+        
+        # Plot 3: MFCC
+        mfccs = np.asarray(sample['audio_features']['mfcc_mean'])
+        axes[1, 0].bar(range(len(mfccs)), mfccs)
+        axes[1, 0].set_title('MFCC Features (Mean)')
+        axes[1, 0].set_xlabel('MFCC Coefficient')
+        axes[1, 0].set_ylabel('Value')
+        
+        # Plot 4: Feature summary
+        features = sample['audio_features']
+        feature_names = ['tempo', 'harmonic_ratio', 'zero_crossing_rate', 'rms_energy']
+        feature_values = [float(features.get(name) or 0) for name in feature_names]
+        
+        axes[1, 1].bar(feature_names, feature_values)
+        axes[1, 1].set_title('Audio Features Summary')
+        axes[1, 1].tick_params(axis='x', rotation=45)
+        
+        fig.tight_layout()
+        fig.savefig(Path(viz_dir) / f'sample_{i+1}_features.png', dpi=dpi, bbox_inches='tight')
+    
+    return len(indices)
+
+
+def _value_counts(column: pa.ChunkedArray) -> Dict[str, int]:
+    """Occurrences of each value of a string column, most frequent first"""
+    import pyarrow.compute as pc
+    
+    value_counts = pc.value_counts(column)
+    values = value_counts.field('values').to_pylist()
+    counts = value_counts.field('counts').to_numpy()
+    return {str(values[i]): int(counts[i]) for i in np.argsort(-counts, kind='stable')}
+
+
+def _feature_statistics(values: np.ndarray) -> Optional[Dict[str, Any]]:
+    """Moments, percentiles and a histogram of one scalar feature; missing values (NaN) are left out"""
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return None
+    
+    counts, bin_edges = np.histogram(values, bins=SUMMARY_HISTOGRAM_BINS)
+    return {
+        'count': int(len(values)),
+        'mean': float(values.mean()),
+        'std': float(values.std()),
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'percentiles': {f'p{q}': float(v) for q, v in zip(SUMMARY_PERCENTILES, np.percentile(values, SUMMARY_PERCENTILES))},
+        'histogram': {'counts': counts.tolist(), 'bin_edges': bin_edges.tolist()}
+    }
+
+
+def audio_codes_features(num_codebooks: int) -> Features:
+    """Schema of the audio code shards written by tokenize_audio, frames-major like the Whisper features"""
+    from datasets import Features, Array2D
+    
+    return Features({
+        'audio_codes': Array2D(shape=(None, num_codebooks), dtype='int16')
+    })
+
+
+def encode_audio(audio_array: np.ndarray, audio_dtype: str = "float32") -> np.ndarray:
+    """Convert a normalized float waveform to its storage dtype"""
+    if audio_dtype == "int16":
+        return (np.clip(audio_array, -1.0, 1.0) * INT16_SCALE).astype(np.int16)
+    return np.asarray(audio_array, dtype=np.float32)
+
+
+def decode_audio(audio: np.ndarray) -> np.ndarray:
+    """Float waveform from stored processed_audio (float32 is returned as is)"""
+    audio = np.asarray(audio)
+    if audio.dtype == np.int16:
+        return audio.astype(np.float32) / INT16_SCALE
+    return audio.astype(np.float32, copy=False)
+
+
+def load_processed_dataset(path: str):
+    """
+    Load a processed dataset (or train/validation split) with NumPy formatting
+    
+    ``processed_audio`` and the MusicGen token columns come back as NumPy views
+    of the memory-mapped Arrow files in their stored dtypes, so reading a row
+    does not copy its audio. Use decode_audio() to turn int16 audio into floats.
+    Whisper features are materialized per row; ``.T`` gives Whisper's
+    (mel bins, frames) layout.
+    
+    Args:
+        path: Directory written by save_to_disk
+        
+    Returns:
+        Dataset or DatasetDict
+    """
+    from datasets import load_from_disk
+    
+    # dtype=None keeps int16/int32 columns as stored instead of upcasting them to int64
+    return load_from_disk(path).with_format("numpy", dtype=None)
+
+
+def _migrate_row(row: Dict[str, Any], audio_dtype: str) -> Dict[str, Any]:
+    """Convert one row of the list-based schema to dataset_features()"""
+    def first(value):
+        # The old schema kept the processor's batch dimension of 1
+        return value[0] if value is not None and len(value) else None
+    
+    old_features = row.get('audio_features') or {}
+    audio_features = {
+        name: float(np.atleast_1d(old_features[name])[0]) if old_features.get(name) is not None else None
+        for name in AUDIO_FEATURE_SCALARS
+    }
+    audio_features['sample_rate'] = old_features.get('sample_rate')
+    audio_features['mfcc_mean'] = old_features.get('mfcc_mean')
+    audio_features['mfcc_std'] = old_features.get('mfcc_std')
+    
+    musicgen = row.get('musicgen_features') or {}
+    whisper = first((row.get('whisper_features') or {}).get('input_features'))
+    
+    return {
+        'segment_index': 0,
+        'segment_start': 0.0,
+        'duration': str(row.get('duration')),
+        'audio_features': audio_features,
+        'musicgen_features': {
+            'input_ids': first(musicgen.get('input_ids')),
+            'attention_mask': first(musicgen.get('attention_mask'))
+        },
+        'whisper_features': {
+            'input_features': np.asarray(whisper, dtype=np.float32).T if whisper is not None else None
+        },
+        'processed_audio': encode_audio(np.asarray(row['processed_audio'], dtype=np.float32), audio_dtype)
+    }
+
+
+def migrate_processed_dataset(path: str, audio_dtype: str = "float32"):
+    """
+    Rewrite a dataset saved with the old list-based schema in place
+    
+    Works on both processed_dataset and train_val_split directories. The new
+    copy is written next to the old one and only replaces it once complete.
+    
+    Args:
+        path: Directory written by save_to_disk
+        audio_dtype: "float32" or "int16" storage for processed_audio
+    """
+    from datasets import Dataset, DatasetDict, load_from_disk
+    
+    print(f"🔄 Migrating {path} to typed array columns ({audio_dtype} audio)...")
+    dataset = load_from_disk(path)
+    features = dataset_features(audio_dtype)
+    
+    def migrate(split: Dataset) -> Dataset:
+        return split.map(
+            _migrate_row,
+            fn_kwargs={'audio_dtype': audio_dtype},
+            features=features,
+            desc="Migrating rows"
+        )
+    
+    if isinstance(dataset, DatasetDict):
+        migrated = DatasetDict({name: migrate(split) for name, split in dataset.items()})
+    else:
+        migrated = migrate(dataset)
+    
+    tmp_path = f"{path.rstrip(os.sep)}.migrating"
+    migrated.save_to_disk(tmp_path)
+    del dataset, migrated
+    shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    print(f"✅ Migrated {path}")
+
+
+class ProcessingCache:
+    """
+    Processed rows of each source file stored one file per source, keyed by a
+    fingerprint of the file, its metadata and the pipeline configuration
+    """
+    
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+    
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pkl"
+    
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Cached rows for ``key``, or None if they are missing or unreadable"""
+        try:
+            with open(self._path(key), 'rb') as f:
+                rows = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # A truncated or unreadable entry is simply reprocessed
+            print(f"⚠️  Ignoring unreadable cache entry {key}: {e}")
+            return None
+        
+        self.hits += 1
+        return rows
+    
+    def contains(self, key: str) -> bool:
+        return self._path(key).exists()
+    
+    def put(self, key: str, rows: List[Dict[str, Any]]):
+        """Store rows; written to a temporary file first so an interrupted run never leaves a partial entry"""
+        path = self._path(key)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    
+    def prune(self, keep: set) -> int:
+        """Delete entries whose key is not in ``keep``; returns the number removed"""
+        removed = 0
+        for path in self.cache_dir.glob('*.pkl'):
+            if path.stem not in keep:
+                path.unlink()
+                removed += 1
+        for path in self.cache_dir.glob('*.tmp'):
+            path.unlink()
+        return removed
+
+
+class FeatureEngine:
+    """
+    Spectral intermediates of one clip, each computed at most once
+    
+    The STFT, magnitude and mel spectrograms and onset envelope are built lazily
+    and shared by every feature derived from them. They use librosa's default
+    analysis parameters, so features match the standalone librosa functions.
+    """
+    
+    def __init__(self, audio_array: np.ndarray, sample_rate: int, n_fft: int = 2048,
+                 hop_length: int = 512, n_mels: int = 128):
+        self.audio_array = audio_array
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mels = n_mels
+    
+    @cached_property
+    def stft(self) -> np.ndarray:
+        """Complex STFT"""
+        return librosa.stft(self.audio_array, n_fft=self.n_fft, hop_length=self.hop_length)
+    
+    @cached_property
+    def magnitude(self) -> np.ndarray:
+        """Magnitude spectrogram, the input the spectral shape features expect"""
+        return np.abs(self.stft)
+    
+    @cached_property
+    def log_mel(self) -> np.ndarray:
+        """Log-power mel spectrogram (dB), shared by MFCCs and onset detection"""
+        mel = librosa.feature.melspectrogram(S=self.magnitude ** 2, sr=self.sample_rate, n_mels=self.n_mels)
+        return librosa.power_to_db(mel)
+    
+    @cached_property
+    def onset_envelope(self) -> np.ndarray:
+        # Median aggregation across mel bands, as librosa.beat.beat_track uses
+        return librosa.onset.onset_strength(S=self.log_mel, sr=self.sample_rate, aggregate=np.median)
+    
+    @cached_property
+    def hpss(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Harmonic and percussive waveforms, separated on the shared STFT"""
+        harmonic, percussive = librosa.decompose.hpss(self.stft)
+        length = len(self.audio_array)
+        return (
+            librosa.istft(harmonic, hop_length=self.hop_length, length=length),
+            librosa.istft(percussive, hop_length=self.hop_length, length=length)
+        )
+    
+    def features(self) -> Dict[str, Any]:
+        """All scalar and MFCC summary features of the clip"""
+        y, sr = self.audio_array, self.sample_rate
+        
+        # Each shared intermediate is computed inside the stage named after it
+        with stage("features.stft"):
+            S = self.magnitude
+        with stage("features.spectral"):
+            spectral_centroid = float(np.mean(librosa.feature.spectral_centroid(S=S, sr=sr)))
+            spectral_bandwidth = float(np.mean(librosa.feature.spectral_bandwidth(S=S, sr=sr)))
+            spectral_rolloff = float(np.mean(librosa.feature.spectral_rolloff(S=S, sr=sr)))
+        with stage("features.mel"):
+            log_mel = self.log_mel
+        with stage("features.mfcc"):
+            mfccs = librosa.feature.mfcc(S=log_mel, sr=sr, n_mfcc=13)
+        with stage("features.beat"):
+            tempo, _ = librosa.beat.beat_track(onset_envelope=self.onset_envelope, sr=sr, hop_length=self.hop_length)
+        with stage("features.hpss"):
+            harmonic, percussive = self.hpss
+            harmonic_level = np.mean(np.abs(harmonic))
+            percussive_level = np.mean(np.abs(percussive))
+        # Time-domain framing only; these never needed a spectrogram
+        with stage("features.time_domain"):
+            zero_crossing_rate = float(np.mean(librosa.feature.zero_crossing_rate(y, hop_length=self.hop_length)))
+            rms_energy = float(np.mean(librosa.feature.rms(y=y, hop_length=self.hop_length)))
+        
+        return {
+            'duration': len(y) / sr,
+            'sample_rate': sr,
+            'spectral_centroid': spectral_centroid,
+            'spectral_bandwidth': spectral_bandwidth,
+            'spectral_rolloff': spectral_rolloff,
+            'mfcc_mean': np.mean(mfccs, axis=1).tolist(),
+            'mfcc_std': np.std(mfccs, axis=1).tolist(),
+            'tempo': float(np.atleast_1d(tempo)[0]),
+            'harmonic_ratio': float(harmonic_level / (harmonic_level + percussive_level)),
+            'zero_crossing_rate': zero_crossing_rate,
+            'rms_energy': rms_energy
+        }
+
+
 class AudioPreprocessingPipeline:
     """
     Complete pipeline for preprocessing audio data for MusicGen fine-tuning
@@ -49,7 +567,25 @@ class AudioPreprocessingPipeline:
         output_dir: str = "processed_dataset",
         target_sample_rate: int = 32000,
         max_audio_length: int = 30,  # seconds
-        model_name: str = "facebook/musicgen-small"
+        model_name: str = "facebook/musicgen-small",
+        whisper_model: str = WHISPER_MODEL,
+        codec_model: str = ENCODEC_MODEL,
+        audio_dtype: str = "float32",
+        resample_quality: str = "high",
+        segment: bool = False,
+        window_hop: Optional[float] = None,
+        max_silent_fraction: float = 1.0,
+        batch_size: int = 8,
+        num_workers: int = 1,
+        use_cache: bool = True,
+        hash_contents: bool = False,
+        shard_size: int = 256,
+        writer_batch_size: int = 16,
+        profile_stages: bool = False,
+        profile_slowest: int = 0,
+        profile_memory: bool = False,
+        stages: Iterable[str] = STAGES,
+        verbose: bool = True
     ):
         self.audio_dir = Path(audio_dir)
         self.metadata_file = Path(metadata_file)
@@ -57,6 +593,48 @@ class AudioPreprocessingPipeline:
         self.target_sample_rate = target_sample_rate
         self.max_audio_length = max_audio_length
         self.model_name = model_name
+        self.whisper_model = whisper_model
+        self.codec_model = codec_model
+        if audio_dtype not in AUDIO_DTYPES:
+            raise ValueError(f"Unsupported audio dtype: {audio_dtype} (expected one of {AUDIO_DTYPES})")
+        self.audio_dtype = audio_dtype
+        if resample_quality not in RESAMPLE_QUALITIES:
+            raise ValueError(f"Unsupported resample quality: {resample_quality} "
+                             f"(expected one of {tuple(RESAMPLE_QUALITIES)})")
+        self.resample_quality = resample_quality
+        # Split long recordings into max_audio_length windows every window_hop seconds instead of truncating;
+        # windows with more than max_silent_fraction of silent frames are dropped
+        self.segment = segment
+        if window_hop is not None and window_hop <= 0:
+            raise ValueError(f"window_hop must be positive, got {window_hop}")
+        self.window_hop = window_hop
+        self.max_silent_fraction = max_silent_fraction
+        # Clips passed to the MusicGen processor and Whisper feature extractor per call
+        self.batch_size = max(1, batch_size)
+        self.num_workers = max(1, num_workers)
+        self.use_cache = use_cache
+        # Fingerprint files by content instead of size and modification time
+        self.hash_contents = hash_contents
+        # Rows per dataset shard, and rows buffered in memory before they are flushed to it
+        self.shard_size = max(1, shard_size)
+        self.writer_batch_size = max(1, writer_batch_size)
+        # Time every stage of every processed file; with profile_slowest, also keep cProfile stats of the slowest
+        # files, and with profile_memory trace their peak memory (which slows them down)
+        self.profile_stages = profile_stages
+        self.profile_slowest = max(0, profile_slowest)
+        self.profile_memory = profile_memory
+        self.profiler = StageProfiler(
+            enabled=profile_stages,
+            profile_dir=str(self.output_dir / "profiles") if self.profile_slowest else None,
+            trace_memory=profile_memory
+        )
+        self.profile_report = None
+        # Parts of each row to produce; processors of stages left out are never imported or loaded
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            raise ValueError(f"Unknown stages: {sorted(unknown)} (expected some of {STAGES})")
+        self.stages = tuple(name for name in STAGES if name in stages)
+        self.verbose = verbose
         
         # Create output directory
         self.output_dir.mkdir(parents=True, exist_ok=True)
@@ -64,68 +642,255 @@ class AudioPreprocessingPipeline:
         # Initialize processors
         self.musicgen_processor = None
         self.whisper_feature_extractor = None
+        self.audio_codec = None
+        
+        if self.verbose:
+            print(f"🎵 Audio Preprocessing Pipeline initialized")
+            print(f"📁 Audio directory: {self.audio_dir}")
+            print(f"📄 Metadata file: {self.metadata_file}")
+            print(f"📤 Output directory: {self.output_dir}")
+            print(f"🎯 Target sample rate: {self.target_sample_rate} Hz")
+            print(f"⏱️  Max audio length: {self.max_audio_length} seconds")
+            if self.segment:
+                print(f"✂️  Segmenting into {self.max_audio_length}s windows every {self.window_hop or self.max_audio_length}s")
+            print(f"⚙️  Workers: {self.num_workers}")
+            if self.stages != STAGES:
+                print(f"🧩 Stages: {', '.join(self.stages)}")
+    
+    def config(self) -> Dict[str, Any]:
+        """Constructor arguments needed to rebuild an equivalent pipeline in another process"""
+        return {
+            'audio_dir': str(self.audio_dir),
+            'metadata_file': str(self.metadata_file),
+            'output_dir': str(self.output_dir),
+            'target_sample_rate': self.target_sample_rate,
+            'max_audio_length': self.max_audio_length,
+            'model_name': self.model_name,
+            'whisper_model': self.whisper_model,
+            'codec_model': self.codec_model,
+            'audio_dtype': self.audio_dtype,
+            'resample_quality': self.resample_quality,
+            'segment': self.segment,
+            'window_hop': self.window_hop,
+            'max_silent_fraction': self.max_silent_fraction,
+            'batch_size': self.batch_size,
+            'profile_stages': self.profile_stages,
+            'profile_slowest': self.profile_slowest,
+            'profile_memory': self.profile_memory,
+            'stages': self.stages
+        }
+    
+    def cache_config(self) -> Dict[str, Any]:
+        """Settings that change the processed output, and therefore the cache key"""
+        return {
+            'pipeline_version': PIPELINE_VERSION,
+            'target_sample_rate': self.target_sample_rate,
+            'max_audio_length': self.max_audio_length,
+            'model_name': self.model_name,
+            'whisper_model': self.whisper_model,
+            'audio_dtype': self.audio_dtype,
+            'resample_quality': self.resample_quality,
+            'segment': self.segment,
+            'window_hop': self.window_hop,
+            'max_silent_fraction': self.max_silent_fraction,
+            'stages': self.stages
+        }
+    
+    def fingerprint(self, audio_file: str, metadata: Dict[str, Any]) -> Optional[str]:
+        """
+        Cache key for one metadata entry
+        
+        Covers the file (size and mtime, or a content hash), the metadata entry
+        itself, since the text prompt is tokenized, and the pipeline settings.
         
-        print(f"🎵 Audio Preprocessing Pipeline initialized")
-        print(f"📁 Audio directory: {self.audio_dir}")
-        print(f"📄 Metadata file: {self.metadata_file}")
-        print(f"📤 Output directory: {self.output_dir}")
-        print(f"🎯 Target sample rate: {self.target_sample_rate} Hz")
-        print(f"⏱️  Max audio length: {self.max_audio_length} seconds")
+        Returns:
+            Hex digest, or None if the file does not exist
+        """
+        audio_path = self.audio_dir / audio_file
+        try:
+            stat = audio_path.stat()
+        except OSError:
+            return None
+        
+        if self.hash_contents:
+            file_hash = hashlib.sha256()
+            with open(audio_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    file_hash.update(block)
+            file_id = file_hash.hexdigest()
+        else:
+            file_id = f"{stat.st_size}:{stat.st_mtime_ns}"
+        
+        key_data = {
+            'audio_file': audio_file,
+            'file': file_id,
+            'metadata': metadata,
+            'config': self.cache_config()
+        }
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True, default=str).encode()).hexdigest()
+    
+    def needs_processors(self) -> bool:
+        """Whether any selected stage needs the MusicGen processor or the Whisper feature extractor"""
+        return 'musicgen' in self.stages or 'whisper' in self.stages
     
     def load_processors(self):
-        """Load MusicGen processor and Whisper feature extractor"""
-        print("🔄 Loading processors...")
+        """Load MusicGen processor and Whisper feature extractor, for the stages that use them"""
+        if not self.needs_processors():
+            return
+        
+        if self.verbose:
+            print("🔄 Loading processors...")
         
         try:
             # Load MusicGen processor
-            self.musicgen_processor = MusicgenProcessor.from_pretrained(self.model_name)
-            print(f"✅ MusicGen processor loaded: {self.model_name}")
+            if 'musicgen' in self.stages:
+                from transformers import MusicgenProcessor
+                self.musicgen_processor = MusicgenProcessor.from_pretrained(self.model_name)
+                if self.verbose:
+                    print(f"✅ MusicGen processor loaded: {self.model_name}")
             
             # Load Whisper feature extractor for additional features
-            self.whisper_feature_extractor = WhisperFeatureExtractor.from_pretrained("openai/whisper-small")
-            print("✅ Whisper feature extractor loaded")
+            if 'whisper' in self.stages:
+                from transformers import WhisperFeatureExtractor
+                self.whisper_feature_extractor = WhisperFeatureExtractor.from_pretrained(self.whisper_model)
+                if self.verbose:
+                    print("✅ Whisper feature extractor loaded")
             
         except Exception as e:
             print(f"❌ Error loading processors: {e}")
             raise
     
-    def load_audio_file(self, file_path: str) -> Tuple[np.ndarray, int]:
+    def load_audio_codec(self):
+        """Load the EnCodec model MusicGen tokenizes audio with, on CPU for inference"""
+        if self.verbose:
+            print("🔄 Loading audio codec...")
+        
+        try:
+            from transformers import EncodecModel
+            self.audio_codec = EncodecModel.from_pretrained(self.codec_model).eval()
+            if self.audio_codec.config.codebook_size > np.iinfo(np.int16).max + 1:
+                raise ValueError(f"{self.codec_model} has {self.audio_codec.config.codebook_size} codes per codebook, "
+                                 f"too many to store as int16")
+            if self.verbose:
+                print(f"✅ Audio codec loaded: {self.codec_model}")
+            
+        except Exception as e:
+            print(f"❌ Error loading audio codec: {e}")
+            raise
+    
+    def read_audio(self, file_path: str, seconds: float) -> Tuple[np.ndarray, float, bool]:
+        """
+        Decode at most ``seconds`` of a file as mono float32 at the target sample rate
+        
+        Only the frames needed are read. Formats libsndfile cannot open fall back
+        to librosa's decoder, which also stops after ``seconds``. The frame count
+        of the header or librosa's duration estimate can be too large, so a read
+        that returns fewer frames than requested is taken as the end of the file.
+        
+        Args:
+            file_path: Path to audio file
+            seconds: Seconds to decode from the start of the file; np.inf for all of it
+            
+        Returns:
+            Tuple of (audio_array, duration of the whole file, whether the whole file was read)
+        """
+        with stage("load.decode"):
+            try:
+                with sf.SoundFile(file_path) as f:
+                    source_rate = f.samplerate
+                    total_frames = f.frames
+                    frames = total_frames if np.isinf(seconds) else min(int(np.ceil(seconds * source_rate)), total_frames)
+                    audio = f.read(frames, dtype='float32', always_2d=True)
+            except RuntimeError:
+                duration = None if np.isinf(seconds) else seconds
+                audio, source_rate = librosa.load(file_path, sr=None, mono=False, duration=duration)
+                audio = np.atleast_2d(audio).T
+                total_frames = int(round(librosa.get_duration(path=file_path) * source_rate))
+                frames = total_frames if duration is None else int(duration * source_rate)
+            
+            # A short read, or reading without a limit, reached the end of the file whatever its header says
+            if np.isinf(seconds) or len(audio) < frames:
+                total_frames = len(audio)
+            complete = len(audio) >= total_frames
+            
+            # (frames, channels) is C-ordered, so a single channel reshapes to 1-D without copying
+            if audio.shape[1] == 1:
+                audio = audio.reshape(-1)
+            else:
+                audio = audio.mean(axis=1, dtype=np.float32)
+        
+        if source_rate != self.target_sample_rate:
+            with stage("load.resample"):
+                audio = librosa.resample(
+                    audio,
+                    orig_sr=source_rate,
+                    target_sr=self.target_sample_rate,
+                    res_type=RESAMPLE_QUALITIES[self.resample_quality]
+                ).astype(np.float32, copy=False)
+        
+        return audio, total_frames / source_rate, complete
+    
+    def load_audio_file(self, file_path: str, whole_file: bool = False) -> Tuple[np.ndarray, int]:
         """
         Load and preprocess audio file
         
+        Decodes only the first max_audio_length seconds, plus DECODE_MARGIN for
+        leading silence, then peak-normalizes in place, trims silence and
+        truncates to max_audio_length.
+        
         Args:
             file_path: Path to audio file
+            whole_file: Decode and keep the whole recording instead, for segmentation
             
         Returns:
             Tuple of (audio_array, sample_rate)
         """
         try:
-            # Load audio with librosa (handles various formats)
-            audio_array, sample_rate = librosa.load(
-                file_path, 
-                sr=self.target_sample_rate,
-                mono=True
-            )
+            max_samples = None if whole_file else int(self.max_audio_length * self.target_sample_rate)
+            seconds = np.inf if whole_file else self.max_audio_length + DECODE_MARGIN
             
-            # Normalize audio
-            audio_array = librosa.util.normalize(audio_array)
+            # Every read decodes twice as much as the last; a short read always completes the loop
+            for _ in range(MAX_DECODE_READS):
+                audio_array, source_duration, complete = self.read_audio(file_path, seconds)
+                
+                # Normalize audio in place
+                with stage("load.normalize"):
+                    peak = max(audio_array.max(initial=0.0), -audio_array.min(initial=0.0))
+                    if peak > np.finfo(np.float32).tiny:
+                        audio_array *= 1.0 / peak
+                
+                # Trim silence; the end only counts as silence once the whole file was read
+                with stage("load.trim"):
+                    _, (start, end) = librosa.effects.trim(audio_array, top_db=20)
+                if not complete:
+                    end = len(audio_array)
+                
+                # Leading silence longer than the margin: read further
+                if complete or max_samples is None or end - start >= max_samples:
+                    break
+                seconds *= 2
             
-            # Trim silence
-            audio_array, _ = librosa.effects.trim(audio_array, top_db=20)
+            if max_samples is None:
+                return audio_array[start:end], self.target_sample_rate
             
-            return audio_array, sample_rate
+            if end - start > max_samples or not complete:
+                print(f"⚠️  Audio too long ({source_duration:.1f}s), truncating to {self.max_audio_length}s")
+            
+            return audio_array[start:min(end, start + max_samples)], self.target_sample_rate
             
         except Exception as e:
             print(f"❌ Error loading audio file {file_path}: {e}")
             return None, None
     
-    def extract_audio_features(self, audio_array: np.ndarray, sample_rate: int) -> Dict[str, Any]:
+    def extract_audio_features(self, audio_array: np.ndarray, sample_rate: int,
+                               engine: Optional[FeatureEngine] = None) -> Dict[str, Any]:
         """
         Extract comprehensive audio features
         
         Args:
             audio_array: Audio data as numpy array
             sample_rate: Sample rate of audio
+            engine: FeatureEngine for this clip, to share its spectrograms with other stages
             
         Returns:
             Dictionary of extracted features
@@ -133,34 +898,9 @@ class AudioPreprocessingPipeline:
         features = {}
         
         try:
-            # Basic features
-            features['duration'] = len(audio_array) / sample_rate
-            features['sample_rate'] = sample_rate
-            
-            # Spectral features
-            stft = librosa.stft(audio_array)
-            features['spectral_centroid'] = np.mean(librosa.feature.spectral_centroid(S=stft))
-            features['spectral_bandwidth'] = np.mean(librosa.feature.spectral_bandwidth(S=stft))
-            features['spectral_rolloff'] = np.mean(librosa.feature.spectral_rolloff(S=stft))
-            
-            # MFCC features
-            mfccs = librosa.feature.mfcc(y=audio_array, sr=sample_rate, n_mfcc=13)
-            features['mfcc_mean'] = np.mean(mfccs, axis=1).tolist()
-            features['mfcc_std'] = np.std(mfccs, axis=1).tolist()
-            
-            # Tempo and rhythm
-            tempo, _ = librosa.beat.beat_track(y=audio_array, sr=sample_rate)
-            features['tempo'] = tempo
-            
-            # Harmonic features
-            harmonic, percussive = librosa.effects.hpss(audio_array)
-            features['harmonic_ratio'] = np.mean(np.abs(harmonic)) / (np.mean(np.abs(harmonic)) + np.mean(np.abs(percussive)))
-            
-            # Zero crossing rate
-            features['zero_crossing_rate'] = np.mean(librosa.feature.zero_crossing_rate(audio_array))
-            
-            # RMS energy
-            features['rms_energy'] = np.mean(librosa.feature.rms(y=audio_array))
+            # One STFT and mel spectrogram feed every spectral, MFCC, rhythm and HPSS feature
+            engine = engine or FeatureEngine(audio_array, sample_rate)
+            features = engine.features()
             
         except Exception as e:
             print(f"❌ Error extracting features: {e}")
@@ -173,36 +913,53 @@ class AudioPreprocessingPipeline:
         Prepare features specifically for MusicGen model
         
         Args:
-            audio_array: Audio data as numpy array
+            audio_array: Audio data as numpy array (only the text prompt ends up in the stored features)
             text: Text prompt describing the audio
             
         Returns:
             Dictionary with MusicGen-compatible features
         """
+        return self.prepare_musicgen_features_batch([text])[0]
+    
+    def prepare_musicgen_features_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """
+        Tokenize a batch of text prompts for MusicGen in one processor call
+        
+        Prompts are padded to the longest in the batch and the padding is removed
+        again per item, so each result matches tokenizing its prompt on its own.
+        
+        Args:
+            texts: Text prompts describing the audio
+            
+        Returns:
+            One dictionary of MusicGen-compatible features per prompt
+        """
         if self.musicgen_processor is None:
             raise ValueError("MusicGen processor not loaded. Call load_processors() first.")
         
         try:
             # Process with MusicGen processor
-            inputs = self.musicgen_processor(
-                text=[text],
-                audio=audio_array,
-                sampling_rate=self.target_sample_rate,
-                return_tensors="pt"
-            )
-            
-            # Convert to numpy for storage
-            processed_features = {
-                'input_ids': inputs['input_ids'].numpy().tolist(),
-                'attention_mask': inputs['attention_mask'].numpy().tolist(),
-                'labels': inputs['labels'].numpy().tolist() if 'labels' in inputs else None
-            }
+            with stage("musicgen.tokenize"):
+                inputs = self.musicgen_processor(
+                    text=texts,
+                    padding=True,
+                    return_tensors="np"
+                )
+            
+            # Compact typed arrays for storage, one per prompt without its padding
+            processed_features = []
+            for input_ids, attention_mask in zip(np.asarray(inputs['input_ids']), np.asarray(inputs['attention_mask'])):
+                tokens = attention_mask.astype(bool)
+                processed_features.append({
+                    'input_ids': input_ids[tokens].astype(np.int32),
+                    'attention_mask': attention_mask[tokens].astype(np.int8)
+                })
             
             return processed_features
             
         except Exception as e:
             print(f"❌ Error preparing MusicGen features: {e}")
-            return {}
+            return [{} for _ in texts]
     
     def prepare_whisper_features(self, audio_array: np.ndarray) -> Dict[str, Any]:
         """
@@ -214,35 +971,165 @@ class AudioPreprocessingPipeline:
         Returns:
             Dictionary with Whisper-compatible features
         """
+        return self.prepare_whisper_features_batch([audio_array])[0]
+    
+    def prepare_whisper_features_batch(self, audio_arrays: List[np.ndarray]) -> List[Dict[str, Any]]:
+        """
+        Whisper log-mel features for a batch of clips in one feature extractor call
+        
+        Clips are resampled to Whisper's 16 kHz. Clips of equal length share a
+        call, so no padding is added and each result matches extracting its
+        clip on its own.
+        
+        Args:
+            audio_arrays: Audio data as numpy arrays at the target sample rate
+            
+        Returns:
+            One dictionary of Whisper-compatible features per clip
+        """
         if self.whisper_feature_extractor is None:
             raise ValueError("Whisper feature extractor not loaded. Call load_processors() first.")
         
         try:
-            # Process with Whisper feature extractor
-            features = self.whisper_feature_extractor(
-                audio_array, 
-                sampling_rate=self.target_sample_rate, 
-                padding=True
-            )
-            
-            return {
-                'input_features': features['input_features']
-            }
+            if self.target_sample_rate != WHISPER_SAMPLE_RATE:
+                with stage("whisper.resample"):
+                    audio_arrays = [
+                        librosa.resample(
+                            audio_array,
+                            orig_sr=self.target_sample_rate,
+                            target_sr=WHISPER_SAMPLE_RATE,
+                            res_type=RESAMPLE_QUALITIES[self.resample_quality]
+                        )
+                        for audio_array in audio_arrays
+                    ]
+            
+            # Padding would change the last frames of shorter clips, so only equal lengths are batched
+            by_length = {}
+            for index, audio_array in enumerate(audio_arrays):
+                by_length.setdefault(len(audio_array), []).append(index)
+            
+            processed_features = [None] * len(audio_arrays)
+            for indices in by_length.values():
+                # Process with Whisper feature extractor
+                with stage("whisper.extract"):
+                    features = self.whisper_feature_extractor(
+                        [audio_arrays[index] for index in indices],
+                        sampling_rate=WHISPER_SAMPLE_RATE,
+                        padding=True
+                    )
+                
+                # Frames-major so the variable dimension comes first (see dataset_features)
+                for index, input_features in zip(indices, features['input_features']):
+                    processed_features[index] = {
+                        'input_features': np.ascontiguousarray(np.asarray(input_features, dtype=np.float32).T)
+                    }
+            
+            return processed_features
             
         except Exception as e:
             print(f"❌ Error preparing Whisper features: {e}")
-            return {}
+            return [{} for _ in audio_arrays]
     
-    def process_single_audio(self, audio_file: str, metadata: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    def encode_audio_codes_batch(self, audio_arrays: List[np.ndarray]) -> List[np.ndarray]:
         """
-        Process a single audio file with its metadata
+        EnCodec tokens for a batch of clips, the targets MusicGen is trained to predict
+        
+        Clips are resampled to the codec's sample rate if needed. As with the
+        Whisper features, only clips of equal length share a call, so each
+        result matches encoding its clip on its own.
+        
+        Args:
+            audio_arrays: Float audio data as numpy arrays at the target sample rate
+            
+        Returns:
+            One int16 array of shape (frames, codebooks) per clip
+        """
+        if self.audio_codec is None:
+            raise ValueError("Audio codec not loaded. Call load_audio_codec() first.")
+        
+        import torch
+        
+        codec_rate = self.audio_codec.config.sampling_rate
+        if codec_rate != self.target_sample_rate:
+            audio_arrays = [
+                librosa.resample(
+                    audio_array,
+                    orig_sr=self.target_sample_rate,
+                    target_sr=codec_rate,
+                    res_type=RESAMPLE_QUALITIES[self.resample_quality]
+                )
+                for audio_array in audio_arrays
+            ]
+        
+        by_length = {}
+        for index, audio_array in enumerate(audio_arrays):
+            by_length.setdefault(len(audio_array), []).append(index)
+        
+        audio_codes = [None] * len(audio_arrays)
+        for indices in by_length.values():
+            # (batch, channels=1, samples)
+            input_values = torch.from_numpy(np.stack([audio_arrays[index] for index in indices]).astype(np.float32))[:, None]
+            with torch.inference_mode():
+                encoded = self.audio_codec.encode(input_values, bandwidth=self.audio_codec.config.target_bandwidths[-1])
+            
+            # (chunks, batch, codebooks, frames); MusicGen's codec encodes a clip as a single chunk
+            for index, codes in zip(indices, encoded.audio_codes[0].numpy()):
+                audio_codes[index] = np.ascontiguousarray(codes.T.astype(np.int16))
+        
+        return audio_codes
+    
+    def segment_audio(self, audio_array: np.ndarray, sample_rate: int) -> List[Tuple[int, np.ndarray]]:
+        """
+        Split a recording into max_audio_length windows every window_hop seconds (default: no overlap)
+        
+        Windows are views of ``audio_array``, not copies. A recording no longer
+        than one window is returned whole. If the last window leaves at least
+        half a window uncovered, a final window is aligned to the end of the
+        recording. Windows with more than max_silent_fraction of silent frames
+        are dropped.
+        
+        Args:
+            audio_array: Whole preprocessed recording
+            sample_rate: Sample rate of audio
+            
+        Returns:
+            List of (start sample, window) tuples
+        """
+        window = int(self.max_audio_length * sample_rate)
+        if len(audio_array) <= window:
+            return [(0, audio_array)]
+        
+        hop = max(1, int((self.window_hop or self.max_audio_length) * sample_rate))
+        starts = list(range(0, len(audio_array) - window + 1, hop))
+        if len(audio_array) - (starts[-1] + window) >= window // 2:
+            starts.append(len(audio_array) - window)
+        
+        if self.max_silent_fraction < 1.0:
+            # Silent frames are found once for the whole recording and shared by every window
+            hop_length = 512
+            rms = librosa.feature.rms(y=audio_array, hop_length=hop_length)[0]
+            silent = librosa.amplitude_to_db(rms, ref=np.max) < -SILENCE_TOP_DB
+            starts = [
+                start for start in starts
+                if silent[start // hop_length:(start + window) // hop_length].mean() <= self.max_silent_fraction
+            ]
+        
+        return [(start, audio_array[start:start + window]) for start in starts]
+    
+    def analyze_audio(self, audio_file: str, metadata: Dict[str, Any]) -> Optional[List[Tuple[Dict[str, Any], np.ndarray]]]:
+        """
+        Load and segment one audio file and extract its librosa features
+        
+        The MusicGen and Whisper features are left empty for add_model_features,
+        which runs the processors on many rows at once. Rows only hold the
+        columns of the selected stages.
         
         Args:
             audio_file: Path to audio file
             metadata: Metadata for the audio file
             
         Returns:
-            Processed data dictionary or None if failed
+            List of (row, float waveform of the row) tuples, one per segment, or None if failed
         """
         audio_path = self.audio_dir / audio_file
         
@@ -250,42 +1137,207 @@ class AudioPreprocessingPipeline:
             print(f"❌ Audio file not found: {audio_path}")
             return None
         
-        print(f"🔄 Processing: {audio_file}")
+        if self.verbose:
+            print(f"🔄 Processing: {audio_file}")
         
-        # Load audio
-        audio_array, sample_rate = self.load_audio_file(str(audio_path))
+        # Load audio; segmentation decodes the whole recording once and slices it
+        audio_array, sample_rate = self.load_audio_file(str(audio_path), whole_file=self.segment)
         if audio_array is None:
             return None
         
-        # Check duration
-        duration = len(audio_array) / sample_rate
-        if duration > self.max_audio_length:
-            print(f"⚠️  Audio too long ({duration:.1f}s), truncating to {self.max_audio_length}s")
-            max_samples = int(self.max_audio_length * sample_rate)
-            audio_array = audio_array[:max_samples]
+        with stage("segment"):
+            segments = self.segment_audio(audio_array, sample_rate) if self.segment else [(0, audio_array)]
+        if len(segments) > 1:
+            print(f"✂️  {audio_file}: {len(segments)} windows of {self.max_audio_length}s")
         
-        # Extract features
-        audio_features = self.extract_audio_features(audio_array, sample_rate)
-        musicgen_features = self.prepare_musicgen_features(audio_array, metadata['text'])
-        whisper_features = self.prepare_whisper_features(audio_array)
+        analyzed = []
+        for segment_index, (start, segment) in enumerate(segments):
+            # Combine all data; every segment inherits the metadata of its recording
+            row = {
+                'audio_file': audio_file,
+                'segment_index': segment_index,
+                'segment_start': start / sample_rate,
+                'text': metadata['text'],
+                'style': metadata.get('style', 'unknown'),
+                'duration': str(metadata.get('duration', 'unknown')),
+                'emotion': metadata.get('emotion', 'unknown'),
+                'instruments': metadata.get('instruments', []),
+                'therapeutic_benefit': metadata.get('therapeutic_benefit', ''),
+                'sample_rate': sample_rate
+            }
+            
+            # Extract features
+            if 'features' in self.stages:
+                row['audio_features'] = self.extract_audio_features(segment, sample_rate)
+            if 'musicgen' in self.stages:
+                row['musicgen_features'] = {}
+            if 'whisper' in self.stages:
+                row['whisper_features'] = {}
+            if 'audio' in self.stages:
+                with stage("encode"):
+                    row['processed_audio'] = encode_audio(segment, self.audio_dtype)
+            
+            analyzed.append((row, segment))
         
-        # Combine all data
-        processed_data = {
-            'audio_file': audio_file,
-            'text': metadata['text'],
-            'style': metadata.get('style', 'unknown'),
-            'duration': metadata.get('duration', 'unknown'),
-            'emotion': metadata.get('emotion', 'unknown'),
-            'instruments': metadata.get('instruments', []),
-            'therapeutic_benefit': metadata.get('therapeutic_benefit', ''),
-            'audio_features': audio_features,
-            'musicgen_features': musicgen_features,
-            'whisper_features': whisper_features,
-            'processed_audio': audio_array.tolist(),
-            'sample_rate': sample_rate
-        }
+        return analyzed
+    
+    def add_model_features(self, analyzed: List[Tuple[Dict[str, Any], np.ndarray]],
+                           records: Optional[List[Optional[Dict[str, Any]]]] = None):
+        """
+        Fill in the MusicGen and Whisper features of rows from analyze_audio
+        
+        The processors are called once per ``batch_size`` rows instead of once per row.
+        
+        Args:
+            analyzed: (row, waveform) tuples; the rows are updated in place
+            records: Profiling record of each row's file, to share the batch timings between them
+        """
+        records = records or [None] * len(analyzed)
+        for start in range(0, len(analyzed), self.batch_size):
+            batch = analyzed[start:start + self.batch_size]
+            with self.profiler.batch(records[start:start + self.batch_size]):
+                if 'musicgen' in self.stages:
+                    for (row, _), musicgen in zip(batch, self.prepare_musicgen_features_batch([row['text'] for row, _ in batch])):
+                        row['musicgen_features'] = musicgen
+                if 'whisper' in self.stages:
+                    for (row, _), whisper in zip(batch, self.prepare_whisper_features_batch([segment for _, segment in batch])):
+                        row['whisper_features'] = whisper
+    
+    def process_single_audio(self, audio_file: str, metadata: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Process a single audio file with its metadata
+        
+        Args:
+            audio_file: Path to audio file
+            metadata: Metadata for the audio file
+            
+        Returns:
+            Processed rows, one per segment (a single row unless segmenting), or None if failed
+        """
+        analyzed = self.analyze_audio(audio_file, metadata)
+        if analyzed is None:
+            return None
+        
+        self.add_model_features(analyzed)
+        return [row for row, _ in analyzed]
+    
+    def process_entries(self, entries: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[Optional[List[Dict[str, Any]]], Optional[str]]]:
+        """
+        Process metadata entries without letting a bad file abort the run
+        
+        Each file is analyzed on its own; the processors then run in batches
+        over the rows of all files that succeeded.
+        
+        Returns:
+            One tuple of (processed rows or None, error message or None) per entry
+        """
+        processors_missing = (('musicgen' in self.stages and self.musicgen_processor is None) or
+                              ('whisper' in self.stages and self.whisper_feature_extractor is None))
+        if entries and processors_missing:
+            self.load_processors()
+        
+        results = []
+        analyzed = []
+        records = []
+        for audio_file, metadata in entries:
+            try:
+                with self.profiler.file(audio_file) as record:
+                    file_rows = self.analyze_audio(audio_file, metadata)
+            except Exception as e:
+                print(f"❌ Error processing {audio_file}: {e}")
+                results.append((None, str(e)))
+                continue
+            
+            if file_rows is None:
+                results.append((None, "audio file missing or could not be loaded"))
+            elif not file_rows:
+                results.append((None, "every window was mostly silent"))
+            else:
+                results.append(([row for row, _ in file_rows], None))
+                analyzed.extend(file_rows)
+                records.extend([record] * len(file_rows))
+        
+        # The rows in ``results`` are the same objects, so this completes them
+        self.add_model_features(analyzed, records)
+        return results
+    
+    def process_entry(self, audio_file: str, metadata: Dict[str, Any]) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+        """
+        Process one metadata entry without letting a bad file abort the run
+        
+        Returns:
+            Tuple of (processed rows or None, error message or None)
+        """
+        return self.process_entries([(audio_file, metadata)])[0]
+    
+    def iter_processed(self, entries: List[Tuple[str, Dict[str, Any]]]) -> Iterator[Tuple[str, Optional[List[Dict[str, Any]]], Optional[str]]]:
+        """
+        Process (audio_file, metadata) entries, serially or in a process pool
+        
+        Entries are processed in chunks of up to ``batch_size`` files so the
+        processors can batch their rows. Workers finish in any order, but results
+        are yielded in the order of ``entries`` so the dataset is identical for
+        any number of workers.
+        
+        Yields:
+            Tuples of (audio_file, processed rows or None, error message or None)
+        """
+        if not entries:
+            return
+        
+        progress = tqdm(total=len(entries), desc="Processing audio files")
+        
+        if self.num_workers == 1:
+            self.load_processors()
+            for start in range(0, len(entries), self.batch_size):
+                chunk = entries[start:start + self.batch_size]
+                results = self.process_entries(chunk)
+                progress.update(len(chunk))
+                for (audio_file, _), (processed_rows, error) in zip(chunk, results):
+                    yield audio_file, processed_rows, error
+            progress.close()
+            return
         
-        return processed_data
+        # Smaller chunks when there are too few entries to give every worker a full one
+        chunk_size = max(1, min(self.batch_size, -(-len(entries) // self.num_workers)))
+        chunks = [entries[start:start + chunk_size] for start in range(0, len(entries), chunk_size)]
+        
+        # Keep a couple of chunks queued per worker; finished results wait in ``done`` until their turn and
+        # count against the same window, so a slow chunk holds back new submissions instead of piling up results
+        max_in_flight = self.num_workers * 2
+        with ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            initializer=_init_worker,
+            initargs=(self.config(),)
+        ) as executor:
+            in_flight = {}
+            done = {}
+            next_submit = 0
+            next_yield = 0
+            
+            while next_yield < len(chunks):
+                while next_submit < len(chunks) and len(in_flight) + len(done) < max_in_flight:
+                    in_flight[executor.submit(_process_in_worker, chunks[next_submit])] = next_submit
+                    next_submit += 1
+                
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    index = in_flight.pop(future)
+                    try:
+                        done[index], records = future.result()
+                        self.profiler.records.extend(records)
+                    except Exception as e:
+                        # The worker itself failed (e.g. crashed while decoding)
+                        print(f"❌ Worker failed on {', '.join(audio_file for audio_file, _ in chunks[index])}: {e}")
+                        done[index] = [(None, str(e))] * len(chunks[index])
+                    progress.update(len(chunks[index]))
+                
+                while next_yield in done:
+                    for (audio_file, _), (processed_rows, error) in zip(chunks[next_yield], done.pop(next_yield)):
+                        yield audio_file, processed_rows, error
+                    next_yield += 1
+        
+        progress.close()
     
     def process_dataset(self) -> Dataset:
         """
@@ -305,42 +1357,276 @@ class AudioPreprocessingPipeline:
         
         print(f"📊 Found {len(metadata_list)} audio files to process")
         
-        # Load processors
-        self.load_processors()
+        entries = [(metadata['audio_file'], metadata) for metadata in metadata_list if metadata.get('audio_file')]
         
-        # Process each audio file
-        processed_data = []
+        # Reuse items whose file, metadata and settings are unchanged since an earlier (possibly interrupted) run;
+        # the keys also make up the dataset content hash, so they are computed even without the cache
+        cache = ProcessingCache(self.output_dir / "cache") if self.use_cache else None
+        keys = [self.fingerprint(audio_file, metadata) for audio_file, metadata in entries]
+        cached = [cache is not None and key is not None and cache.contains(key) for key in keys]
+        if cache:
+            print(f"💾 Cache: {sum(cached)} unchanged, {len(entries) - sum(cached)} to process")
         
-        for metadata in tqdm(metadata_list, desc="Processing audio files"):
-            audio_file = metadata.get('audio_file', '')
-            if not audio_file:
-                continue
-            
-            processed_item = self.process_single_audio(audio_file, metadata)
-            if processed_item:
-                processed_data.append(processed_item)
+        # Rows are streamed from the cache and workers straight into dataset shards
+        failures = []
+        content_hash = hashlib.sha256()
+        rows = self._iter_rows(entries, keys, cached, cache, failures, content_hash)
+        dataset_path = self.output_dir / "processed_dataset"
+        dataset = self.write_dataset(rows, dataset_path)
         
-        print(f"✅ Successfully processed {len(processed_data)} audio files")
+        if cache:
+            removed = cache.prune({key for key in keys if key is not None})
+            if removed:
+                print(f"🧹 Removed {removed} stale cache entries")
         
-        # Create HuggingFace Dataset
-        dataset = Dataset.from_list(processed_data)
+        if self.profiler.enabled:
+            # Files served from the cache were not processed, so they have no timings
+            self.profile_report = self.profiler.report(slowest=self.profile_slowest)
+            with open(self.output_dir / "profile_report.json", 'w') as f:
+                json.dump(self.profile_report, f, indent=2)
+            print(f"⏱️  Stage timings of {self.profile_report['files']} files saved to {self.output_dir / 'profile_report.json'}")
         
-        # Save processed dataset
-        dataset.save_to_disk(str(self.output_dir / "processed_dataset"))
+        processed_files = len(entries) - len(failures)
+        print(f"✅ Successfully processed {processed_files} audio files ({len(dataset)} rows)")
+        if failures:
+            print(f"⚠️  {len(failures)} files failed")
         
         # Save metadata
         with open(self.output_dir / "processing_metadata.json", 'w') as f:
             json.dump({
                 'total_files': len(metadata_list),
-                'processed_files': len(processed_data),
-                'failed_files': len(metadata_list) - len(processed_data),
+                'processed_files': processed_files,
+                'failed_files': len(metadata_list) - processed_files,
+                'rows': len(dataset),
+                'failures': failures,
+                'cache': {
+                    'enabled': cache is not None,
+                    'hits': cache.hits if cache else 0,
+                    'misses': len(entries) - cache.hits if cache else len(entries)
+                },
+                'num_workers': self.num_workers,
+                'shards': len(dataset.cache_files),
+                # Identifies the rows, so tokenize_audio can reuse codes of an identical rerun
+                'content_hash': content_hash.hexdigest()[:16],
                 'target_sample_rate': self.target_sample_rate,
                 'max_audio_length': self.max_audio_length,
-                'model_name': self.model_name
+                'model_name': self.model_name,
+                'audio_dtype': self.audio_dtype,
+                'stages': list(self.stages),
+                'segment': self.segment,
+                'window_hop': self.window_hop,
+                'max_silent_fraction': self.max_silent_fraction
             }, f, indent=2)
         
         return dataset
     
+    def _iter_rows(self, entries: List[Tuple[str, Dict[str, Any]]], keys: List[Optional[str]],
+                   cached: List[bool], cache: Optional[ProcessingCache],
+                   failures: List[Dict[str, Any]], content_hash: Optional[Any] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Processed rows in metadata order, from the cache or freshly processed
+        
+        Failures are appended to ``failures``, and the key of every file that
+        produced rows is fed to ``content_hash``.
+        """
+        pending = self.iter_processed([entry for entry, hit in zip(entries, cached) if not hit])
+        
+        for (audio_file, metadata), key, hit in zip(entries, keys, cached):
+            processed_rows = cache.get(key) if hit else None
+            if processed_rows is None:
+                if hit:
+                    # The entry vanished or was unreadable; process the file now
+                    processed_rows, error = self.process_entry(audio_file, metadata)
+                else:
+                    _, processed_rows, error = next(pending)
+                
+                if processed_rows and cache is not None and key is not None:
+                    # Stored immediately so an interrupted run resumes from here
+                    cache.put(key, processed_rows)
+            
+            if processed_rows:
+                if content_hash is not None:
+                    content_hash.update(f"{key}\n".encode())
+                yield from processed_rows
+            else:
+                failures.append({'audio_file': audio_file, 'error': error})
+    
+    def write_dataset(self, rows: Iterator[Dict[str, Any]], dataset_path: Path) -> Dataset:
+        """
+        Write rows to a dataset on disk without holding more than a batch in memory
+        
+        Rows are appended to Arrow shards of ``shard_size`` rows under
+        ``output_dir/shards`` and flushed every ``writer_batch_size`` rows. The
+        shards are then saved as a regular save_to_disk dataset.
+        
+        Args:
+            rows: Processed items in dataset order
+            dataset_path: Directory to save the dataset to
+            
+        Returns:
+            Memory-mapped dataset loaded from ``dataset_path``
+        """
+        from datasets import Dataset, concatenate_datasets, load_from_disk
+        from datasets.arrow_writer import ArrowWriter
+        
+        features = dataset_features(self.audio_dtype, self.stages)
+        shard_dir = self.output_dir / "shards"
+        shutil.rmtree(shard_dir, ignore_errors=True)
+        shard_dir.mkdir(parents=True)
+        
+        shard_paths = []
+        writer = None
+        rows_in_shard = 0
+        
+        for row in rows:
+            if writer is None or rows_in_shard >= self.shard_size:
+                if writer is not None:
+                    writer.finalize()
+                    writer.close()
+                shard_paths.append(str(shard_dir / f"shard-{len(shard_paths):05d}.arrow"))
+                writer = ArrowWriter(features=features, path=shard_paths[-1], writer_batch_size=self.writer_batch_size)
+                rows_in_shard = 0
+            
+            writer.write(features.encode_example(row))
+            rows_in_shard += 1
+        
+        if writer is not None:
+            writer.finalize()
+            writer.close()
+        
+        # The shards are memory-mapped, so saving streams them rather than loading them
+        if shard_paths:
+            shards = concatenate_datasets([Dataset.from_file(path) for path in shard_paths])
+        else:
+            shards = Dataset.from_list([], features=features)
+        shards.save_to_disk(str(dataset_path), num_shards=max(1, len(shard_paths)))
+        del shards
+        shutil.rmtree(shard_dir)
+        
+        return load_from_disk(str(dataset_path))
+    
+    def recorded_content_hash(self) -> str:
+        """Content hash of the dataset last written by process_dataset to ``output_dir``"""
+        metadata_path = self.output_dir / "processing_metadata.json"
+        try:
+            with open(metadata_path) as f:
+                return json.load(f)['content_hash']
+        except (FileNotFoundError, KeyError):
+            raise ValueError(f"No content hash in {metadata_path}; run process_dataset first "
+                             f"or pass content_hash to tokenize_audio")
+    
+    def write_codes_shard(self, shard: Dataset, path: Path) -> int:
+        """
+        Encode the processed audio of one dataset shard and write its codes to an Arrow file
+        
+        The file is written under a temporary name and renamed once complete, so
+        an interrupted shard is never mistaken for a finished one.
+        
+        Returns:
+            Number of rows encoded
+        """
+        from datasets.arrow_writer import ArrowWriter
+        
+        if self.audio_codec is None:
+            self.load_audio_codec()
+        
+        features = audio_codes_features(self.audio_codec.config.num_quantizers)
+        tmp_path = Path(path).with_suffix('.tmp')
+        writer = ArrowWriter(features=features, path=str(tmp_path), writer_batch_size=self.writer_batch_size)
+        
+        # Only the audio column is read, as NumPy views of the memory-mapped dataset
+        audio = shard.select_columns(['processed_audio']).with_format("numpy", dtype=None)
+        for batch in audio.iter(batch_size=self.batch_size):
+            for codes in self.encode_audio_codes_batch([decode_audio(clip) for clip in batch['processed_audio']]):
+                writer.write(features.encode_example({'audio_codes': codes}))
+        
+        writer.finalize()
+        writer.close()
+        os.replace(tmp_path, path)
+        return len(shard)
+    
+    def tokenize_audio(self, dataset: Dataset, num_shards: Optional[int] = None,
+                       shard_index: Optional[int] = None, content_hash: Optional[str] = None) -> Dataset:
+        """
+        Precompute MusicGen's EnCodec tokens for every row, so training never encodes audio
+        
+        The dataset is cut into ``num_shards`` contiguous shards, each encoded
+        on CPU in batches of ``batch_size`` clips and stored as an Arrow file
+        under ``output_dir/audio_codes/<key>``. The key covers the content hash
+        of the dataset and the codec, so rerunning on an unchanged dataset reuses
+        every finished shard. Missing shards are encoded in a process pool when
+        num_workers > 1. With ``shard_index`` only that shard is encoded, so
+        separate processes or machines can split the work; a final call without
+        it encodes whatever is still missing and assembles the result.
+        
+        Args:
+            dataset: Processed dataset
+            num_shards: Number of shards (default: one per worker)
+            shard_index: Encode only this shard
+            content_hash: Content hash of ``dataset`` (default: the one process_dataset
+                recorded in processing_metadata.json)
+            
+        Returns:
+            ``dataset`` with an int16 ``audio_codes`` column of shape (frames, codebooks),
+            or only the codes of ``shard_index``
+        """
+        from datasets import Dataset, concatenate_datasets
+        
+        if 'audio' not in self.stages:
+            raise ValueError("tokenize_audio needs the 'audio' stage, which stores the waveforms it encodes")
+        num_shards = max(1, num_shards or self.num_workers)
+        if shard_index is not None and not 0 <= shard_index < num_shards:
+            raise ValueError(f"shard_index must be in [0, {num_shards}), got {shard_index}")
+        
+        if content_hash is None:
+            content_hash = self.recorded_content_hash()
+        key = hashlib.sha256(f"{content_hash}:{self.codec_model}".encode()).hexdigest()[:16]
+        codes_root = self.output_dir / "audio_codes"
+        codes_dir = codes_root / key
+        codes_dir.mkdir(parents=True, exist_ok=True)
+        
+        paths = [codes_dir / f"codes-{index:05d}-of-{num_shards:05d}.arrow" for index in range(num_shards)]
+        indices = list(range(num_shards)) if shard_index is None else [shard_index]
+        missing = [index for index in indices if not paths[index].exists()]
+        print(f"🎼 Audio codes: {len(indices) - len(missing)} of {len(indices)} shards already encoded")
+        
+        def shard(index: int) -> Dataset:
+            return dataset.shard(num_shards, index, contiguous=True)
+        
+        if self.num_workers == 1 or len(missing) <= 1:
+            for index in tqdm(missing, desc="Encoding audio codes"):
+                self.write_codes_shard(shard(index), paths[index])
+        else:
+            # Shards of a memory-mapped dataset are pickled as references to its files, not as data
+            with ProcessPoolExecutor(
+                max_workers=min(self.num_workers, len(missing)),
+                initializer=_init_codec_worker,
+                initargs=(self.config(),)
+            ) as executor:
+                futures = [executor.submit(_encode_codes_in_worker, shard(index), paths[index]) for index in missing]
+                for future in tqdm(as_completed(futures), total=len(futures), desc="Encoding audio codes"):
+                    future.result()
+        
+        codes = concatenate_datasets([Dataset.from_file(str(paths[index])) for index in indices])
+        if shard_index is not None:
+            return codes
+        
+        # Codes of earlier versions of the dataset, or of another shard count, are no longer reachable
+        for stale_dir in codes_root.iterdir():
+            if stale_dir != codes_dir:
+                shutil.rmtree(stale_dir)
+        names = {path.name for path in paths}
+        for stale_file in codes_dir.glob("codes-*"):
+            if stale_file.name not in names:
+                stale_file.unlink()
+        
+        if len(codes) != len(dataset):
+            raise ValueError(f"Audio codes have {len(codes)} rows but the dataset has {len(dataset)}")
+        print(f"✅ Audio codes ready for {len(codes)} rows in {codes_dir}")
+        
+        # Joined column-wise without copying; both stay memory-mapped
+        return concatenate_datasets([dataset, codes], axis=1)
+    
     def create_train_val_split(self, dataset: Dataset, val_split: float = 0.2) -> DatasetDict:
         """
         Create train/validation split
@@ -352,6 +1638,8 @@ class AudioPreprocessingPipeline:
         Returns:
             DatasetDict with train and validation splits
         """
+        from datasets import DatasetDict
+        
         print(f"📊 Creating train/validation split (val_split={val_split})")
         
         # Shuffle dataset
@@ -374,58 +1662,71 @@ class AudioPreprocessingPipeline:
         
         return dataset_dict
     
-    def visualize_features(self, dataset: Dataset, num_samples: int = 5):
+    def export_audio_store(self, dataset: Dataset) -> Path:
+        """
+        Export every processed waveform to a memory-mapped audio store
+        
+        The store holds all clips contiguously in the dataset's audio dtype with
+        an index keyed by audio_file; open it with audio_store.AudioStore.
+        
+        Args:
+            dataset: Processed dataset
+            
+        Returns:
+            Path of the store directory
+        """
+        if 'audio' not in self.stages:
+            raise ValueError("export_audio_store needs the 'audio' stage, which stores the waveforms")
+        store_path = self.output_dir / "audio_store"
+        print(f"💽 Exporting audio store to {store_path}...")
+        
+        scale = INT16_SCALE if self.audio_dtype == "int16" else 1.0
+        index = write_audio_store(dataset, str(store_path), scale=scale)
+        
+        size_mb = index['total_samples'] * np.dtype(index['dtype']).itemsize / 2**20
+        print(f"✅ Exported {len(index['clips'])} clips ({size_mb:.1f} MB of {index['dtype']} audio)")
+        
+        return store_path
+    
+    def visualize_features(self, dataset: Dataset, num_samples: Optional[int] = 5,
+                           num_workers: Optional[int] = None, dpi: int = 100):
         """
         Visualize extracted features for quality control
         
+        Waveforms are reduced to min/max envelopes at the figure's resolution
+        and the spectrogram panel reuses the stored Whisper log-mel features,
+        so a figure costs about the same for any clip length. Figures are
+        rendered in a process pool when more than one worker is used.
+        
         Args:
             dataset: Processed dataset
-            num_samples: Number of samples to visualize
+            num_samples: Number of samples to visualize; None for all of them
+            num_workers: Rendering processes (default: num_workers of the pipeline)
+            dpi: Resolution of the saved figures
         """
-        print(f"📊 Visualizing features for {num_samples} samples...")
+        if not {'audio', 'features'} <= set(self.stages):
+            raise ValueError("visualize_features needs the 'audio' and 'features' stages")
+        count = len(dataset) if num_samples is None else min(num_samples, len(dataset))
+        print(f"📊 Visualizing features for {count} samples...")
         
         # Create visualization directory
         viz_dir = self.output_dir / "visualizations"
         viz_dir.mkdir(exist_ok=True)
         
-        for i in range(min(num_samples, len(dataset))):
-            sample = dataset[i]
-            
-            # Create figure with subplots
-            fig, axes = plt.subplots(2, 2, figsize=(15, 10))
-            fig.suptitle(f'Sample {i+1}: {sample["audio_file"]}', fontsize=16)
-            
-            # Plot 1: Waveform
-            audio_array = np.array(sample['processed_audio'])
-            axes[0, 0].plot(audio_array)
-            axes[0, 0].set_title('Waveform')
-            axes[0, 0].set_xlabel('Samples')
-            axes[0, 0].set_ylabel('Amplitude')
-            
-            # Plot 2: Spectrogram
-            D = librosa.amplitude_to_db(np.abs(librosa.stft(audio_array)), ref=np.max)
-            librosa.display.specshow(D, sr=sample['sample_rate'], x_axis='time', y_axis='log', ax=axes[0, 1])
-            axes[0, 1].set_title('Spectrogram')
-            
-            # Plot 3: MFCC
-            mfccs = np.array(sample['audio_features']['mfcc_mean'])
-            axes[1, 0].bar(range(len(mfccs)), mfccs)
-            axes[1, 0].set_title('MFCC Features (Mean)')
-            axes[1, 0].set_xlabel('MFCC Coefficient')
-            axes[1, 0].set_ylabel('Value')
-            
-            # Plot 4: Feature summary
-            features = sample['audio_features']
-            feature_names = ['tempo', 'harmonic_ratio', 'zero_crossing_rate', 'rms_energy']
-            feature_values = [features.get(name, 0) for name in feature_names]
-            
-            axes[1, 1].bar(feature_names, feature_values)
-            axes[1, 1].set_title('Audio Features Summary')
-            axes[1, 1].tick_params(axis='x', rotation=45)
-            
-            plt.tight_layout()
-            plt.savefig(viz_dir / f'sample_{i+1}_features.png', dpi=300, bbox_inches='tight')
-            plt.close()
+        indices = list(range(count))
+        chunks = [indices[start:start + VIZ_CHUNK_SIZE] for start in range(0, count, VIZ_CHUNK_SIZE)]
+        num_workers = min(num_workers or self.num_workers, len(chunks))
+        
+        with tqdm(total=count, desc="Rendering visualizations") as progress:
+            if num_workers <= 1:
+                for chunk in chunks:
+                    progress.update(_render_samples(dataset, chunk, str(viz_dir), dpi))
+            else:
+                # Memory-mapped datasets are pickled as references to their files, so workers read rows themselves
+                with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                    futures = [executor.submit(_render_samples, dataset, chunk, str(viz_dir), dpi) for chunk in chunks]
+                    for future in as_completed(futures):
+                        progress.update(future.result())
         
         print(f"✅ Visualizations saved to {viz_dir}")
     
@@ -433,47 +1734,51 @@ class AudioPreprocessingPipeline:
         """
         Generate comprehensive dataset summary
         
+        Works on Arrow columns: only the metadata columns and the scalar audio
+        features are read, never the audio or model inputs, so the cost grows
+        with the number of rows and metadata columns but not with clip length.
+        Without the 'features' stage only the distributions are summarized.
+        
         Args:
             dataset: Processed dataset
         """
+        import pyarrow as pa
+        
         print("📊 Generating dataset summary...")
         
+        # One Arrow table of the metadata columns; shuffled or selected datasets are gathered through their indices
+        columns = ['style', 'emotion', 'duration'] + (['audio_features'] if 'audio_features' in dataset.column_names else [])
+        table = dataset.select_columns(columns).with_format("arrow")[:]
+        
         summary = {
             'total_samples': len(dataset),
-            'styles': {},
-            'emotions': {},
-            'durations': {},
-            'feature_statistics': {}
+            'styles': _value_counts(table.column('style')),
+            'emotions': _value_counts(table.column('emotion')),
+            'durations': _value_counts(table.column('duration')),
+            'feature_statistics': {},
+            'feature_means_by_style': {}
         }
         
-        # Count styles, emotions, durations
-        for sample in dataset:
-            style = sample.get('style', 'unknown')
-            emotion = sample.get('emotion', 'unknown')
-            duration = sample.get('duration', 'unknown')
-            
-            summary['styles'][style] = summary['styles'].get(style, 0) + 1
-            summary['emotions'][emotion] = summary['emotions'].get(emotion, 0) + 1
-            summary['durations'][duration] = summary['durations'].get(duration, 0) + 1
-        
-        # Calculate feature statistics
-        tempos = [sample['audio_features'].get('tempo', 0) for sample in dataset]
-        harmonic_ratios = [sample['audio_features'].get('harmonic_ratio', 0) for sample in dataset]
-        
-        summary['feature_statistics'] = {
-            'tempo': {
-                'mean': np.mean(tempos),
-                'std': np.std(tempos),
-                'min': np.min(tempos),
-                'max': np.max(tempos)
-            },
-            'harmonic_ratio': {
-                'mean': np.mean(harmonic_ratios),
-                'std': np.std(harmonic_ratios),
-                'min': np.min(harmonic_ratios),
-                'max': np.max(harmonic_ratios)
+        if 'audio_features' in columns:
+            audio_features = table.column('audio_features').combine_chunks()
+            
+            # Nulls become NaN so they drop out of the statistics
+            features = {
+                name: audio_features.field(name).to_numpy(zero_copy_only=False).astype(np.float64)
+                for name in AUDIO_FEATURE_SCALARS
+            }
+            
+            # Mean of every scalar feature per style, a single group-by over the flattened columns
+            feature_columns = {name: pa.array(values, from_pandas=True) for name, values in features.items()}
+            by_style = pa.table({'style': table.column('style'), **feature_columns}).group_by('style').aggregate(
+                [(name, 'mean') for name in AUDIO_FEATURE_SCALARS]
+            ).to_pydict()
+            
+            summary['feature_statistics'] = {name: _feature_statistics(values) for name, values in features.items()}
+            summary['feature_means_by_style'] = {
+                str(style): {name: by_style[f'{name}_mean'][i] for name in AUDIO_FEATURE_SCALARS}
+                for i, style in enumerate(by_style['style'])
             }
-        }
         
         # Save summary
         with open(self.output_dir / "dataset_summary.json", 'w') as f:
@@ -488,13 +1793,14 @@ class AudioPreprocessingPipeline:
         print(f"\nEmotions distribution:")
         for emotion, count in summary['emotions'].items():
             print(f"  {emotion}: {count} samples")
-        print(f"\nFeature statistics:")
-        print(f"  Tempo: {summary['feature_statistics']['tempo']['mean']:.1f} ± {summary['feature_statistics']['tempo']['std']:.1f} BPM")
-        print(f"  Harmonic ratio: {summary['feature_statistics']['harmonic_ratio']['mean']:.3f} ± {summary['feature_statistics']['harmonic_ratio']['std']:.3f}")
+        if summary['feature_statistics']:
+            print(f"\nFeature statistics (mean ± std, median):")
+            for name, stats in summary['feature_statistics'].items():
+                if stats:
+                    print(f"  {name}: {stats['mean']:.3f} ± {stats['std']:.3f}, {stats['percentiles']['p50']:.3f}")
         
         return summary
 
-
 def main():
     """
     Main function to run the complete preprocessing pipeline
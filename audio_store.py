@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped raw audio store for training-time random access
+
+All processed waveforms are written back to back into one flat binary file,
+with a JSON index of each clip's offset and length keyed by ``audio_file``
+(see segment_name for segmented recordings).
+Opening the store maps the file without reading it. Clips and crops are NumPy
+views into the mapping, so slicing them copies nothing. This module only needs
+NumPy, so data loader workers can import it without torch or transformers.
+
+Layout of a store directory:
+    audio.bin    samples of every clip, in the index dtype
+    index.json   {"dtype", "sample_rate", "scale", "total_samples",
+                  "clips": {audio_file: [offset, length]}}
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+
+DATA_FILE = "audio.bin"
+INDEX_FILE = "index.json"
+
+
+def segment_name(audio_file: str, segment_index: int) -> str:
+    """Store key of a dataset row: the audio file for its first segment, "<audio_file>#<n>" for later ones"""
+    return audio_file if segment_index == 0 else f"{audio_file}#{segment_index}"
+
+
+def write_audio_store(dataset, path: str, scale: float = 1.0) -> Dict:
+    """
+    Write the processed_audio column of a dataset to a memory-mapped store
+
+    Rows are streamed one at a time in their stored dtype, so the dataset is
+    never loaded into memory. The store is written next to ``path`` and only
+    replaces an existing store once complete.
+
+    Args:
+        dataset: Processed dataset with audio_file, processed_audio and sample_rate columns
+        path: Store directory
+        scale: Value of full scale in the stored dtype (INT16_SCALE for int16, 1.0 for float32)
+
+    Returns:
+        The store index
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".writing")
+    tmp_path.mkdir(parents=True, exist_ok=True)
+
+    columns = ['audio_file', 'processed_audio', 'sample_rate']
+    # Datasets written before segmentation have one row per file and no segment_index
+    segmented = 'segment_index' in dataset.column_names
+    rows = dataset.select_columns(columns + ['segment_index'] if segmented else columns)
+    # dtype=None keeps int16 audio as stored instead of upcasting it
+    rows = rows.with_format("numpy", dtype=None)
+
+    clips = {}
+    dtype = None
+    sample_rates = set()
+    offset = 0
+
+    with open(tmp_path / DATA_FILE, 'wb') as f:
+        for row in rows:
+            audio = np.ascontiguousarray(row['processed_audio'])
+            if dtype is None:
+                dtype = audio.dtype
+            elif audio.dtype != dtype:
+                raise ValueError(f"Mixed audio dtypes in dataset: {dtype} and {audio.dtype}")
+
+            audio.tofile(f)
+            name = segment_name(str(row['audio_file']), int(row['segment_index']) if segmented else 0)
+            clips[name] = [offset, len(audio)]
+            sample_rates.add(int(row['sample_rate']))
+            offset += len(audio)
+
+    if len(sample_rates) > 1:
+        raise ValueError(f"Mixed sample rates in dataset: {sorted(sample_rates)}")
+
+    index = {
+        'dtype': np.dtype(dtype or np.float32).name,
+        'sample_rate': sample_rates.pop() if sample_rates else None,
+        'scale': scale,
+        'total_samples': offset,
+        'clips': clips
+    }
+    with open(tmp_path / INDEX_FILE, 'w') as f:
+        json.dump(index, f)
+
+    if path.exists():
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+    return index
+
+
+class AudioStore:
+    """
+    Read-only view of a store written by write_audio_store
+
+    Clips and crops are returned in the stored dtype as views of the mapped
+    file; use to_float() to convert a slice to float32 in [-1, 1].
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        with open(self.path / INDEX_FILE) as f:
+            index = json.load(f)
+
+        self.dtype = np.dtype(index['dtype'])
+        self.sample_rate = index['sample_rate']
+        self.scale = index['scale']
+        self.total_samples = index['total_samples']
+        self.clips: Dict[str, Tuple[int, int]] = {name: tuple(span) for name, span in index['clips'].items()}
+        self.names: List[str] = list(self.clips)
+
+        # np.memmap refuses zero-length files
+        if self.total_samples:
+            self.samples = np.memmap(self.path / DATA_FILE, dtype=self.dtype, mode='r', shape=(self.total_samples,))
+        else:
+            self.samples = np.zeros(0, dtype=self.dtype)
+
+    def __len__(self) -> int:
+        return len(self.clips)
+
+    def __contains__(self, audio_file: str) -> bool:
+        return audio_file in self.clips
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def length(self, audio_file: str) -> int:
+        """Number of samples in a clip"""
+        return self.clips[audio_file][1]
+
+    def clip(self, audio_file: str) -> np.ndarray:
+        """Whole clip as a view of the store"""
+        offset, length = self.clips[audio_file]
+        return self.samples[offset:offset + length]
+
+    def crop(self, audio_file: str, start: int, length: int) -> np.ndarray:
+        """
+        ``length`` samples of a clip starting at ``start``, as a view of the store
+
+        The crop is shorter than ``length`` if the clip ends first.
+        """
+        offset, clip_length = self.clips[audio_file]
+        start = min(max(start, 0), clip_length)
+        end = min(start + length, clip_length)
+        return self.samples[offset + start:offset + end]
+
+    def random_crop(self, length: int, rng: np.random.Generator,
+                    audio_file: Optional[str] = None) -> Tuple[str, np.ndarray]:
+        """
+        Crop of ``length`` samples at a random position
+
+        Args:
+            length: Samples in the crop
+            rng: Random generator
+            audio_file: Clip to crop from; a random clip if None
+
+        Returns:
+            Tuple of (audio_file, crop view)
+        """
+        if audio_file is None:
+            audio_file = self.names[rng.integers(len(self.names))]
+        clip_length = self.clips[audio_file][1]
+        start = int(rng.integers(max(clip_length - length, 0) + 1))
+        return audio_file, self.crop(audio_file, start, length)
+
+    def to_float(self, audio: np.ndarray) -> np.ndarray:
+        """Float32 waveform in [-1, 1] from a slice of the store"""
+        if self.dtype == np.float32:
+            return np.asarray(audio)
+        return audio.astype(np.float32) / self.scale
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Benchmark MusicGen inference precision modes
+
+Runs the same prompts in fp32, int8 (dynamic quantization) and bf16 and reports
+what each mode trades: decoder tokens/sec, peak resident memory and how close
+the audio stays to the fp32 output. Every precision runs in its own process so
+peak RSS is measured independently. Generation is greedy so differences come
+from numerics rather than sampling.
+
+Usage:
+    python benchmark_musicgen.py --model facebook/musicgen-small --duration 5
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+import numpy as np
+import scipy.signal
+
+SAMPLE_RATE = 32000
+TOKENS_PER_SECOND = 50
+
+DEFAULT_PROMPTS = [
+    "soft ambient pads with gentle piano for deep relaxation",
+    "tibetan singing bowls with slow drones",
+]
+
+
+def run_worker(args) -> Dict:
+    """Load the model in one precision, generate every prompt and save the audio"""
+    import torch
+    from musicgen_server import MusicGenServer
+
+    server = MusicGenServer(model_name=args.model, precision=args.precision)
+    start = time.perf_counter()
+    server.load_model()
+    load_seconds = time.perf_counter() - start
+
+    max_new_tokens = int(args.duration * TOKENS_PER_SECOND)
+
+    def generate(prompt: str, tokens: int) -> np.ndarray:
+        inputs = server.prepare_inputs([prompt])
+        with torch.inference_mode():
+            audio_values = server.model.generate(**inputs, max_new_tokens=tokens, do_sample=False)
+        return audio_values[0, 0].float().cpu().numpy()
+
+    # Keep one-off kernel selection out of the timings
+    generate(args.prompts[0], TOKENS_PER_SECOND)
+
+    timings = []
+    audio = []
+    for prompt in args.prompts:
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            waveform = generate(prompt, max_new_tokens)
+            timings.append(time.perf_counter() - start)
+        audio.append(waveform)
+
+    np.savez(args.output, *audio)
+
+    # ru_maxrss is reported in KB on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / 1024 / 1024 if sys.platform == "darwin" else peak_rss / 1024
+
+    return {
+        "requested_precision": args.precision,
+        "precision": server.precision,
+        "load_seconds": load_seconds,
+        "mean_generate_seconds": float(np.mean(timings)),
+        "tokens_per_second": max_new_tokens / float(np.mean(timings)),
+        "peak_rss_mb": peak_rss_mb,
+    }
+
+
+def log_spectrogram(audio: np.ndarray) -> np.ndarray:
+    _, _, spec = scipy.signal.stft(audio, fs=SAMPLE_RATE, nperseg=2048, noverlap=1536)
+    return np.log10(np.abs(spec) ** 2 + 1e-10)
+
+
+def audio_similarity(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """
+    Compare a candidate waveform with the fp32 reference
+
+    Returns:
+        spectral_cosine: cosine similarity of the time-averaged log spectra (1.0 = identical timbre)
+        log_spectral_distance_db: mean frame-wise log-spectral distance in dB (0.0 = identical)
+    """
+    length = min(len(reference), len(candidate))
+    ref_spec = log_spectrogram(reference[:length])
+    cand_spec = log_spectrogram(candidate[:length])
+
+    ref_mean = ref_spec.mean(axis=1)
+    cand_mean = cand_spec.mean(axis=1)
+    cosine = float(np.dot(ref_mean, cand_mean) / (np.linalg.norm(ref_mean) * np.linalg.norm(cand_mean)))
+
+    distance = float(np.mean(np.sqrt(np.mean((10 * (ref_spec - cand_spec)) ** 2, axis=0))))
+    return {"spectral_cosine": cosine, "log_spectral_distance_db": distance}
+
+
+def load_audio(path: str) -> List[np.ndarray]:
+    with np.load(path) as data:
+        return [data[f"arr_{i}"] for i in range(len(data.files))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MusicGen precision modes")
+    parser.add_argument("--model", default="facebook/musicgen-medium", help="Model to benchmark")
+    parser.add_argument("--precisions", nargs="+", default=["fp32", "int8", "bf16"],
+                        choices=["fp32", "int8", "bf16"], help="Precision modes to compare")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds of audio per generation (default: 5)")
+    parser.add_argument("--runs", type=int, default=2, help="Timed runs per prompt (default: 2)")
+    parser.add_argument("--prompts", nargs="+", default=DEFAULT_PROMPTS, help="Prompts to generate")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--precision", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args)))
+        return
+
+    precisions = args.precisions if "fp32" in args.precisions else ["fp32"] + args.precisions
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for precision in precisions:
+            print(f"🔄 Running {precision}...")
+            output = os.path.join(tmp_dir, f"{precision}.npz")
+            command = [
+                sys.executable, os.path.abspath(__file__), "--worker",
+                "--model", args.model, "--precision", precision, "--output", output,
+                "--duration", str(args.duration), "--runs", str(args.runs), "--prompts", *args.prompts
+            ]
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(f"❌ {precision} failed:\n{completed.stderr[-2000:]}")
+                continue
+            results[precision] = json.loads(completed.stdout.strip().splitlines()[-1])
+            results[precision]["audio"] = load_audio(output)
+
+    if "fp32" not in results:
+        print("❌ fp32 reference run failed, cannot compare")
+        sys.exit(1)
+
+    reference = results["fp32"]["audio"]
+    for precision, result in results.items():
+        scores = [audio_similarity(ref, cand) for ref, cand in zip(reference, result.pop("audio"))]
+        result["spectral_cosine"] = float(np.mean([s["spectral_cosine"] for s in scores]))
+        result["log_spectral_distance_db"] = float(np.mean([s["log_spectral_distance_db"] for s in scores]))
+
+    print(f"\n📊 {args.model}, {args.duration:.0f}s per generation, greedy decoding")
+    print(f"{'mode':<6} {'tokens/s':>9} {'speedup':>8} {'peak RSS':>10} {'load':>7} {'cosine':>7} {'LSD dB':>7}")
+    base_speed = results["fp32"]["tokens_per_second"]
+    for precision, result in results.items():
+        label = precision if result["precision"] == precision else f"{precision}*"
+        print(f"{label:<6} {result['tokens_per_second']:>9.1f} {result['tokens_per_second'] / base_speed:>7.2f}x "
+              f"{result['peak_rss_mb']:>8.0f}MB {result['load_seconds']:>6.1f}s "
+              f"{result['spectral_cosine']:>7.3f} {result['log_spectral_distance_db']:>7.2f}")
+    if any(result["precision"] != precision for precision, result in results.items()):
+        print("* not supported on this machine, fell back to fp32")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"model": args.model, "duration": args.duration, "results": results}, f, indent=2)
+        print(f"\n✅ Results saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,880 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for AudioPreprocessingPipeline
+
+parallel: processes a synthetic corpus of tone clips with different worker
+          counts and reports clips/sec and speedup over a single worker. On an
+          N-core machine the speedup should approach N; processor loading in
+          each worker is included in the timings. Without --model it uses the
+          suite's local stand-in models, so it runs offline.
+features: times feature extraction per clip with the previous per-feature
+          librosa calls and with the shared FeatureEngine, and checks that
+          both produce the same values.
+decode:   per-file load time of long source files (the 2-5 minute lengths
+          of the demo files) with the previous full-file librosa.load and
+          with load_audio_file at each resample quality.
+crops:    random crop throughput from the saved HF dataset, from the same
+          dataset with NumPy formatting, and from the memory-mapped audio store,
+          including the time to open each.
+suite:    reproducible end-to-end benchmark on a synthetic corpus built from
+          the example's demo tones and the ambient piano generator, with tiny
+          local stand-ins for the MusicGen processor, the Whisper feature
+          extractor and the EnCodec codec, so it runs fully offline. Reports
+          clips/sec, audio-seconds/sec and peak RSS of each pass (median of
+          --repeats fresh processes) and the per-stage breakdown, and saves
+          them as a JSON baseline.
+compare:  compares two suite baselines, e.g. from two commits, and exits
+          non-zero if throughput dropped or memory grew beyond --tolerance.
+viz:      time to render the quality control figures for different sample
+          counts with the previous serial pyplot renderer (full waveform, fresh
+          STFT, dpi=300) and with visualize_features. The previous renderer is
+          timed on at most --legacy-samples figures and extrapolated beyond that.
+
+Usage:
+    python benchmark_preprocessing.py parallel --clips 32 --duration 30 --workers 1 2 4 8
+    python benchmark_preprocessing.py features --clips 5 --duration 30
+    python benchmark_preprocessing.py decode --source-rate 44100 --channels 2
+    python benchmark_preprocessing.py crops --clips 200 --duration 30 --crop 5
+    python benchmark_preprocessing.py viz --samples 5 500 --workers 4
+    python benchmark_preprocessing.py suite --clips 32 --duration 30 --workers 2 --json baseline.json
+    python benchmark_preprocessing.py compare baseline.json benchmark_results/suite-<commit>.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import multiprocessing
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+import soundfile as sf
+import librosa
+from datasets import Dataset, Features, load_from_disk
+
+from audio_preprocessing_pipeline import (
+    AudioPreprocessingPipeline, FeatureEngine, INT16_SCALE, RESAMPLE_QUALITIES, WHISPER_HOP_LENGTH,
+    WHISPER_MEL_BINS, WHISPER_SAMPLE_RATE, dataset_features, decode_audio, encode_audio, load_processed_dataset
+)
+from audio_store import AudioStore, write_audio_store
+from pipeline_profiling import max_rss_mb
+
+# Bump when a change to the suite makes its results incomparable with older baselines
+SUITE_VERSION = 1
+# Headline metrics compared between baselines, and whether higher is better
+SUITE_METRICS = {
+    "clips_per_second": True,
+    "audio_seconds_per_second": True,
+    "peak_rss_mb": False,
+    "peak_worker_rss_mb": False,
+}
+
+SAMPLE_RATE = 32000
+STYLES = ["ambient", "tibetan", "binaural", "crystal", "nature"]
+# Lengths in seconds of the files written by example_usage.create_demo_audio_files
+DEMO_DURATIONS = [180, 300, 120, 180, 300]
+
+
+def synth_clip(rng: np.random.Generator, duration: float) -> np.ndarray:
+    """Three tones with slow amplitude modulation and a little noise"""
+    t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    audio = np.zeros_like(t)
+    for k, freq in enumerate(rng.uniform(110, 880, size=3)):
+        audio += 0.3 / (k + 1) * np.sin(2 * np.pi * freq * t)
+    audio *= 0.5 + 0.5 * np.sin(2 * np.pi * rng.uniform(0.05, 0.5) * t)
+    audio += 0.01 * rng.standard_normal(len(t))
+    return audio.astype(np.float32)
+
+
+def create_corpus(root: Path, num_clips: int, duration: float) -> List[Dict]:
+    """Write ``num_clips`` synthetic clips plus their metadata"""
+    audio_dir = root / "audio"
+    audio_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(0)
+
+    metadata = []
+    for i in range(num_clips):
+        style = STYLES[i % len(STYLES)]
+        audio_file = f"{style}_{i:04d}.wav"
+        sf.write(audio_dir / audio_file, synth_clip(rng, duration), SAMPLE_RATE)
+        metadata.append({
+            "text": f"Synthetic {style} clip {i} for benchmarking",
+            "audio_file": audio_file,
+            "style": style,
+            "duration": f"{duration:.0f}s",
+            "emotion": "relaxation",
+            "instruments": ["synthesizer"],
+            "therapeutic_benefit": "benchmarking"
+        })
+
+    with open(root / "metadata.json", 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
+
+
+def run(root: Path, metadata: List[Dict], num_workers: int, models: Dict[str, str]) -> float:
+    """Seconds to process the whole corpus with ``num_workers`` processes, using the models in ``models``"""
+    pipeline = AudioPreprocessingPipeline(
+        audio_dir=str(root / "audio"),
+        metadata_file=str(root / "metadata.json"),
+        output_dir=str(root / f"output_{num_workers}"),
+        num_workers=num_workers,
+        verbose=False,
+        **models
+    )
+    entries = [(item["audio_file"], item) for item in metadata]
+
+    start = time.perf_counter()
+    failures = [audio_file for audio_file, item, error in pipeline.iter_processed(entries) if item is None]
+    elapsed = time.perf_counter() - start
+
+    if failures:
+        print(f"⚠️  {len(failures)} clips failed with {num_workers} workers")
+    return elapsed
+
+
+def legacy_features(audio_array: np.ndarray, sample_rate: int) -> Dict[str, Any]:
+    """
+    The previous extract_audio_features, where every librosa call recomputes its own spectrogram
+
+    The magnitude (not complex) STFT and the sample rate are passed to the spectral
+    shape features so both paths compute the same values.
+    """
+    stft = np.abs(librosa.stft(audio_array))
+    mfccs = librosa.feature.mfcc(y=audio_array, sr=sample_rate, n_mfcc=13)
+    tempo, _ = librosa.beat.beat_track(y=audio_array, sr=sample_rate)
+    harmonic, percussive = librosa.effects.hpss(audio_array)
+    return {
+        'spectral_centroid': np.mean(librosa.feature.spectral_centroid(S=stft, sr=sample_rate)),
+        'spectral_bandwidth': np.mean(librosa.feature.spectral_bandwidth(S=stft, sr=sample_rate)),
+        'spectral_rolloff': np.mean(librosa.feature.spectral_rolloff(S=stft, sr=sample_rate)),
+        'mfcc_mean': np.mean(mfccs, axis=1).tolist(),
+        'mfcc_std': np.std(mfccs, axis=1).tolist(),
+        'tempo': float(np.atleast_1d(tempo)[0]),
+        'harmonic_ratio': np.mean(np.abs(harmonic)) / (np.mean(np.abs(harmonic)) + np.mean(np.abs(percussive))),
+        'zero_crossing_rate': np.mean(librosa.feature.zero_crossing_rate(audio_array)),
+        'rms_energy': np.mean(librosa.feature.rms(y=audio_array))
+    }
+
+
+def benchmark_features(args):
+    rng = np.random.default_rng(0)
+    clips = [synth_clip(rng, args.duration) for _ in range(args.clips)]
+
+    # Compile librosa's numba kernels before timing anything
+    FeatureEngine(clips[0][:SAMPLE_RATE], SAMPLE_RATE).features()
+    legacy_features(clips[0][:SAMPLE_RATE], SAMPLE_RATE)
+
+    timings = {"before": [], "after": []}
+    max_difference = 0.0
+    for clip in clips:
+        start = time.perf_counter()
+        before = legacy_features(clip, SAMPLE_RATE)
+        timings["before"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        after = FeatureEngine(clip, SAMPLE_RATE).features()
+        timings["after"].append(time.perf_counter() - start)
+
+        for name, value in before.items():
+            difference = np.max(np.abs(np.asarray(value) - np.asarray(after[name])) / (np.abs(np.asarray(value)) + 1e-9))
+            max_difference = max(max_difference, float(difference))
+
+    before_ms = np.mean(timings["before"]) * 1000
+    after_ms = np.mean(timings["after"]) * 1000
+    print(f"\n📊 Feature extraction, {args.clips} clips x {args.duration:.0f}s")
+    print(f"   Before (per-feature spectrograms): {before_ms:8.1f} ms/clip")
+    print(f"   After (shared FeatureEngine):      {after_ms:8.1f} ms/clip")
+    print(f"   Speedup: {before_ms / after_ms:.2f}x")
+    print(f"   Largest relative difference in any feature: {max_difference:.2e}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                "clips": args.clips,
+                "duration": args.duration,
+                "before_ms_per_clip": before_ms,
+                "after_ms_per_clip": after_ms,
+                "max_relative_difference": max_difference,
+            }, f, indent=2)
+        print(f"\n✅ Results saved to {args.json}")
+
+
+def benchmark_parallel(args):
+    cpu_count = os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir)
+        print(f"🎵 Creating {args.clips} synthetic clips of {args.duration:.0f}s...")
+        metadata = create_corpus(root, args.clips, args.duration)
+        if args.model:
+            models = {"model_name": args.model}
+        else:
+            # Without --model, the suite's local stand-ins keep the benchmark offline
+            os.environ.update({"HF_HUB_OFFLINE": "1", "TRANSFORMERS_OFFLINE": "1", "HF_DATASETS_OFFLINE": "1"})
+            models = create_standin_models(root / "models", [item["text"] for item in metadata])
+
+        results = {}
+        for num_workers in sorted(set(args.workers)):
+            print(f"🔄 Running with {num_workers} workers...")
+            results[num_workers] = run(root, metadata, num_workers, models)
+
+    baseline = results[min(results)] * min(results)
+    print(f"\n📊 {args.clips} clips x {args.duration:.0f}s on {cpu_count} cores")
+    print(f"{'workers':>7} {'seconds':>9} {'clips/s':>8} {'speedup':>8} {'efficiency':>11}")
+    for num_workers, elapsed in results.items():
+        speedup = baseline / elapsed
+        print(f"{num_workers:>7} {elapsed:>9.1f} {args.clips / elapsed:>8.2f} {speedup:>7.2f}x "
+              f"{speedup / num_workers:>10.0%}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                "clips": args.clips,
+                "duration": args.duration,
+                "cpu_count": cpu_count,
+                "seconds": {str(k): v for k, v in results.items()},
+            }, f, indent=2)
+        print(f"\n✅ Results saved to {args.json}")
+
+
+def legacy_load(path: str, target_sample_rate: int, max_audio_length: float) -> np.ndarray:
+    """The previous load_audio_file: decode and resample the whole file, then normalize, trim and truncate"""
+    audio, sample_rate = librosa.load(path, sr=target_sample_rate, mono=True)
+    audio = librosa.util.normalize(audio)
+    audio, _ = librosa.effects.trim(audio, top_db=20)
+    return audio[:int(max_audio_length * sample_rate)]
+
+
+def benchmark_decode(args):
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir)
+        print(f"🎵 Writing {len(DEMO_DURATIONS)} files of {min(DEMO_DURATIONS)}-{max(DEMO_DURATIONS)}s "
+              f"({args.source_rate} Hz, {args.channels} channel(s))...")
+        paths = []
+        for i, duration in enumerate(DEMO_DURATIONS):
+            clip = librosa.resample(synth_clip(rng, duration), orig_sr=SAMPLE_RATE, target_sr=args.source_rate)
+            path = root / f"{STYLES[i % len(STYLES)]}_{i:04d}.{args.format}"
+            sf.write(path, np.stack([clip] * args.channels, axis=1), args.source_rate)
+            paths.append(str(path))
+
+        # Warm up the resamplers and the page cache
+        legacy_load(paths[0], SAMPLE_RATE, args.max_length)
+
+        timings = {"before (full librosa.load)": []}
+        for path in paths:
+            start = time.perf_counter()
+            before = legacy_load(path, SAMPLE_RATE, args.max_length)
+            timings["before (full librosa.load)"].append(time.perf_counter() - start)
+
+        max_difference = 0.0
+        for quality in args.qualities:
+            pipeline = AudioPreprocessingPipeline(
+                audio_dir=str(root),
+                output_dir=str(root / "output"),
+                max_audio_length=args.max_length,
+                resample_quality=quality,
+                verbose=False
+            )
+            pipeline.load_audio_file(paths[0])
+            timings[f"after ({quality})"] = []
+            for path in paths:
+                start = time.perf_counter()
+                after, _ = pipeline.load_audio_file(path)
+                timings[f"after ({quality})"].append(time.perf_counter() - start)
+
+                if quality == "high":
+                    # Peaks are now taken over the decoded prefix rather than the whole file,
+                    # so compare waveforms at equal peak level
+                    before = legacy_load(path, SAMPLE_RATE, args.max_length)
+                    difference = before / np.max(np.abs(before)) - after / np.max(np.abs(after))
+                    max_difference = max(max_difference, float(np.max(np.abs(difference))))
+
+    baseline = np.mean(timings["before (full librosa.load)"])
+    print(f"\n📊 Load time per file, keeping the first {args.max_length:.0f}s")
+    print(f"{'path':<28} {'ms/file':>9} {'speedup':>8}")
+    for name, seconds in timings.items():
+        print(f"{name:<28} {np.mean(seconds) * 1000:>9.1f} {baseline / np.mean(seconds):>7.1f}x")
+    if "high" in args.qualities:
+        print(f"   Largest difference from the previous output at 'high', at equal peak level: {max_difference:.2e}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                "durations": DEMO_DURATIONS,
+                "source_rate": args.source_rate,
+                "channels": args.channels,
+                "format": args.format,
+                "max_length": args.max_length,
+                "ms_per_file": {name: np.mean(seconds) * 1000 for name, seconds in timings.items()},
+            }, f, indent=2)
+        print(f"\n✅ Results saved to {args.json}")
+
+
+def time_crops(crop: Callable[[str, int], np.ndarray], lengths: Dict[str, int], crop_samples: int,
+               num_crops: int) -> float:
+    """Crops per second from ``crop(audio_file, start)``, converted to float as a loader would"""
+    rng = np.random.default_rng(1)
+    names = list(lengths)
+    start = time.perf_counter()
+    for _ in range(num_crops):
+        audio_file = names[rng.integers(len(names))]
+        offset = int(rng.integers(max(lengths[audio_file] - crop_samples, 0) + 1))
+        samples = crop(audio_file, offset)
+        assert len(samples) == min(crop_samples, lengths[audio_file])
+    return num_crops / (time.perf_counter() - start)
+
+
+def benchmark_crops(args):
+    crop_samples = int(args.crop * SAMPLE_RATE)
+    scale = INT16_SCALE if args.audio_dtype == "int16" else 1.0
+    # Only the columns the loaders read; the other columns do not change the access pattern
+    features = Features({name: dataset_features(args.audio_dtype)[name]
+                         for name in ('audio_file', 'processed_audio', 'sample_rate')})
+
+    def rows():
+        rng = np.random.default_rng(0)
+        for i in range(args.clips):
+            yield {
+                'audio_file': f"{STYLES[i % len(STYLES)]}_{i:04d}.wav",
+                'processed_audio': encode_audio(synth_clip(rng, args.duration), args.audio_dtype),
+                'sample_rate': SAMPLE_RATE
+            }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir)
+        print(f"🎵 Writing {args.clips} synthetic clips of {args.duration:.0f}s ({args.audio_dtype})...")
+        Dataset.from_generator(rows, features=features, cache_dir=str(root / "hf_cache")).save_to_disk(str(root / "dataset"))
+        write_audio_store(load_from_disk(str(root / "dataset")), str(root / "audio_store"), scale=scale)
+
+        results = {}
+
+        start = time.perf_counter()
+        dataset = load_from_disk(str(root / "dataset"))
+        index = {name: i for i, name in enumerate(dataset['audio_file'])}
+        open_seconds = time.perf_counter() - start
+        lengths = {name: int(args.duration * SAMPLE_RATE) for name in index}
+        # Rows come back as Python lists of numbers, the access pattern before the typed schema
+        results["HF dataset (lists)"] = (open_seconds, time_crops(
+            lambda name, offset: decode_audio(np.asarray(dataset[index[name]]['processed_audio'],
+                                                         dtype=args.audio_dtype)[offset:offset + crop_samples]),
+            lengths, crop_samples, args.list_crops))
+
+        start = time.perf_counter()
+        dataset = load_processed_dataset(str(root / "dataset"))
+        index = {name: i for i, name in enumerate(dataset['audio_file'])}
+        open_seconds = time.perf_counter() - start
+        results["HF dataset (NumPy)"] = (open_seconds, time_crops(
+            lambda name, offset: decode_audio(dataset[index[name]]['processed_audio'][offset:offset + crop_samples]),
+            lengths, crop_samples, args.crops))
+
+        start = time.perf_counter()
+        store = AudioStore(str(root / "audio_store"))
+        open_seconds = time.perf_counter() - start
+        results["Audio store (memmap)"] = (open_seconds, time_crops(
+            lambda name, offset: store.to_float(store.crop(name, offset, crop_samples)),
+            lengths, crop_samples, args.crops))
+        del dataset, store
+
+    print(f"\n📊 Random {args.crop:.1f}s crops from {args.clips} clips x {args.duration:.0f}s ({args.audio_dtype})")
+    print(f"{'source':<22} {'open ms':>9} {'crops/s':>10} {'speedup':>8}")
+    baseline = results["HF dataset (lists)"][1]
+    for source, (open_seconds, crops_per_second) in results.items():
+        print(f"{source:<22} {open_seconds * 1000:>9.1f} {crops_per_second:>10.0f} {crops_per_second / baseline:>7.1f}x")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                "clips": args.clips,
+                "duration": args.duration,
+                "crop": args.crop,
+                "audio_dtype": args.audio_dtype,
+                "results": {source: {"open_seconds": open_seconds, "crops_per_second": crops_per_second}
+                            for source, (open_seconds, crops_per_second) in results.items()},
+            }, f, indent=2)
+        print(f"\n✅ Results saved to {args.json}")
+
+
+def legacy_visualize(dataset: Dataset, indices: List[int], viz_dir: Path):
+    """The previous visualize_features loop: pyplot, every sample plotted, a fresh STFT, dpi=300"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import librosa.display
+
+    for i in indices:
+        sample = dataset[i]
+        fig, axes = plt.subplots(2, 2, figsize=(15, 10))
+        fig.suptitle(f'Sample {i+1}: {sample["audio_file"]}', fontsize=16)
+
+        audio_array = np.array(sample['processed_audio'])
+        axes[0, 0].plot(audio_array)
+        axes[0, 0].set_title('Waveform')
+
+        D = librosa.amplitude_to_db(np.abs(librosa.stft(audio_array)), ref=np.max)
+        librosa.display.specshow(D, sr=sample['sample_rate'], x_axis='time', y_axis='log', ax=axes[0, 1])
+        axes[0, 1].set_title('Spectrogram')
+
+        mfccs = np.array(sample['audio_features']['mfcc_mean'])
+        axes[1, 0].bar(range(len(mfccs)), mfccs)
+
+        feature_names = ['tempo', 'harmonic_ratio', 'zero_crossing_rate', 'rms_energy']
+        axes[1, 1].bar(feature_names, [sample['audio_features'][name] for name in feature_names])
+
+        plt.tight_layout()
+        plt.savefig(viz_dir / f'sample_{i+1}_features.png', dpi=300, bbox_inches='tight')
+        plt.close()
+
+
+def benchmark_viz(args):
+    num_rows = max(args.samples)
+    schema = dataset_features()
+    features = Features({name: schema[name] for name in
+                         ('audio_file', 'processed_audio', 'sample_rate', 'audio_features', 'whisper_features')})
+
+    def rows():
+        rng = np.random.default_rng(0)
+        for i in range(num_rows):
+            clip = synth_clip(rng, args.duration)
+            # Log-mel frames with Whisper's shape and hop, standing in for the stored Whisper features
+            mel = librosa.feature.melspectrogram(
+                y=librosa.resample(clip, orig_sr=SAMPLE_RATE, target_sr=WHISPER_SAMPLE_RATE, res_type='polyphase'),
+                sr=WHISPER_SAMPLE_RATE, n_fft=400, hop_length=WHISPER_HOP_LENGTH, n_mels=WHISPER_MEL_BINS
+            )
+            audio_features = {name: float(rng.uniform()) for name in features['audio_features'] if name not in
+                              ('sample_rate', 'mfcc_mean', 'mfcc_std')}
+            audio_features.update({
+                'sample_rate': SAMPLE_RATE,
+                'mfcc_mean': rng.standard_normal(13).tolist(),
+                'mfcc_std': rng.uniform(size=13).tolist()
+            })
+            yield {
+                'audio_file': f"{STYLES[i % len(STYLES)]}_{i:04d}.wav",
+                'processed_audio': clip,
+                'sample_rate': SAMPLE_RATE,
+                'audio_features': audio_features,
+                'whisper_features': {'input_features': np.log10(np.maximum(mel, 1e-10)).T.astype(np.float32)}
+            }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir)
+        print(f"🎵 Writing {num_rows} synthetic rows of {args.duration:.0f}s...")
+        # Rows of 30 s clips are several MB each; the default batch of 1000 rows does not fit in memory
+        Dataset.from_generator(rows, features=features, cache_dir=str(root / "hf_cache"),
+                               writer_batch_size=10).save_to_disk(str(root / "dataset"))
+        dataset = load_from_disk(str(root / "dataset"))
+        pipeline = AudioPreprocessingPipeline(output_dir=str(root / "output"), num_workers=args.workers, verbose=False)
+
+        legacy_dir = root / "legacy"
+        legacy_dir.mkdir()
+        legacy_count = min(args.legacy_samples, num_rows)
+        start = time.perf_counter()
+        legacy_visualize(dataset, list(range(legacy_count)), legacy_dir)
+        legacy_per_sample = (time.perf_counter() - start) / max(legacy_count, 1)
+
+        results = {}
+        for count in sorted(set(args.samples)):
+            start = time.perf_counter()
+            pipeline.visualize_features(dataset, num_samples=count, dpi=args.dpi)
+            results[count] = (legacy_per_sample * count, time.perf_counter() - start)
+        del dataset
+
+    print(f"\n📊 Rendering visualizations of {args.duration:.0f}s clips "
+          f"({args.workers} workers, dpi={args.dpi}; before: 1 process, dpi=300)")
+    print(f"{'samples':>7} {'before s':>10} {'after s':>9} {'speedup':>8}")
+    for count, (before, after) in results.items():
+        estimate = "~" if count > legacy_count else " "
+        print(f"{count:>7} {estimate}{before:>9.1f} {after:>9.1f} {before / after:>7.1f}x")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                "duration": args.duration,
+                "workers": args.workers,
+                "dpi": args.dpi,
+                "legacy_samples_timed": legacy_count,
+                "seconds": {str(count): {"before": before, "after": after}
+                            for count, (before, after) in results.items()},
+            }, f, indent=2)
+        print(f"\n✅ Results saved to {args.json}")
+
+
+def create_suite_corpus(root: Path, num_clips: int, duration: float, source_rate: int, seed: int) -> List[Dict]:
+    """
+    Write a reproducible corpus alternating the example's demo tones and ambient piano sequences
+
+    Metadata entries reuse the example dataset's texts and styles, so prompts
+    have realistic lengths.
+    """
+    from example_usage import DEMO_SOUNDS, SAMPLE_METADATA, synthesize_demo_sound
+    from create_real_piano_audio import generate_ambient_piano_sequence
+
+    audio_dir = root / "audio"
+    audio_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    sounds = list(DEMO_SOUNDS.values())
+
+    metadata = []
+    for i in range(num_clips):
+        if i % 2 == 0:
+            # Detuned so no two tone clips are identical
+            frequencies = np.asarray(sounds[(i // 2) % len(sounds)]['frequencies']) * rng.uniform(0.9, 1.1)
+            audio = synthesize_demo_sound(frequencies, duration, source_rate)
+            kind = "tones"
+        else:
+            audio = generate_ambient_piano_sequence(duration, source_rate, rng=rng)
+            kind = "piano"
+
+        item = dict(SAMPLE_METADATA[i % len(SAMPLE_METADATA)])
+        item["audio_file"] = f"{kind}_{i:04d}.wav"
+        sf.write(audio_dir / item["audio_file"], audio, source_rate)
+        metadata.append(item)
+
+    with open(root / "metadata.json", 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
+
+
+def create_standin_models(root: Path, texts: List[str]) -> Dict[str, str]:
+    """
+    Tiny local models with the interfaces of the real ones, so the suite never touches the network
+
+    The MusicGen processor pairs a T5 tokenizer whose vocabulary is the words
+    of ``texts`` with the 32 kHz EnCodec feature extractor. Like T5's own
+    tokenizer it is a Unigram model over "▁"-prefixed words, so every
+    transformers version can load it back. The Whisper feature
+    extractor has no weights, so it is the real one. The codec is a randomly
+    initialized EnCodec with MusicGen's frame rate and codebooks but very few
+    channels: its codes are meaningless, but it runs the same code path.
+
+    Returns:
+        Pipeline keyword arguments pointing at the saved models
+    """
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import (
+        EncodecConfig, EncodecFeatureExtractor, EncodecModel, MusicgenProcessor, T5TokenizerFast,
+        WhisperFeatureExtractor
+    )
+
+    words = sorted({word for text in texts for word in re.findall(r"\w+", text)})
+    symbols = sorted({symbol for text in texts for symbol in re.findall(r"[^\w\s]", text)})
+    vocab = ([("<pad>", 0.0), ("</s>", 0.0), ("<unk>", 0.0)]
+             + [(f"▁{word}", -1.0) for word in words] + [(symbol, -1.0) for symbol in symbols])
+    tokenizer = Tokenizer(models.Unigram(vocab, unk_id=2))
+    tokenizer.pre_tokenizer = pre_tokenizers.Sequence([
+        pre_tokenizers.WhitespaceSplit(),
+        pre_tokenizers.Metaspace(replacement="▁", prepend_scheme="always")
+    ])
+
+    paths = {name: str(root / name) for name in ("musicgen", "whisper", "encodec")}
+    MusicgenProcessor(
+        feature_extractor=EncodecFeatureExtractor(feature_size=1, sampling_rate=SAMPLE_RATE),
+        tokenizer=T5TokenizerFast(tokenizer_object=tokenizer, pad_token="<pad>", eos_token="</s>",
+                                  unk_token="<unk>", extra_ids=0)
+    ).save_pretrained(paths["musicgen"])
+    WhisperFeatureExtractor(feature_size=WHISPER_MEL_BINS).save_pretrained(paths["whisper"])
+
+    torch.manual_seed(0)
+    EncodecModel(EncodecConfig(
+        sampling_rate=SAMPLE_RATE,
+        target_bandwidths=[2.2],
+        upsampling_ratios=[8, 5, 4, 4],
+        codebook_size=2048,
+        num_filters=4,
+        hidden_size=16,
+        num_lstm_layers=1
+    )).save_pretrained(paths["encodec"])
+
+    return {"model_name": paths["musicgen"], "whisper_model": paths["whisper"], "codec_model": paths["encodec"]}
+
+
+def suite_pass(config: Dict[str, Any], profile: bool, audio_codes: bool) -> Dict[str, Any]:
+    """
+    One run of the pipeline from scratch, in the fresh process it is submitted to
+
+    Every pass gets its own process so its peak RSS, and that of its pool
+    workers, is not inflated by earlier passes.
+    """
+    import contextlib
+    import io
+    import shutil
+    import pyarrow.compute as pc
+
+    shutil.rmtree(config["output_dir"], ignore_errors=True)
+    pipeline = AudioPreprocessingPipeline(**config, use_cache=False, profile_stages=profile, verbose=False)
+    result = {}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        dataset = pipeline.process_dataset()
+        result["process_seconds"] = time.perf_counter() - start
+
+        if audio_codes:
+            start = time.perf_counter()
+            dataset = pipeline.tokenize_audio(dataset)
+            result["codes_seconds"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pipeline.generate_dataset_summary(dataset)
+        result["summary_seconds"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pipeline.create_train_val_split(dataset, val_split=0.2)
+        result["split_seconds"] = time.perf_counter() - start
+
+    with open(pipeline.output_dir / "processing_metadata.json") as f:
+        processed_files = json.load(f)["processed_files"]
+    audio_features = dataset.select_columns(["audio_features"]).with_format("arrow")[:].column("audio_features")
+    audio_seconds = pc.sum(audio_features.combine_chunks().field("duration")).as_py() or 0.0
+
+    result.update({
+        "files": processed_files,
+        "rows": len(dataset),
+        "audio_seconds": audio_seconds,
+        "clips_per_second": processed_files / result["process_seconds"],
+        "audio_seconds_per_second": audio_seconds / result["process_seconds"],
+        "peak_rss_mb": max_rss_mb(),
+        "peak_worker_rss_mb": max_rss_mb(children=True),
+    })
+    if profile:
+        result["stages"] = pipeline.profile_report["stages"]
+    return result
+
+
+def run_suite_pass(config: Dict[str, Any], profile: bool = False, audio_codes: bool = False) -> Dict[str, Any]:
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(suite_pass, config, profile, audio_codes).result()
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_suite(args):
+    import datasets
+    import torch
+    import transformers
+
+    # Spawned passes inherit these; the stand-in models are local, so nothing should need the network
+    os.environ.update({"HF_HUB_OFFLINE": "1", "TRANSFORMERS_OFFLINE": "1", "HF_DATASETS_OFFLINE": "1"})
+    commit = git_commit()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir)
+        print(f"🎵 Writing {args.clips} synthetic clips of {args.duration:.0f}s at {args.source_rate} Hz (seed {args.seed})...")
+        metadata = create_suite_corpus(root / "corpus", args.clips, args.duration, args.source_rate, args.seed)
+        models = create_standin_models(root / "models", [item["text"] for item in metadata])
+
+        config = {
+            "audio_dir": str(root / "corpus" / "audio"),
+            "metadata_file": str(root / "corpus" / "metadata.json"),
+            "output_dir": str(root / "output"),
+            "max_audio_length": args.max_length,
+            "segment": args.segment,
+            "batch_size": args.batch_size,
+            "num_workers": args.workers,
+            **models
+        }
+
+        runs = []
+        for repeat in range(args.repeats):
+            print(f"🔄 End-to-end pass {repeat + 1}/{args.repeats}...")
+            runs.append(run_suite_pass(config, audio_codes=args.audio_codes))
+        print("🔄 Profiled pass for the per-stage breakdown...")
+        stages = run_suite_pass(config, profile=True)["stages"]
+
+    # Median of each measurement over the repeats
+    results = {name: float(np.median([run[name] for run in runs])) for name in runs[0] if runs[0][name] is not None}
+
+    print(f"\n📊 {args.clips} clips x {args.duration:.0f}s, {args.workers} worker(s), median of {args.repeats} pass(es)")
+    print(f"   Files processed:        {results['files']:.0f} ({results['rows']:.0f} rows)")
+    print(f"   process_dataset:        {results['process_seconds']:.2f} s")
+    print(f"   Clips/sec:              {results['clips_per_second']:.2f}")
+    print(f"   Audio-seconds/sec:      {results['audio_seconds_per_second']:.1f}")
+    if "codes_seconds" in results:
+        print(f"   tokenize_audio:         {results['codes_seconds']:.2f} s")
+    print(f"   Summary / split:        {results['summary_seconds']:.2f} s / {results['split_seconds']:.2f} s")
+    print(f"   Peak RSS:               {results['peak_rss_mb']:.0f} MB"
+          + (f" (largest worker {results['peak_worker_rss_mb']:.0f} MB)" if 'peak_worker_rss_mb' in results else ""))
+    print(f"\n{'stage':<22} {'mean ms':>9} {'share':>7}")
+    for name, stats in stages.items():
+        print(f"{name:<22} {stats['mean_ms']:>9.1f} {stats['share']:>7.1%}")
+
+    baseline = {
+        "suite_version": SUITE_VERSION,
+        "commit": commit,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "librosa": librosa.__version__,
+            "torch": torch.__version__,
+            "transformers": transformers.__version__,
+            "datasets": datasets.__version__,
+        },
+        "config": {
+            "clips": args.clips,
+            "duration": args.duration,
+            "source_rate": args.source_rate,
+            "seed": args.seed,
+            "max_length": args.max_length,
+            "segment": args.segment,
+            "batch_size": args.batch_size,
+            "workers": args.workers,
+            "repeats": args.repeats,
+            "audio_codes": args.audio_codes,
+        },
+        "results": results,
+        "runs": runs,
+        "stages": stages,
+    }
+
+    path = Path(args.json or f"benchmark_results/suite-{commit or 'unknown'}.json")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2)
+    print(f"\n✅ Baseline saved to {path}")
+
+
+def benchmark_compare(args):
+    with open(args.baseline) as f:
+        before = json.load(f)
+    with open(args.current) as f:
+        after = json.load(f)
+
+    if before.get("suite_version") != after.get("suite_version"):
+        print(f"⚠️  Suite versions differ ({before.get('suite_version')} vs {after.get('suite_version')}); "
+              f"results may not be comparable")
+    differing = {name for name in set(before["config"]) | set(after["config"])
+                 if before["config"].get(name) != after["config"].get(name)}
+    if differing:
+        print(f"⚠️  Configurations differ in: {', '.join(sorted(differing))}")
+    if before["environment"].get("cpu_count") != after["environment"].get("cpu_count"):
+        print("⚠️  Baselines were recorded on machines with different core counts")
+
+    print(f"\n📊 {before.get('commit')} -> {after.get('commit')}")
+    print(f"{'metric':<28} {'before':>10} {'after':>10} {'change':>8}")
+    regressions = []
+    for name, higher_is_better in SUITE_METRICS.items():
+        if name not in before["results"] or name not in after["results"]:
+            continue
+        old, new = before["results"][name], after["results"][name]
+        change = (new - old) / old if old else 0.0
+        regressed = change < -args.tolerance if higher_is_better else change > args.tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<28} {old:>10.2f} {new:>10.2f} {change:>+7.1%}{'  ❌' if regressed else ''}")
+
+    print(f"\n{'stage mean ms':<28} {'before':>10} {'after':>10} {'change':>8}")
+    for name in after["stages"]:
+        if name in before["stages"]:
+            old, new = before["stages"][name]["mean_ms"], after["stages"][name]["mean_ms"]
+            change = (new - old) / old if old else 0.0
+            print(f"{name:<28} {old:>10.1f} {new:>10.1f} {change:>+7.1%}")
+
+    if regressions:
+        print(f"\n❌ Regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print(f"\n✅ No regression beyond {args.tolerance:.0%}")
+
+
+def main():
+    cpu_count = os.cpu_count() or 1
+    default_workers = sorted({1, *[2 ** k for k in range(1, 8) if 2 ** k <= cpu_count], cpu_count})
+
+    parser = argparse.ArgumentParser(description="Benchmark the audio preprocessing pipeline")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    parallel = subparsers.add_parser("parallel", help="Speedup of process_dataset with more workers")
+    parallel.add_argument("--clips", type=int, default=32, help="Clips in the synthetic corpus (default: 32)")
+    parallel.add_argument("--duration", type=float, default=30.0, help="Seconds per clip (default: 30)")
+    parallel.add_argument("--workers", type=int, nargs="+", default=default_workers,
+                          help=f"Worker counts to compare (default: {' '.join(map(str, default_workers))})")
+    parallel.add_argument("--model", help="MusicGen processor to load, by hub name or local path "
+                                          "(default: the suite's offline stand-in models)")
+    parallel.add_argument("--json", help="Write the results to this JSON file")
+    parallel.set_defaults(run=benchmark_parallel)
+
+    features = subparsers.add_parser("features", help="Per-clip feature extraction time before and after FeatureEngine")
+    features.add_argument("--clips", type=int, default=5, help="Clips to time (default: 5)")
+    features.add_argument("--duration", type=float, default=30.0, help="Seconds per clip (default: 30)")
+    features.add_argument("--json", help="Write the results to this JSON file")
+    features.set_defaults(run=benchmark_features)
+
+    decode = subparsers.add_parser("decode", help="Per-file load time before and after partial decoding")
+    decode.add_argument("--source-rate", type=int, default=44100, help="Sample rate of the source files (default: 44100)")
+    decode.add_argument("--channels", type=int, default=2, help="Channels in the source files (default: 2)")
+    decode.add_argument("--format", choices=["wav", "flac"], default="wav", help="Source file format (default: wav)")
+    decode.add_argument("--max-length", type=float, default=30.0, help="max_audio_length in seconds (default: 30)")
+    decode.add_argument("--qualities", nargs="+", choices=list(RESAMPLE_QUALITIES), default=list(RESAMPLE_QUALITIES),
+                        help="Resample qualities to time (default: all)")
+    decode.add_argument("--json", help="Write the results to this JSON file")
+    decode.set_defaults(run=benchmark_decode)
+
+    crops = subparsers.add_parser("crops", help="Random crop throughput from the HF dataset and the audio store")
+    crops.add_argument("--clips", type=int, default=200, help="Clips in the synthetic dataset (default: 200)")
+    crops.add_argument("--duration", type=float, default=30.0, help="Seconds per clip (default: 30)")
+    crops.add_argument("--crop", type=float, default=5.0, help="Seconds per crop (default: 5)")
+    crops.add_argument("--crops", type=int, default=5000, help="Crops to time per source (default: 5000)")
+    crops.add_argument("--list-crops", type=int, default=200,
+                       help="Crops to time from the list-based HF rows, which are much slower (default: 200)")
+    crops.add_argument("--audio-dtype", choices=["float32", "int16"], default="float32",
+                       help="Storage dtype for the audio (default: float32)")
+    crops.add_argument("--json", help="Write the results to this JSON file")
+    crops.set_defaults(run=benchmark_crops)
+
+    suite = subparsers.add_parser("suite", help="Offline end-to-end benchmark saved as a JSON baseline")
+    suite.add_argument("--clips", type=int, default=16, help="Clips in the synthetic corpus (default: 16)")
+    suite.add_argument("--duration", type=float, default=30.0, help="Seconds per source file, at least 10 (default: 30)")
+    suite.add_argument("--source-rate", type=int, default=44100, help="Sample rate of the source files (default: 44100)")
+    suite.add_argument("--seed", type=int, default=0, help="Seed of the corpus generators (default: 0)")
+    suite.add_argument("--max-length", type=int, default=30, help="max_audio_length in seconds (default: 30)")
+    suite.add_argument("--segment", action="store_true", help="Segment the source files into --max-length windows")
+    suite.add_argument("--batch-size", type=int, default=8, help="Processor batch size (default: 8)")
+    suite.add_argument("--workers", type=int, default=1, help="Worker processes (default: 1)")
+    suite.add_argument("--repeats", type=int, default=3, help="End-to-end passes to take the median of (default: 3)")
+    suite.add_argument("--audio-codes", action="store_true", help="Also time tokenize_audio with the stand-in codec")
+    suite.add_argument("--json", help="Baseline file to write (default: benchmark_results/suite-<commit>.json)")
+    suite.set_defaults(run=benchmark_suite)
+
+    compare = subparsers.add_parser("compare", help="Compare two suite baselines")
+    compare.add_argument("baseline", help="Baseline JSON, e.g. from the previous commit")
+    compare.add_argument("current", help="JSON to check against the baseline")
+    compare.add_argument("--tolerance", type=float, default=0.1,
+                         help="Relative change counted as a regression (default: 0.1)")
+    compare.set_defaults(run=benchmark_compare)
+
+    viz = subparsers.add_parser("viz", help="Time to render quality control figures before and after")
+    viz.add_argument("--samples", type=int, nargs="+", default=[5, 500], help="Sample counts to render (default: 5 500)")
+    viz.add_argument("--duration", type=float, default=30.0, help="Seconds per clip (default: 30)")
+    viz.add_argument("--workers", type=int, default=cpu_count, help=f"Rendering processes (default: {cpu_count})")
+    viz.add_argument("--dpi", type=int, default=100, help="Resolution of the new figures (default: 100)")
+    viz.add_argument("--legacy-samples", type=int, default=10,
+                     help="Figures to time with the previous renderer before extrapolating (default: 10)")
+    viz.add_argument("--json", help="Write the results to this JSON file")
+    viz.set_defaults(run=benchmark_viz)
+
+    args = parser.parse_args()
+    if args.benchmark == "suite" and args.duration < 10:
+        parser.error("--duration must be at least 10 seconds for the piano generator")
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark for WAV encoding and serving in the MusicGen servers
+
+Compares the previous temp-file path (scipy write -> read back -> unlink ->
+/tmp copy -> send_file) with the in-memory encoder in audio_encoding.py.
+Reports per-request time, bytes moved through read/write syscalls and peak
+Python memory allocated while building and serving the response.
+
+Usage:
+    python benchmark_wav_encoding.py --duration 30 --requests 20
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import uuid
+from typing import Dict, Optional
+import numpy as np
+import scipy.io.wavfile
+from flask import Flask, send_file
+
+from audio_encoding import encode_wav, wav_response
+
+SAMPLE_RATE = 32000
+
+
+def read_io_counters() -> Optional[Dict[str, int]]:
+    """Bytes passed through read()/write() syscalls by this process (Linux only)"""
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+        return {'read': int(counters['rchar']), 'written': int(counters['wchar'])}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def legacy_encode(audio_data: np.ndarray) -> bytes:
+    """The original MusicGenServer encoding path"""
+    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
+        scipy.io.wavfile.write(tmp_file.name, rate=SAMPLE_RATE, data=audio_data)
+        with open(tmp_file.name, 'rb') as f:
+            wav_bytes = f.read()
+        os.unlink(tmp_file.name)
+    return wav_bytes
+
+
+def create_app(audio_data: np.ndarray, sample_format: str, temp_paths: list) -> Flask:
+    app = Flask(__name__)
+
+    @app.route('/legacy')
+    def legacy():
+        wav_bytes = legacy_encode(audio_data)
+        temp_id = str(uuid.uuid4())
+        temp_path = f"/tmp/music_{temp_id}.wav"
+        with open(temp_path, 'wb') as f:
+            f.write(wav_bytes)
+        temp_paths.append(temp_path)
+        return send_file(temp_path, mimetype='audio/wav', as_attachment=True,
+                         download_name=f'generated_music_{temp_id}.wav')
+
+    @app.route('/memory')
+    def memory():
+        wav_bytes = encode_wav(audio_data, SAMPLE_RATE, sample_format)
+        return wav_response(wav_bytes, f'generated_music_{uuid.uuid4()}.wav')
+
+    return app
+
+
+def run(client, route: str, num_requests: int) -> Dict[str, float]:
+    """Issue requests against one route and average the measurements"""
+    # Warm up imports and Flask internals outside the measurement
+    client.get(route).close()
+
+    io_before = read_io_counters()
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    body_size = 0
+    for _ in range(num_requests):
+        response = client.get(route)
+        body_size = len(response.get_data())
+        response.close()
+
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    io_after = read_io_counters()
+
+    result = {
+        'response_bytes': body_size,
+        'ms_per_request': elapsed / num_requests * 1000,
+        'peak_traced_mb': peak / 1024 / 1024,
+    }
+    if io_before and io_after:
+        result['syscall_bytes_read_per_request'] = (io_after['read'] - io_before['read']) / num_requests
+        result['syscall_bytes_written_per_request'] = (io_after['written'] - io_before['written']) / num_requests
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark WAV encoding for the MusicGen servers")
+    parser.add_argument("--duration", type=float, default=30.0, help="Audio duration in seconds (default: 30)")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per path (default: 20)")
+    parser.add_argument("--format", choices=["float32", "int16"], default="float32",
+                        help="Sample format for the in-memory path (default: float32)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    audio_data = (rng.standard_normal(int(args.duration * SAMPLE_RATE)) * 0.1).astype(np.float32)
+
+    temp_paths = []
+    client = create_app(audio_data, args.format, temp_paths).test_client()
+
+    print(f"🎵 WAV encoding benchmark: {args.duration:.0f}s of audio, {args.requests} requests per path")
+    print("=" * 60)
+
+    for label, route in [("temp files (before)", "/legacy"), (f"in-memory {args.format} (after)", "/memory")]:
+        result = run(client, route, args.requests)
+        print(f"\n{label}:")
+        print(f"   Response size: {result['response_bytes']:,} bytes")
+        print(f"   Time per request: {result['ms_per_request']:.2f} ms")
+        print(f"   Peak traced memory: {result['peak_traced_mb']:.1f} MB")
+        if 'syscall_bytes_read_per_request' in result:
+            print(f"   Bytes read via syscalls per request: {result['syscall_bytes_read_per_request']:,.0f}")
+            print(f"   Bytes written via syscalls per request: {result['syscall_bytes_written_per_request']:,.0f}")
+
+    # The legacy path never removed its /tmp copies; clean up after ourselves
+    for path in temp_paths:
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
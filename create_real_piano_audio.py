@@ -49,8 +49,10 @@ def generate_piano_note(frequency, duration, sample_rate=44100):
     
     return note
 
-def generate_ambient_piano_sequence(duration=30, sample_rate=44100):
-    """Generate a peaceful ambient piano sequence"""
+def generate_ambient_piano_sequence(duration=30, sample_rate=44100, rng=None):
+    """Generate a peaceful ambient piano sequence; pass a seeded np.random.Generator as rng for a reproducible one"""
+    
+    rng = rng or np.random
     
     # C major pentatonic scale for peaceful sound (C, D, E, G, A)
     notes = [261.63, 293.66, 329.63, 392.00, 440.00]  # C4, D4, E4, G4, A4
@@ -82,11 +84,11 @@ def generate_ambient_piano_sequence(duration=30, sample_rate=44100):
             audio[start_sample:end_sample] += note[:note_samples] * 0.3
         
         # Move to next note
-        current_time += note_interval + np.random.uniform(-0.5, 0.5)  # Add slight timing variation
+        current_time += note_interval + rng.uniform(-0.5, 0.5)  # Add slight timing variation
         note_index += 1
         
         # Sometimes play octave lower for depth
-        if np.random.random() < 0.3:
+        if rng.random() < 0.3:
             lower_freq = frequency / 2
             lower_note = generate_piano_note(lower_freq, note_duration * 1.5, sample_rate)
             if start_sample + len(lower_note) <= total_samples:
@@ -11,6 +11,84 @@ import os
 from pathlib import Path
 from audio_preprocessing_pipeline import AudioPreprocessingPipeline
 
+# Metadata of the example dataset
+SAMPLE_METADATA = [
+    {
+        "text": "Gentle rain sounds with soft piano melodies for deep relaxation and stress relief. The music gradually builds in warmth and then gently fades, creating a sense of inner peace and tranquility.",
+        "audio_file": "ambient_001.wav",
+        "style": "ambient",
+        "duration": "3-5",
+        "emotion": "relaxation",
+        "instruments": ["piano", "rain sounds"],
+        "therapeutic_benefit": "stress relief, deep relaxation"
+    },
+    {
+        "text": "Resonant Tibetan singing bowls with deep, spiritual frequencies layered with subtle nature sounds including distant bird calls and gentle wind. Perfect for spiritual meditation and chakra healing.",
+        "audio_file": "tibetan_001.wav",
+        "style": "tibetan",
+        "duration": "5-10",
+        "emotion": "meditation",
+        "instruments": ["singing bowls", "nature sounds"],
+        "therapeutic_benefit": "spiritual meditation, chakra healing"
+    },
+    {
+        "text": "Steady binaural beats at 40Hz for concentration and focus, accompanied by soft synthesizer pads and gentle ambient textures. The rhythm is consistent but not repetitive, maintaining attention without distraction.",
+        "audio_file": "binaural_001.wav",
+        "style": "binaural",
+        "duration": "2-3",
+        "emotion": "focus",
+        "instruments": ["binaural beats", "synthesizer"],
+        "therapeutic_benefit": "concentration, focus enhancement"
+    },
+    {
+        "text": "Soft crystal bowl harmonics with gentle reverb and ethereal overtones. The pure tones create a healing atmosphere perfect for deep meditation and energy cleansing.",
+        "audio_file": "crystal_001.wav",
+        "style": "crystal",
+        "duration": "3-5",
+        "emotion": "healing",
+        "instruments": ["crystal bowls", "reverb"],
+        "therapeutic_benefit": "energy cleansing, deep meditation"
+    },
+    {
+        "text": "Peaceful forest ambience with distant bird songs, gentle wind through leaves, and the soft sound of a flowing stream. Creates a natural sanctuary for mindfulness practice.",
+        "audio_file": "nature_001.wav",
+        "style": "nature",
+        "duration": "5-10",
+        "emotion": "peace",
+        "instruments": ["bird songs", "wind", "stream"],
+        "therapeutic_benefit": "mindfulness, natural connection"
+    }
+]
+
+# Synthetic stand-ins for the example audio files
+DEMO_SOUNDS = {
+    "ambient_001.wav": {
+        "frequencies": [220, 330, 440],  # Piano-like
+        "duration": 180,  # 3 minutes
+        "description": "Gentle piano-like tones"
+    },
+    "tibetan_001.wav": {
+        "frequencies": [256, 384, 512],  # Tibetan bowl-like
+        "duration": 300,  # 5 minutes
+        "description": "Tibetan bowl harmonics"
+    },
+    "binaural_001.wav": {
+        "frequencies": [440, 444],  # Binaural beats
+        "duration": 120,  # 2 minutes
+        "description": "40Hz binaural beats"
+    },
+    "crystal_001.wav": {
+        "frequencies": [440, 880, 1320],  # Crystal-like
+        "duration": 180,  # 3 minutes
+        "description": "Crystal bowl harmonics"
+    },
+    "nature_001.wav": {
+        "frequencies": [200, 400, 600],  # Nature-like
+        "duration": 300,  # 5 minutes
+        "description": "Nature ambience"
+    }
+}
+
 def create_sample_dataset():
     """Create a sample dataset structure for demonstration"""
     
@@ -19,56 +97,8 @@ def create_sample_dataset():
     audio_dir = dataset_dir / "audio"
     audio_dir.mkdir(parents=True, exist_ok=True)
     
-    # Create sample metadata
-    sample_metadata = [
-        {
-            "text": "Gentle rain sounds with soft piano melodies for deep relaxation and stress relief. The music gradually builds in warmth and then gently fades, creating a sense of inner peace and tranquility.",
-            "audio_file": "ambient_001.wav",
-            "style": "ambient",
-            "duration": "3-5",
-            "emotion": "relaxation",
-            "instruments": ["piano", "rain sounds"],
-            "therapeutic_benefit": "stress relief, deep relaxation"
-        },
-        {
-            "text": "Resonant Tibetan singing bowls with deep, spiritual frequencies layered with subtle nature sounds including distant bird calls and gentle wind. Perfect for spiritual meditation and chakra healing.",
-            "audio_file": "tibetan_001.wav",
-            "style": "tibetan",
-            "duration": "5-10",
-            "emotion": "meditation",
-            "instruments": ["singing bowls", "nature sounds"],
-            "therapeutic_benefit": "spiritual meditation, chakra healing"
-        },
-        {
-            "text": "Steady binaural beats at 40Hz for concentration and focus, accompanied by soft synthesizer pads and gentle ambient textures. The rhythm is consistent but not repetitive, maintaining attention without distraction.",
-            "audio_file": "binaural_001.wav",
-            "style": "binaural",
-            "duration": "2-3",
-            "emotion": "focus",
-            "instruments": ["binaural beats", "synthesizer"],
-            "therapeutic_benefit": "concentration, focus enhancement"
-        },
-        {
-            "text": "Soft crystal bowl harmonics with gentle reverb and ethereal overtones. The pure tones create a healing atmosphere perfect for deep meditation and energy cleansing.",
-            "audio_file": "crystal_001.wav",
-            "style": "crystal",
-            "duration": "3-5",
-            "emotion": "healing",
-            "instruments": ["crystal bowls", "reverb"],
-            "therapeutic_benefit": "energy cleansing, deep meditation"
-        },
-        {
-            "text": "Peaceful forest ambience with distant bird songs, gentle wind through leaves, and the soft sound of a flowing stream. Creates a natural sanctuary for mindfulness practice.",
-            "audio_file": "nature_001.wav",
-            "style": "nature",
-            "duration": "5-10",
-            "emotion": "peace",
-            "instruments": ["bird songs", "wind", "stream"],
-            "therapeutic_benefit": "mindfulness, natural connection"
-        }
-    ]
-    
     # Save metadata
+    sample_metadata = SAMPLE_METADATA
     metadata_file = dataset_dir / "metadata.json"
     with open(metadata_file, 'w') as f:
         json.dump(sample_metadata, f, indent=2)
@@ -81,75 +111,51 @@ def create_sample_dataset():
     
     return dataset_dir
 
-def create_demo_audio_files():
-    """Create demo audio files for testing (sine wave examples)"""
+def synthesize_demo_sound(frequencies, duration, sample_rate=32000):
+    """Mixed sine tones with slow amplitude modulation and 2-second fades, peak-normalized"""
     
     import numpy as np
     import librosa
     
-    audio_dir = Path("healing_music_dataset/audio")
+    # Generate sine wave audio
+    duration_samples = int(duration * sample_rate)
+    t = np.linspace(0, duration, duration_samples, False)
     
-    # Create different demo sounds
-    demo_sounds = {
-        "ambient_001.wav": {
-            "frequencies": [220, 330, 440],  # Piano-like
-            "duration": 180,  # 3 minutes
-            "description": "Gentle piano-like tones"
-        },
-        "tibetan_001.wav": {
-            "frequencies": [256, 384, 512],  # Tibetan bowl-like
-            "duration": 300,  # 5 minutes
-            "description": "Tibetan bowl harmonics"
-        },
-        "binaural_001.wav": {
-            "frequencies": [440, 444],  # Binaural beats
-            "duration": 120,  # 2 minutes
-            "description": "40Hz binaural beats"
-        },
-        "crystal_001.wav": {
-            "frequencies": [440, 880, 1320],  # Crystal-like
-            "duration": 180,  # 3 minutes
-            "description": "Crystal bowl harmonics"
-        },
-        "nature_001.wav": {
-            "frequencies": [200, 400, 600],  # Nature-like
-            "duration": 300,  # 5 minutes
-            "description": "Nature ambience"
-        }
-    }
+    # Mix multiple frequencies
+    audio = np.zeros_like(t)
+    for i, freq in enumerate(frequencies):
+        amplitude = 0.3 / len(frequencies) * (1 - i * 0.1)
+        audio += amplitude * np.sin(2 * np.pi * freq * t)
+    
+    # Add gentle amplitude modulation
+    audio *= 0.5 + 0.5 * np.sin(2 * np.pi * 0.1 * t)
+    
+    # Apply fade in/out
+    fade_samples = min(int(2 * sample_rate), duration_samples // 2)  # 2 second fade
+    audio[:fade_samples] *= np.linspace(0, 1, fade_samples)
+    audio[len(audio) - fade_samples:] *= np.linspace(1, 0, fade_samples)
     
+    # Normalize
+    return librosa.util.normalize(audio)
+
+def create_demo_audio_files(audio_dir="healing_music_dataset/audio"):
+    """Create demo audio files for testing (sine wave examples)"""
+    
+    import soundfile as sf
+    
+    audio_dir = Path(audio_dir)
     sample_rate = 32000  # MusicGen requirement
     
-    for filename, config in demo_sounds.items():
+    for filename, config in DEMO_SOUNDS.items():
         filepath = audio_dir / filename
-        
-        # Generate sine wave audio
-        duration_samples = config['duration'] * sample_rate
-        t = np.linspace(0, config['duration'], duration_samples, False)
-        
-        # Mix multiple frequencies
-        audio = np.zeros_like(t)
-        for i, freq in enumerate(config['frequencies']):
-            amplitude = 0.3 / len(config['frequencies']) * (1 - i * 0.1)
-            audio += amplitude * np.sin(2 * np.pi * freq * t)
-        
-        # Add gentle amplitude modulation
-        audio *= 0.5 + 0.5 * np.sin(2 * np.pi * 0.1 * t)
-        
-        # Apply fade in/out
-        fade_samples = int(2 * sample_rate)  # 2 second fade
-        audio[:fade_samples] *= np.linspace(0, 1, fade_samples)
-        audio[-fade_samples:] *= np.linspace(1, 0, fade_samples)
-        
-        # Normalize
-        audio = librosa.util.normalize(audio)
+        audio = synthesize_demo_sound(config['frequencies'], config['duration'], sample_rate)
         
         # Save as WAV
-        librosa.output.write_wav(filepath, audio, sample_rate)
+        sf.write(filepath, audio, sample_rate)
         
         print(f"   🎵 Created: {filename} ({config['description']})")
     
-    print(f"✅ Created {len(demo_sounds)} demo audio files")
+    print(f"✅ Created {len(DEMO_SOUNDS)} demo audio files")
 
 def run_preprocessing_example():
     """Run the preprocessing pipeline on the sample dataset"""
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Prometheus metrics for the MusicGen server
+Per-stage timings of a generation, labeled by style and duration bucket
+"""
+
+from typing import Iterable, Tuple
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, Histogram, generate_latest
+
+# Requested durations are grouped into these buckets (seconds) to keep label cardinality low
+DURATION_BUCKETS = (10, 30, 120, 600)
+
+REQUEST_LABELS = ("style", "duration_bucket")
+
+TOKENIZE_SECONDS = Histogram(
+    "musicgen_tokenize_seconds",
+    "Time spent in the processor tokenizing prompts",
+    REQUEST_LABELS,
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+GENERATE_SECONDS = Histogram(
+    "musicgen_generate_seconds",
+    "Time spent in model.generate",
+    REQUEST_LABELS,
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+)
+TOKENS_PER_SECOND = Histogram(
+    "musicgen_tokens_per_second",
+    "Decoder tokens generated per second for each sequence",
+    REQUEST_LABELS,
+    buckets=(1, 2.5, 5, 10, 25, 50, 75, 100, 150, 250, 500)
+)
+ENCODE_SECONDS = Histogram(
+    "musicgen_wav_encode_seconds",
+    "Time spent encoding generated audio as WAV",
+    REQUEST_LABELS,
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5)
+)
+REQUEST_SECONDS = Histogram(
+    "musicgen_request_seconds",
+    "Total latency of a generation request, including queueing and cache lookups",
+    REQUEST_LABELS,
+    buckets=(0.05, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+)
+
+QUEUE_DEPTH = Gauge(
+    "musicgen_queue_depth",
+    "Requests waiting for the model, by queue",
+    ("queue",) + REQUEST_LABELS
+)
+IN_FLIGHT = Gauge(
+    "musicgen_in_flight_requests",
+    "Generation requests currently being served",
+    REQUEST_LABELS
+)
+MODEL_MEMORY_BYTES = Gauge(
+    "musicgen_model_memory_bytes",
+    "Memory held by the weights of each loaded model",
+    ("model",)
+)
+
+
+def duration_bucket(duration: float) -> str:
+    """Label for the duration bucket a request falls into, e.g. "<=30s" """
+    for limit in DURATION_BUCKETS:
+        if duration <= limit:
+            return f"<={limit}s"
+    return f">{DURATION_BUCKETS[-1]}s"
+
+
+def request_labels(style: str, duration: float) -> Tuple[str, str]:
+    """Label values shared by every per-request metric"""
+    return style, duration_bucket(duration)
+
+
+def set_queue_depth(waiting: Iterable[Tuple[str, str, float]]):
+    """Replace the queue depth gauge with the (queue, style, duration) of every waiting request"""
+    counts = {}
+    for queue_name, style, duration in waiting:
+        key = (queue_name,) + request_labels(style, duration)
+        counts[key] = counts.get(key, 0) + 1
+
+    # Buckets that drained since the last scrape must drop back to zero
+    QUEUE_DEPTH.clear()
+    for key, count in counts.items():
+        QUEUE_DEPTH.labels(*key).set(count)
+
+
+def set_model_memory(resident: Iterable[Tuple[str, int]]):
+    """Replace the model memory gauge with the (model, bytes) of every registered model"""
+    MODEL_MEMORY_BYTES.clear()
+    for model, size in resident:
+        MODEL_MEMORY_BYTES.labels(model).set(size)
+
+
+def render() -> Tuple[bytes, str]:
+    """Metrics in the Prometheus text exposition format, with their content type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
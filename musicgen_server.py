@@ -4,16 +4,30 @@ MusicGen-Medium server for mindful sound scapes
 Provides REST API endpoint for generating music using MusicGen-medium model
 """
 
+import hashlib
+import json
+import math
 import os
+import queue
 import tempfile
+import threading
+import time
 import uuid
-from typing import Optional, Dict, Any
+import wave
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Tuple, Iterator
+import numpy as np
 import torch
 from transformers import MusicgenForConditionalGeneration, AutoProcessor
-import scipy.io.wavfile
-from flask import Flask, request, jsonify, send_file
+from transformers.generation.streamers import BaseStreamer
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 import logging
 from werkzeug.exceptions import BadRequest
+from werkzeug.serving import WSGIRequestHandler
+from audio_encoding import encode_pcm, encode_wav, wav_header, wav_response
+import generation_metrics as metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,154 +35,1509 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+SAMPLE_RATE = 32000
+TOKENS_PER_SECOND = 50
+# Shorter requests are rounded up; a few frames of MusicGen output are not usable audio
+MIN_DURATION_SECONDS = 1.0
+MODEL_NAME = os.environ.get('MUSICGEN_MODEL', "facebook/musicgen-medium")
+
+# Short names accepted in the "model" field of a request
+MODEL_ALIASES = {
+    "small": "facebook/musicgen-small",
+    "medium": "facebook/musicgen-medium",
+}
+
+# Fine-tuned checkpoints can be requested by their directory name under MODELS_DIR
+MODELS_DIR = os.environ.get('MODELS_DIR', 'models')
+MODEL_MEMORY_BUDGET_MB = float(os.environ.get('MODEL_MEMORY_BUDGET_MB', 8192))
+
+# Long-form generation: window length, conditioning context and crossfade (seconds)
+LONG_FORM_WINDOW_SECONDS = float(os.environ.get('LONG_FORM_WINDOW_SECONDS', 30))
+LONG_FORM_CONTEXT_SECONDS = float(os.environ.get('LONG_FORM_CONTEXT_SECONDS', 10))
+LONG_FORM_CROSSFADE_SECONDS = float(os.environ.get('LONG_FORM_CROSSFADE_SECONDS', 2))
+LONG_FORM_MAX_SECONDS = float(os.environ.get('LONG_FORM_MAX_SECONDS', 3600))
+
+# Startup warm-up and compiled decoder
+WARMUP_ON_STARTUP = os.environ.get('WARMUP_ON_STARTUP', '1') == '1'
+WARMUP_BATCH_SIZE = int(os.environ.get('WARMUP_BATCH_SIZE', 1))
+TORCH_COMPILE = os.environ.get('TORCH_COMPILE', '0') == '1'
+
+# Numeric precision: "fp32", "int8" (dynamic quantization, CPU only) or "bf16"
+MUSICGEN_PRECISION = os.environ.get('MUSICGEN_PRECISION', 'fp32')
+PRECISIONS = ("fp32", "int8", "bf16")
+
+# Sample format of generated WAV files: "float32" (lossless) or "int16" (half the size)
+WAV_SAMPLE_FORMAT = os.environ.get('WAV_SAMPLE_FORMAT', 'float32')
+
+# Text prepended to the prompt for each style; unknown styles fall back to ambient
+STYLE_CONTEXTS = {
+    "ambient": "ambient healing meditation music, soft and ethereal",
+    "nature": "natural sounds with gentle instrumental accompaniment",
+    "binaural": "binaural beats for focus and relaxation",
+    "tibetan": "tibetan singing bowls with meditation ambience",
+    "piano": "peaceful piano melodies for healing and relaxation",
+    "crystal": "crystal bowl harmonics with healing frequencies",
+    "meditation": "deep meditation music with soft drones",
+    "chakra": "chakra healing frequencies with harmonic tones"
+}
+
+# Sampling parameters passed to model.generate (also part of the cache key)
+GENERATION_PARAMS = {
+    "do_sample": True,
+    "temperature": 0.7,
+    "top_k": 250,
+    "top_p": 0.95
+}
+
+class AudioStreamer(BaseStreamer):
+    """
+    Decodes MusicGen tokens to audio while generation is still running.
+    
+    model.generate hands every new step of codebook tokens to ``put``. Every
+    ``play_steps`` steps the tokens so far are undone from the delay pattern and
+    run through the audio encoder's decoder; the audio that will no longer change
+    (everything but the last ``stride`` samples) is pushed to a queue that the
+    HTTP response drains.
+    """
+    
+    def __init__(self, model, play_steps: int = 50, timeout: Optional[float] = None):
+        self.decoder = model.decoder
+        self.audio_encoder = model.audio_encoder
+        self.generation_config = model.generation_config
+        self.play_steps = play_steps
+        self.timeout = timeout
+        
+        # Samples at the end of each decode that may still change once more tokens arrive
+        hop_length = int(np.prod(self.audio_encoder.config.upsampling_ratios))
+        self.stride = hop_length * (play_steps - self.decoder.num_codebooks) // 6
+        
+        self.token_cache = None
+        self.to_yield = 0
+        self.audio_queue: "queue.Queue" = queue.Queue()
+        self.stop_signal = object()
+        # Set once the stop signal or an error is queued, so the stream is closed exactly once
+        self.closed = False
+    
+    def decode(self, input_ids: torch.Tensor) -> np.ndarray:
+        """Undo the codebook delay pattern and decode the tokens to a waveform"""
+        _, delay_pattern_mask = self.decoder.build_delay_pattern_mask(
+            input_ids[:, :1],
+            pad_token_id=self.generation_config.decoder_start_token_id,
+            max_length=input_ids.shape[-1]
+        )
+        input_ids = self.decoder.apply_delay_pattern_mask(input_ids, delay_pattern_mask)
+        
+        # Drop the padding introduced by the delay pattern
+        input_ids = input_ids[input_ids != self.generation_config.pad_token_id].reshape(
+            1, self.decoder.num_codebooks, -1
+        )
+        input_ids = input_ids[None, ...].to(self.audio_encoder.device)
+        
+        output_values = self.audio_encoder.decode(input_ids, audio_scales=[None])
+        return output_values.audio_values[0, 0].cpu().float().numpy()
+    
+    def put(self, value: torch.Tensor):
+        if value.shape[0] // self.decoder.num_codebooks > 1:
+            raise ValueError("AudioStreamer only supports a batch size of 1")
+        
+        if self.token_cache is None:
+            self.token_cache = value
+        else:
+            self.token_cache = torch.cat([self.token_cache, value[:, None]], dim=-1)
+        
+        if self.token_cache.shape[-1] % self.play_steps == 0:
+            audio_values = self.decode(self.token_cache)
+            self.audio_queue.put(audio_values[self.to_yield:-self.stride])
+            self.to_yield = len(audio_values) - self.stride
+    
+    def end(self):
+        if self.token_cache is not None:
+            audio_values = self.decode(self.token_cache)
+            self.audio_queue.put(audio_values[self.to_yield:])
+        self.audio_queue.put(self.stop_signal)
+        self.closed = True
+    
+    def finish(self, audio_values: Optional[torch.Tensor] = None):
+        """
+        Close the stream once model.generate has returned
+        
+        Some generate implementations only hand the prompt to ``put`` and never
+        call ``end``. When no sampled step reached the streamer, the audio that
+        generate returned is queued as the final chunk instead.
+        """
+        if self.closed:
+            return
+        if audio_values is not None and (self.token_cache is None or self.token_cache.shape[-1] <= 1):
+            audio = audio_values[0, 0].cpu().float().numpy()
+            self.audio_queue.put(audio[self.to_yield:])
+            self.audio_queue.put(self.stop_signal)
+            self.closed = True
+        else:
+            self.end()
+    
+    def fail(self, error: Exception):
+        """Hand a generation error over to the consuming thread"""
+        self.audio_queue.put(error)
+        self.closed = True
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self) -> np.ndarray:
+        value = self.audio_queue.get(timeout=self.timeout)
+        if value is self.stop_signal:
+            raise StopIteration()
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+def style_label(style: str) -> str:
+    """Metrics label for a requested style; free-form styles are grouped as "other" """
+    return style if style in STYLE_CONTEXTS else "other"
+
+def bf16_supported(device: str) -> bool:
+    """Whether bfloat16 matmuls are natively supported on ``device``"""
+    if device == "cuda":
+        return torch.cuda.is_bf16_supported()
+    # Without AVX512-BF16/AMX, CPU bf16 is emulated and slower than fp32
+    check = getattr(torch.cpu, "_is_avx512_bf16_supported", None)
+    return bool(check and check())
+
+def apply_precision(model, precision: str, device: str):
+    """
+    Convert a loaded MusicGen model to the requested precision
+    
+    int8 applies dynamic quantization to the linear layers of the text encoder
+    and the decoder (weights stored as int8, activations quantized on the fly).
+    The EnCodec audio encoder stays in fp32; it is convolutional and a small
+    share of generation time. bf16 casts the whole model.
+    
+    Returns:
+        The precision actually applied
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+    
+    if precision == "int8":
+        if device != "cpu":
+            logger.warning("int8 dynamic quantization is CPU only, keeping fp32")
+            return "fp32"
+        model.text_encoder = torch.ao.quantization.quantize_dynamic(
+            model.text_encoder, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        model.decoder = torch.ao.quantization.quantize_dynamic(
+            model.decoder, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    elif precision == "bf16":
+        if not bf16_supported(device):
+            logger.warning(f"bf16 is not natively supported on this {device}, keeping fp32")
+            return "fp32"
+        model.to(torch.bfloat16)
+    
+    return precision
+
 class MusicGenServer:
-    def __init__(self):
+    def __init__(self, model_name: str = MODEL_NAME, precision: str = MUSICGEN_PRECISION):
         self.model = None
         self.processor = None
+        self.model_name = model_name
+        self.precision = precision
+        # Batched and streaming generation share the model, so they take turns
+        self.inference_lock = threading.Lock()
+        # Serializes loads so concurrent /load-model calls cannot load twice
+        self._load_lock = threading.Lock()
+        self.warming_up = False
+        self.ready = False
+        self.load_seconds: Optional[float] = None
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         logger.info(f"Using device: {self.device}")
         
-    def load_model(self):
-        """Load MusicGen-medium model"""
+    def load_model(self, force: bool = False) -> bool:
+        """
+        Load the MusicGen model
+        
+        Idempotent: returns False without doing anything when the model is
+        already loaded, unless ``force`` asks for a reload.
+        """
+        with self._load_lock:
+            if self.model is not None and not force:
+                return False
+            
+            try:
+                logger.info(f"Loading {self.model_name}...")
+                start = time.monotonic()
+                processor = AutoProcessor.from_pretrained(self.model_name)
+                model = MusicgenForConditionalGeneration.from_pretrained(self.model_name)
+                model.to(self.device)
+                model.eval()
+                precision = apply_precision(model, self.precision, self.device)
+                if TORCH_COMPILE:
+                    self.compile_decoder(model)
+                
+                # Swap under the inference lock so a reload never lands mid-generation
+                with self.inference_lock:
+                    self.processor = processor
+                    self.model = model
+                    self.precision = precision
+                    self.load_seconds = time.monotonic() - start
+                    # Without a warm-up pass the model is ready as soon as it is loaded
+                    self.ready = not WARMUP_ON_STARTUP
+                logger.info(f"Model loaded successfully! (precision: {precision})")
+                return True
+            except Exception as e:
+                logger.error(f"Failed to load model: {e}")
+                raise
+    
+    def unload(self):
+        """Drop the model and processor so their memory can be reclaimed"""
+        with self._load_lock, self.inference_lock:
+            if self.model is None:
+                return
+            self.model = None
+            self.processor = None
+            self.ready = False
+        
+        if self.device == "cuda":
+            torch.cuda.empty_cache()
+        logger.info(f"Unloaded {self.model_name}")
+    
+    def resident_bytes(self) -> int:
+        """Bytes held by the model's weights and buffers (0 when not loaded)"""
+        model = self.model
+        if model is None:
+            return 0
+        return sum(
+            tensor.numel() * tensor.element_size()
+            for tensor in model.state_dict().values()
+            if isinstance(tensor, torch.Tensor)
+        )
+    
+    def compile_decoder(self, model):
+        """Compile the decoder forward pass, which dominates generation time"""
         try:
-            logger.info("Loading MusicGen-medium model...")
-            self.processor = AutoProcessor.from_pretrained("facebook/musicgen-medium")
-            self.model = MusicgenForConditionalGeneration.from_pretrained("facebook/musicgen-medium")
-            self.model.to(self.device)
-            logger.info("Model loaded successfully!")
+            # Shapes change every step as the KV cache grows, so compile for dynamic shapes
+            model.decoder.forward = torch.compile(model.decoder.forward, dynamic=True)
+            logger.info("Decoder compiled with torch.compile")
         except Exception as e:
-            logger.error(f"Failed to load model: {e}")
-            raise
+            logger.warning(f"torch.compile unavailable, using eager decoder: {e}")
+    
+    def warm_up(self, token_budgets: List[int], batch_size: int = 1):
+        """
+        Run one representative generation per duration bucket
+        
+        The first generations after loading pay for kernel selection, allocator
+        growth and (with TORCH_COMPILE) compilation. Doing that here keeps it out
+        of user requests; ``ready`` is only set once every bucket has run.
+        """
+        self.warming_up = True
+        try:
+            self.load_model()
+            prompts = [self.enhance_prompt("warm-up", "ambient")] * max(1, batch_size)
+            for max_new_tokens in token_budgets:
+                start = time.monotonic()
+                self.generate_batch(prompts, max_new_tokens)
+                logger.info(f"Warm-up for {max_new_tokens} tokens took {time.monotonic() - start:.2f}s")
+            self.ready = True
+            logger.info("Warm-up complete, server is ready")
+        finally:
+            self.warming_up = False
+    
+    @property
+    def model_id(self) -> str:
+        """Model name plus precision, since both change the generated audio"""
+        return f"{self.model_name}@{self.precision}"
+    
+    def prepare_inputs(self, text: List[str], audio: Optional[np.ndarray] = None):
+        """Run the processor and move its tensors to the model's device and dtype"""
+        if audio is None:
+            inputs = self.processor(text=text, padding=True, return_tensors="pt")
+        else:
+            inputs = self.processor(
+                audio=audio,
+                sampling_rate=SAMPLE_RATE,
+                text=text,
+                padding=True,
+                return_tensors="pt"
+            )
+        
+        inputs = inputs.to(self.device)
+        if "input_values" in inputs:
+            # Audio prompts must match the model dtype when running in bf16
+            dtype = next(self.model.audio_encoder.parameters()).dtype
+            inputs["input_values"] = inputs["input_values"].to(dtype)
+        return inputs
     
     def enhance_prompt(self, prompt: str, style: str) -> str:
         """Enhance prompt with style-specific context"""
-        style_contexts = {
-            "ambient": "ambient healing meditation music, soft and ethereal",
-            "nature": "natural sounds with gentle instrumental accompaniment",
-            "binaural": "binaural beats for focus and relaxation",
-            "tibetan": "tibetan singing bowls with meditation ambience",
-            "piano": "peaceful piano melodies for healing and relaxation",
-            "crystal": "crystal bowl harmonics with healing frequencies",
-            "meditation": "deep meditation music with soft drones",
-            "chakra": "chakra healing frequencies with harmonic tones"
-        }
-        
-        context = style_contexts.get(style, style_contexts["ambient"])
+        context = STYLE_CONTEXTS.get(style, STYLE_CONTEXTS["ambient"])
         return f"{context}, {prompt}"
     
-    def generate_music(self, prompt: str, style: str = "ambient", duration: float = 10.0) -> bytes:
-        """Generate music using MusicGen-medium"""
+    def generate_batch(self, prompts: List[str], max_new_tokens: int,
+                       seed: Optional[int] = None,
+                       timings: Optional[Dict[str, float]] = None) -> List[np.ndarray]:
+        """
+        Generate audio for several prompts with a single model.generate call
+        
+        When ``timings`` is given, the seconds spent in the processor and in
+        model.generate are stored under "tokenize" and "generate".
+        """
         if self.model is None:
             self.load_model()
         
+        # Pad all prompts together so they share one forward pass
+        start = time.perf_counter()
+        inputs = self.prepare_inputs(prompts)
+        tokenized = time.perf_counter()
+        
+        with self.inference_lock, torch.inference_mode():
+            if seed is not None:
+                torch.manual_seed(seed)
+            generate_start = time.perf_counter()
+            audio_values = self.model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                **GENERATION_PARAMS
+            )
+            generated = time.perf_counter()
+        
+        if timings is not None:
+            timings["tokenize"] = tokenized - start
+            timings["generate"] = generated - generate_start
+        return [audio_values[i, 0].float().cpu().numpy() for i in range(len(prompts))]
+    
+    def generate_music(self, prompt: str, style: str = "ambient", duration: float = 10.0,
+                       seed: Optional[int] = None) -> bytes:
+        """Generate music using MusicGen-medium"""
+        labels = metrics.request_labels(style_label(style), duration)
+        start = time.perf_counter()
         try:
-            # Enhance prompt
-            enhanced_prompt = self.enhance_prompt(prompt, style)
-            logger.info(f"Generating music for prompt: {enhanced_prompt}")
+            with metrics.IN_FLIGHT.labels(*labels).track_inprogress():
+                # Enhance prompt
+                enhanced_prompt = self.enhance_prompt(prompt, style)
+                
+                # Only seeded generations are deterministic, so only they are cached
+                cache_key = None
+                cached = None
+                if seed is not None and result_cache is not None:
+                    cache_key = result_cache.make_key(enhanced_prompt, duration, seed, self.model_id)
+                    cached = result_cache.get(cache_key)
+                
+                if cached is not None:
+                    logger.info(f"Serving cached audio for prompt: {enhanced_prompt}")
+                    wav_bytes = cached
+                else:
+                    logger.info(f"Generating music for prompt: {enhanced_prompt}")
+                    
+                    # Concurrent requests are merged into shared generate calls
+                    audio_data = batch_scheduler.submit(self, enhanced_prompt, duration, seed, style).result()
+                    
+                    encode_start = time.perf_counter()
+                    wav_bytes = encode_wav(audio_data, SAMPLE_RATE, WAV_SAMPLE_FORMAT)
+                    metrics.ENCODE_SECONDS.labels(*labels).observe(time.perf_counter() - encode_start)
+                    logger.info(f"Generated {len(wav_bytes)} bytes of audio")
+                    
+                    if cache_key is not None:
+                        result_cache.put(cache_key, wav_bytes)
             
-            # Prepare inputs
-            inputs = self.processor(
-                text=[enhanced_prompt],
-                padding=True,
-                return_tensors="pt"
-            ).to(self.device)
+            metrics.REQUEST_SECONDS.labels(*labels).observe(time.perf_counter() - start)
+            return wav_bytes
             
-            # Generate audio
-            with torch.no_grad():
-                audio_values = self.model.generate(
-                    **inputs,
-                    max_new_tokens=int(duration * 50),  # ~50 tokens per second
-                    do_sample=True,
-                    temperature=0.7,
-                    top_k=250,
-                    top_p=0.95
-                )
+        except Exception as e:
+            logger.error(f"Music generation failed: {e}")
+            raise
+    
+    def stream_music(self, prompt: str, style: str = "ambient", duration: float = 10.0,
+                     seed: Optional[int] = None, chunk_seconds: float = 1.0) -> Iterator[np.ndarray]:
+        """Start generating a single prompt and return an iterator over its decoded audio chunks"""
+        if self.model is None:
+            self.load_model()
+        
+        enhanced_prompt = self.enhance_prompt(prompt, style)
+        logger.info(f"Streaming music for prompt: {enhanced_prompt}")
+        
+        inputs = self.prepare_inputs([enhanced_prompt])
+        
+        play_steps = max(self.model.decoder.num_codebooks + 1, int(chunk_seconds * TOKENS_PER_SECOND))
+        streamer = AudioStreamer(self.model, play_steps=play_steps, timeout=300)
+        # The codebook delay pattern holds back the last num_codebooks - 1 frames
+        max_new_tokens = int(np.ceil(duration * TOKENS_PER_SECOND)) + self.model.decoder.num_codebooks - 1
+        
+        def run():
+            try:
+                with self.inference_lock, torch.inference_mode():
+                    if seed is not None:
+                        torch.manual_seed(seed)
+                    audio_values = self.model.generate(
+                        **inputs,
+                        max_new_tokens=max_new_tokens,
+                        streamer=streamer,
+                        **GENERATION_PARAMS
+                    )
+                    streamer.finish(audio_values)
+            except Exception as e:
+                logger.error(f"Streaming generation failed: {e}")
+                streamer.fail(e)
+            finally:
+                # Never leave the response waiting on the queue timeout
+                if not streamer.closed:
+                    streamer.fail(RuntimeError("Streaming generation stopped without closing the stream"))
+        
+        threading.Thread(target=run, name="stream-generate", daemon=True).start()
+        return self._drain_stream(streamer, int(duration * SAMPLE_RATE))
+    
+    @staticmethod
+    def _drain_stream(streamer: AudioStreamer, total_samples: int) -> Iterator[np.ndarray]:
+        """Yield streamed chunks up to the requested length, consuming the rest"""
+        remaining = total_samples
+        for chunk in streamer:
+            if remaining <= 0:
+                continue
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+            if len(chunk):
+                yield chunk
+
+    def continue_audio(self, enhanced_prompt: str, context: np.ndarray, max_new_tokens: int,
+                       seed: Optional[int] = None) -> np.ndarray:
+        """Generate a continuation of ``context``; the result starts with the re-decoded context"""
+        if self.model is None:
+            self.load_model()
+        
+        inputs = self.prepare_inputs([enhanced_prompt], audio=context)
+        
+        with self.inference_lock, torch.inference_mode():
+            if seed is not None:
+                torch.manual_seed(seed)
+            audio_values = self.model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                **GENERATION_PARAMS
+            )
+        
+        return audio_values[0, 0].float().cpu().numpy()
+    
+    def generate_long_form(self, prompt: str, style: str = "ambient", duration: float = 600.0,
+                           seed: Optional[int] = None) -> Iterator[np.ndarray]:
+        """
+        Generate audio of arbitrary length as a sequence of overlapping windows
+        
+        Each window after the first is conditioned on the last
+        LONG_FORM_CONTEXT_SECONDS of the previous one through audio-prompt
+        continuation. Where windows meet, the held-back end of the previous
+        window is joined to the start of the new one with an equal-power
+        crossfade. Only the conditioning context and the current window are
+        kept in memory, so peak memory does not depend on ``duration``.
+        
+        Yields:
+            Float32 chunks that add up to exactly ``duration`` seconds
+        """
+        enhanced_prompt = self.enhance_prompt(prompt, style)
+        logger.info(f"Generating {duration:.0f}s long-form music for prompt: {enhanced_prompt}")
+        
+        # Keep the context on codec frame boundaries so it re-encodes cleanly
+        hop = SAMPLE_RATE // TOKENS_PER_SECOND
+        window = int(LONG_FORM_WINDOW_SECONDS * SAMPLE_RATE)
+        context_len = max(hop, int(LONG_FORM_CONTEXT_SECONDS * SAMPLE_RATE) // hop * hop)
+        crossfade = min(int(LONG_FORM_CROSSFADE_SECONDS * SAMPLE_RATE), context_len)
+        if window <= context_len:
+            raise ValueError("LONG_FORM_WINDOW_SECONDS must be longer than LONG_FORM_CONTEXT_SECONDS")
+        
+        fade_in = np.sin(np.linspace(0.0, np.pi / 2, crossfade, dtype=np.float32))
+        fade_out = np.cos(np.linspace(0.0, np.pi / 2, crossfade, dtype=np.float32))
+        
+        total = int(duration * SAMPLE_RATE)
+        emitted = 0
+        index = 0
+        
+        first = self.generate_batch(
+            [enhanced_prompt], int(min(window, total) / SAMPLE_RATE * TOKENS_PER_SECOND), seed
+        )[0].astype(np.float32)
+        context = first[-context_len:].copy()
+        held = first[-crossfade:].copy()
+        body = first[:-crossfade] if crossfade else first
+        del first
+        
+        while True:
+            chunk = body[:total - emitted]
+            if len(chunk):
+                yield chunk
+                emitted += len(chunk)
+            if emitted + len(held) >= total:
+                break
             
-            # Convert to numpy and save as WAV
-            audio_data = audio_values[0, 0].cpu().numpy()
+            index += 1
+            new_tokens = int((window - len(context)) / SAMPLE_RATE * TOKENS_PER_SECOND)
+            window_seed = None if seed is None else (seed + index) % 2 ** 32
             
-            # Create temporary WAV file
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-                scipy.io.wavfile.write(tmp_file.name, rate=32000, data=audio_data)
-                
-                # Read file as bytes
-                with open(tmp_file.name, 'rb') as f:
-                    wav_bytes = f.read()
+            start = time.monotonic()
+            audio = self.continue_audio(enhanced_prompt, context, new_tokens, window_seed).astype(np.float32)
+            logger.info(f"Long-form window {index} generated in {time.monotonic() - start:.2f}s")
+            
+            # audio[:len(context)] re-decodes the prompt; blend over the held-back samples
+            overlap = audio[len(context) - len(held):len(context)]
+            new_audio = audio[len(context):]
+            if len(new_audio) <= crossfade:
+                # The model stopped early; pad with silence rather than looping
+                overlap = np.pad(overlap, (0, len(held) - len(overlap)))
+                new_audio = np.zeros(window - len(context), dtype=np.float32)
+            
+            joined = held * fade_out[:len(held)] + overlap * fade_in[:len(held)]
+            context = np.concatenate([context, new_audio])[-context_len:]
+            held = new_audio[-crossfade:].copy() if crossfade else new_audio[:0]
+            body = np.concatenate([joined, new_audio[:len(new_audio) - len(held)]])
+            del audio
+        
+        # Flush the held-back tail and pad to the exact requested length
+        tail = held[:total - emitted]
+        if len(tail):
+            yield tail
+            emitted += len(tail)
+        if emitted < total:
+            yield np.zeros(total - emitted, dtype=np.float32)
+    
+    def write_long_form(self, output_path: str, prompt: str, style: str = "ambient",
+                        duration: float = 600.0, seed: Optional[int] = None) -> str:
+        """Write long-form audio to a 16-bit WAV file segment by segment"""
+        with wave.open(output_path, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(SAMPLE_RATE)
+            for chunk in self.generate_long_form(prompt, style, duration, seed):
+                wav_file.writeframes(encode_pcm(chunk))
+        
+        logger.info(f"Wrote long-form audio to {output_path}")
+        return output_path
+
+class PendingGeneration:
+    """A single prompt waiting to be placed in a batch"""
+    
+    def __init__(self, server: MusicGenServer, prompt: str, duration: float, seed: Optional[int] = None,
+                 style: str = "ambient"):
+        self.server = server
+        self.prompt = prompt
+        self.duration = duration
+        self.seed = seed
+        self.style = style
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+
+class BatchScheduler:
+    """
+    Micro-batching scheduler in front of MusicGenServer.
+    
+    Requests arriving within ``window_ms`` of each other are grouped by model
+    and ``max_new_tokens`` bucket and generated together in one model.generate call.
+    Each caller receives its own waveform, trimmed to the duration it asked for.
+    Seeded requests are generated on their own so their output is reproducible.
+    """
+    
+    def __init__(self, window_ms: float = 50.0, max_batch_size: int = 4, bucket_tokens: int = 250):
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self.bucket_tokens = max(1, bucket_tokens)
+        
+        self._pending: Dict[Tuple[str, int, Optional[int]], List[PendingGeneration]] = {}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        
+        # Per-batch statistics for tuning the window
+        self._batch_sizes = deque(maxlen=100)
+        self._batch_latencies = deque(maxlen=100)
+        self._total_batches = 0
+        self._total_requests = 0
+    
+    def bucket_for(self, duration: float) -> int:
+        """Round the token budget for ``duration`` up to the bucket size"""
+        tokens = max(1, int(duration * TOKENS_PER_SECOND))
+        return -(-tokens // self.bucket_tokens) * self.bucket_tokens
+    
+    def submit(self, server: MusicGenServer, prompt: str, duration: float,
+               seed: Optional[int] = None, style: str = "ambient") -> Future:
+        """Queue a prompt for batched generation on ``server`` and return a future for its audio"""
+        pending = PendingGeneration(server, prompt, duration, seed, style)
+        bucket = (server.model_name, self.bucket_for(duration), seed)
+        
+        with self._condition:
+            self._ensure_worker()
+            self._pending.setdefault(bucket, []).append(pending)
+            self._condition.notify()
+        
+        return pending.future
+    
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+            self._thread.start()
+    
+    def _next_batch(self):
+        """Block until a bucket is full or its oldest request has waited out the window"""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                next_deadline = None
                 
-                # Clean up temp file
-                os.unlink(tmp_file.name)
+                for bucket, items in self._pending.items():
+                    # A seed fixes the RNG for the whole batch, so seeded prompts run alone
+                    batch_size = self.max_batch_size if bucket[2] is None else 1
+                    deadline = items[0].enqueued_at + self.window
+                    if len(items) >= batch_size or deadline <= now:
+                        batch = items[:batch_size]
+                        del items[:batch_size]
+                        if not items:
+                            del self._pending[bucket]
+                        return bucket, batch
+                    if next_deadline is None or deadline < next_deadline:
+                        next_deadline = deadline
                 
-            logger.info(f"Generated {len(wav_bytes)} bytes of audio")
-            return wav_bytes
-            
+                timeout = None if next_deadline is None else next_deadline - now
+                self._condition.wait(timeout)
+    
+    def _run(self):
+        while True:
+            bucket, batch = self._next_batch()
+            self._run_batch(bucket, batch)
+    
+    def _run_batch(self, bucket: Tuple[str, int, Optional[int]], batch: List[PendingGeneration]):
+        model_name, max_new_tokens, seed = bucket
+        start = time.monotonic()
+        timings: Dict[str, float] = {}
+        try:
+            audio = batch[0].server.generate_batch([item.prompt for item in batch], max_new_tokens, seed, timings)
         except Exception as e:
-            logger.error(f"Music generation failed: {e}")
+            logger.error(f"Batch generation failed: {e}")
+            for item in batch:
+                item.future.set_exception(e)
+            return
+        
+        latency = time.monotonic() - start
+        with self._condition:
+            self._batch_sizes.append(len(batch))
+            self._batch_latencies.append(latency)
+            self._total_batches += 1
+            self._total_requests += len(batch)
+        logger.info(f"Generated batch of {len(batch)} with {model_name} (max_new_tokens={max_new_tokens}) in {latency:.2f}s")
+        
+        # Every prompt in the batch shared the same tokenizer and generate calls
+        for item in batch:
+            labels = metrics.request_labels(style_label(item.style), item.duration)
+            metrics.TOKENIZE_SECONDS.labels(*labels).observe(timings["tokenize"])
+            metrics.GENERATE_SECONDS.labels(*labels).observe(timings["generate"])
+            metrics.TOKENS_PER_SECOND.labels(*labels).observe(max_new_tokens / max(timings["generate"], 1e-9))
+        
+        for item, audio_data in zip(batch, audio):
+            # Bucketing may have generated more audio than this caller asked for
+            item.future.set_result(audio_data[:int(item.duration * SAMPLE_RATE)])
+    
+    def waiting(self) -> List[Tuple[str, float]]:
+        """(style, duration) of every prompt that has not been placed in a batch yet"""
+        with self._condition:
+            return [(item.style, item.duration) for items in self._pending.values() for item in items]
+    
+    def stats(self) -> Dict[str, Any]:
+        """Batch size and latency statistics over the recent batches"""
+        with self._condition:
+            sizes = list(self._batch_sizes)
+            latencies = list(self._batch_latencies)
+            return {
+                "window_ms": self.window * 1000.0,
+                "max_batch_size": self.max_batch_size,
+                "bucket_tokens": self.bucket_tokens,
+                "pending": sum(len(items) for items in self._pending.values()),
+                "total_batches": self._total_batches,
+                "total_requests": self._total_requests,
+                "last_batch_size": sizes[-1] if sizes else None,
+                "last_batch_latency_s": latencies[-1] if latencies else None,
+                "mean_batch_size": float(np.mean(sizes)) if sizes else None,
+                "mean_batch_latency_s": float(np.mean(latencies)) if latencies else None,
+            }
+
+class RegisteredModel:
+    """Bookkeeping for one model in the registry"""
+    
+    def __init__(self, server: MusicGenServer):
+        self.server = server
+        self.in_use = 0
+        self.requests = 0
+        self.last_used = 0.0
+        # Chosen for eviction; acquire() waits until the unload has finished
+        self.unloading = False
+
+class ModelRegistry:
+    """
+    Lazily loaded, shared MusicGen models with memory-aware eviction.
+    
+    Requests name a model by alias ("small", "medium"), by Hugging Face name
+    or by the directory of a fine-tuned checkpoint under ``models_dir``. Each
+    model is loaded on first use and shared by all later requests. When the
+    loaded models exceed ``memory_budget_bytes``, the least recently used ones
+    that are not serving a request are unloaded.
+    """
+    
+    def __init__(self, default_model: str = MODEL_NAME, models_dir: str = MODELS_DIR,
+                 memory_budget_bytes: int = int(MODEL_MEMORY_BUDGET_MB * 1024 * 1024),
+                 precision: str = MUSICGEN_PRECISION):
+        self.default_model = default_model
+        self.models_dir = models_dir
+        self.memory_budget_bytes = memory_budget_bytes
+        self.precision = precision
+        
+        self._models: Dict[str, RegisteredModel] = {}
+        self._lock = threading.Lock()
+        # Notified whenever an eviction finishes
+        self._unloaded = threading.Condition(self._lock)
+    
+    def resolve(self, name: Optional[str] = None) -> str:
+        """Map a requested model name to a loadable name or path, raising ValueError if unknown"""
+        if not name:
+            return self.default_model
+        if name in MODEL_ALIASES:
+            return MODEL_ALIASES[name]
+        if name == self.default_model or name in MODEL_ALIASES.values():
+            return name
+        
+        # Local checkpoints must live under models_dir
+        root = os.path.realpath(self.models_dir)
+        path = os.path.realpath(os.path.join(root, name))
+        if path.startswith(root + os.sep) and os.path.isdir(path):
+            return path
+        
+        raise ValueError(f"Unknown model '{name}'")
+    
+    def server(self, name: Optional[str] = None) -> MusicGenServer:
+        """The (possibly not yet loaded) server for a model"""
+        model_name = self.resolve(name)
+        with self._lock:
+            entry = self._models.get(model_name)
+            if entry is None:
+                entry = RegisteredModel(MusicGenServer(model_name, self.precision))
+                self._models[model_name] = entry
+            return entry.server
+    
+    def acquire(self, name: Optional[str] = None) -> MusicGenServer:
+        """Load a model if needed and pin it against eviction until release()"""
+        server = self.server(name)
+        with self._lock:
+            entry = self._models[server.model_name]
+            # A model being evicted is pinned once it is gone, and loaded again below
+            while entry.unloading:
+                self._unloaded.wait()
+            entry.in_use += 1
+            entry.requests += 1
+            entry.last_used = time.monotonic()
+        
+        try:
+            if server.load_model():
+                self.enforce_budget()
+        except Exception:
+            self.release(server)
             raise
+        return server
+    
+    def release(self, server: MusicGenServer):
+        with self._lock:
+            entry = self._models[server.model_name]
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+    
+    @contextmanager
+    def use(self, name: Optional[str] = None) -> Iterator[MusicGenServer]:
+        """Context manager around acquire()/release()"""
+        server = self.acquire(name)
+        try:
+            yield server
+        finally:
+            self.release(server)
+    
+    def enforce_budget(self, keep: Optional[MusicGenServer] = None):
+        """Unload idle models other than ``keep``, least recently used first, until the budget is met"""
+        with self._lock:
+            # Models another call is already evicting are as good as gone
+            loaded = [entry for entry in self._models.values()
+                      if entry.server.model is not None and not entry.unloading]
+            total = sum(entry.server.resident_bytes() for entry in loaded)
+            
+            # Victims are marked while the lock is held, so acquire() cannot pin them before they are unloaded
+            victims = []
+            for entry in sorted(loaded, key=lambda entry: entry.last_used):
+                if total <= self.memory_budget_bytes:
+                    break
+                if entry.in_use or entry.server is keep:
+                    continue
+                entry.unloading = True
+                victims.append(entry)
+                total -= entry.server.resident_bytes()
+        
+        for entry in victims:
+            logger.info(f"Evicting {entry.server.model_name} to stay within the model memory budget")
+            try:
+                entry.server.unload()
+            finally:
+                with self._lock:
+                    entry.unloading = False
+                    self._unloaded.notify_all()
+        
+        if total > self.memory_budget_bytes:
+            logger.warning(f"Loaded models use {total / 1024 ** 2:.0f} MB, above the "
+                           f"{self.memory_budget_bytes / 1024 ** 2:.0f} MB budget, but all are in use")
+    
+    def resident(self) -> List[Tuple[str, int]]:
+        """(model name, weight bytes) for every registered model"""
+        with self._lock:
+            entries = list(self._models.items())
+        return [(model_name, entry.server.resident_bytes()) for model_name, entry in entries]
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = list(self._models.items())
+        
+        models = {}
+        for model_name, entry in entries:
+            server = entry.server
+            models[model_name] = {
+                "loaded": server.model is not None,
+                "precision": server.precision,
+                "load_seconds": round(server.load_seconds, 2) if server.load_seconds else None,
+                "resident_mb": round(server.resident_bytes() / 1024 ** 2, 1),
+                "requests": entry.requests,
+                "in_use": entry.in_use,
+            }
+        
+        return {
+            "default": self.default_model,
+            "memory_budget_mb": round(self.memory_budget_bytes / 1024 ** 2, 1),
+            "resident_mb": round(sum(m["resident_mb"] for m in models.values()), 1),
+            "models": models,
+        }
+
+class ResultCache:
+    """
+    Content-addressed cache of generated WAV files.
+    
+    Entries are keyed on a hash of everything that determines the output. A
+    memory tier keeps the most recently used results; an optional disk tier
+    holds more, evicting the least recently used files once ``disk_bytes`` is
+    exceeded. Disk hits are promoted back into memory.
+    """
+    
+    def __init__(self, memory_bytes: int = 256 * 1024 * 1024,
+                 disk_dir: Optional[str] = None, disk_bytes: int = 2 * 1024 * 1024 * 1024):
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+        
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_size = 0
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_size = sum(os.path.getsize(path) for path in self._disk_files())
+    
+    @staticmethod
+    def make_key(enhanced_prompt: str, duration: float, seed: int, model_name: str) -> str:
+        """Hash of every input that determines the cached WAV, from the generation to its sample format"""
+        payload = json.dumps({
+            "prompt": enhanced_prompt,
+            "duration": duration,
+            "sampling": GENERATION_PARAMS,
+            "seed": seed,
+            "model": model_name,
+            "sample_rate": SAMPLE_RATE,
+            "sample_format": WAV_SAMPLE_FORMAT
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return data
+        
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                # Refresh the access time used for disk eviction
+                os.utime(path)
+            except OSError:
+                data = None
+            
+            if data is not None:
+                with self._lock:
+                    self._counters["disk_hits"] += 1
+                    self._remember(key, data)
+                return data
+        
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+    
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            self._remember(key, data)
+        
+        if self.disk_dir:
+            self._write_disk(key, data)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = sum(self._counters.values()) - self._counters["evictions"]
+            hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+            return {
+                **self._counters,
+                "hit_rate": round(hits / lookups, 3) if lookups else None,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "disk_bytes": self._disk_size if self.disk_dir else None,
+            }
+    
+    def _remember(self, key: str, data: bytes):
+        """Insert into the memory tier and evict least recently used entries"""
+        if len(data) > self.memory_bytes:
+            return
+        
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_size -= len(previous)
+        self._memory[key] = data
+        self._memory_size += len(data)
+        
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+            self._counters["evictions"] += 1
+    
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.wav")
+    
+    def _disk_files(self) -> List[str]:
+        return [os.path.join(root, name)
+                for root, _, names in os.walk(self.disk_dir)
+                for name in names if name.endswith('.wav')]
+    
+    def _write_disk(self, key: str, data: bytes):
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file first so readers never see a partial entry
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {key}: {e}")
+            return
+        
+        with self._lock:
+            self._disk_size += len(data)
+            if self._disk_size > self.disk_bytes:
+                self._evict_disk()
+    
+    def _evict_disk(self):
+        """Remove least recently used files until the disk tier fits its budget"""
+        entries = []
+        for path in self._disk_files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        
+        self._disk_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if self._disk_size <= self.disk_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            self._disk_size -= size
+            self._counters["evictions"] += 1
+
+class QueueFullError(Exception):
+    """Raised when the job queue cannot accept more work"""
+    
+    def __init__(self, retry_after: int):
+        super().__init__("Job queue is full, please retry later")
+        self.retry_after = retry_after
+
+class Job:
+    """A generation request tracked by the job queue"""
+    
+    def __init__(self, prompt: str, style: str, duration: float, seed: Optional[int] = None,
+                 long_form: bool = False, model: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.model = model
+        self.prompt = prompt
+        self.style = style
+        self.duration = duration
+        self.seed = seed
+        self.long_form = long_form
+        # Long-form results are written to disk instead of being held in memory
+        self.output_path: Optional[str] = None
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[bytes] = None
+        self.error: Optional[str] = None
+
+class JobQueue:
+    """
+    Bounded in-process job queue served by a fixed pool of model workers.
+    
+    Workers feed the batch scheduler, so the pool size is also the largest
+    batch that jobs alone can form. Finished jobs are kept for ``result_ttl``
+    seconds so clients can collect their audio, and only the most recent
+    ``max_finished`` of them are kept at all. Long-form jobs write their
+    audio to ``output_dir`` as it is generated.
+    """
+    
+    def __init__(self, registry: ModelRegistry, num_workers: int = 4,
+                 max_queue_size: int = 32, result_ttl: float = 3600.0,
+                 output_dir: Optional[str] = None, max_finished: int = 256):
+        self.registry = registry
+        self.num_workers = max(1, num_workers)
+        self.result_ttl = result_ttl
+        self.max_finished = max(1, max_finished)
+        self.output_dir = output_dir or os.path.join(tempfile.gettempdir(), "musicgen_jobs")
+        
+        self._queue: "queue.Queue[Job]" = queue.Queue(maxsize=max(1, max_queue_size))
+        self._jobs: Dict[str, Job] = {}
+        self._waiting: List[str] = []
+        self._lock = threading.Lock()
+        self._workers: List[threading.Thread] = []
+        
+        # Running average of job runtime used for ETAs, seeded with a CPU-ish guess
+        self._avg_runtime = 20.0
+    
+    def start(self):
+        """Start the worker pool (idempotent)"""
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.num_workers):
+                worker = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+    
+    def submit(self, prompt: str, style: str, duration: float, seed: Optional[int] = None,
+               long_form: bool = False, model: Optional[str] = None) -> Job:
+        """Enqueue a job, raising QueueFullError instead of blocking when full"""
+        self.start()
+        self._purge_expired()
+        
+        job = Job(prompt, style, duration, seed, long_form, model)
+        with self._lock:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFullError(self.retry_after())
+            self._jobs[job.id] = job
+            self._waiting.append(job.id)
+        
+        logger.info(f"Queued job {job.id} ({len(self._waiting)} waiting)")
+        return job
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        self._purge_expired()
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def retry_after(self) -> int:
+        """Seconds until a queue slot is likely to free up"""
+        return max(1, int(round(self._avg_runtime / self.num_workers)))
+    
+    def describe(self, job: Job) -> Dict[str, Any]:
+        """Status, queue position and ETA for a job"""
+        with self._lock:
+            position = self._waiting.index(job.id) if job.id in self._waiting else None
+            avg_runtime = self._avg_runtime
+        
+        if job.status == "queued" and position is not None:
+            eta = (position // self.num_workers + 1) * avg_runtime
+        elif job.status == "running":
+            eta = max(0.0, avg_runtime - (time.time() - job.started_at))
+        else:
+            eta = 0.0
+        
+        info = {
+            "job_id": job.id,
+            "status": job.status,
+            "queue_position": position,
+            "eta_seconds": round(eta, 1),
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+        }
+        if job.error:
+            info["error"] = job.error
+        return info
+    
+    def waiting(self) -> List[Tuple[str, float]]:
+        """(style, duration) of every queued job"""
+        with self._lock:
+            return [(self._jobs[job_id].style, self._jobs[job_id].duration) for job_id in self._waiting]
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses: Dict[str, int] = {}
+            for job in self._jobs.values():
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+            return {
+                "workers": self.num_workers,
+                "queue_depth": len(self._waiting),
+                "max_queue_size": self._queue.maxsize,
+                "avg_runtime_s": round(self._avg_runtime, 2),
+                "jobs": statuses,
+            }
+    
+    def _purge_expired(self):
+        """Drop finished jobs past their TTL, and the oldest ones beyond ``max_finished``"""
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            finished = sorted((job for job in self._jobs.values() if job.finished_at is not None),
+                              key=lambda job: job.finished_at)
+            excess = len(finished) - self.max_finished
+            expired = [job.id for index, job in enumerate(finished)
+                       if index < excess or job.finished_at < cutoff]
+            for job_id in expired:
+                job = self._jobs.pop(job_id)
+                if job.output_path and os.path.exists(job.output_path):
+                    os.unlink(job.output_path)
+    
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._waiting.remove(job.id)
+                job.status = "running"
+                job.started_at = time.time()
+            
+            try:
+                with self.registry.use(job.model) as server:
+                    if job.long_form:
+                        os.makedirs(self.output_dir, exist_ok=True)
+                        job.output_path = server.write_long_form(
+                            os.path.join(self.output_dir, f"{job.id}.wav"),
+                            job.prompt, job.style, job.duration, job.seed
+                        )
+                    else:
+                        job.result = server.generate_music(job.prompt, job.style, job.duration, job.seed)
+                job.status = "completed"
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                with self._lock:
+                    runtime = job.finished_at - job.started_at
+                    self._avg_runtime = 0.8 * self._avg_runtime + 0.2 * runtime
+                self._queue.task_done()
+                self._purge_expired()
 
 # Global server instance
-music_server = MusicGenServer()
+model_registry = ModelRegistry()
+# Server for the default model, which is warmed up on startup
+music_server = model_registry.server()
+
+# Setting CACHE_MEMORY_MB=0 and leaving CACHE_DIR unset disables result caching
+_cache_memory_mb = float(os.environ.get('CACHE_MEMORY_MB', 256))
+result_cache = ResultCache(
+    memory_bytes=int(_cache_memory_mb * 1024 * 1024),
+    disk_dir=os.environ.get('CACHE_DIR') or None,
+    disk_bytes=int(float(os.environ.get('CACHE_DISK_MB', 2048)) * 1024 * 1024)
+) if _cache_memory_mb > 0 or os.environ.get('CACHE_DIR') else None
+batch_scheduler = BatchScheduler(
+    window_ms=float(os.environ.get('BATCH_WINDOW_MS', 50)),
+    max_batch_size=int(os.environ.get('MAX_BATCH_SIZE', 4)),
+    bucket_tokens=int(os.environ.get('BATCH_BUCKET_TOKENS', 250))
+)
+job_queue = JobQueue(
+    model_registry,
+    num_workers=int(os.environ.get('JOB_WORKERS', 4)),
+    max_queue_size=int(os.environ.get('JOB_QUEUE_SIZE', 32)),
+    result_ttl=float(os.environ.get('JOB_RESULT_TTL', 3600)),
+    max_finished=int(os.environ.get('JOB_MAX_FINISHED', 256)),
+    output_dir=os.environ.get('JOB_OUTPUT_DIR') or None
+)
+
+def wants_long_form() -> bool:
+    """True when the JSON body asks for long-form generation"""
+    data = request.get_json(silent=True)
+    return bool(data and data.get('long_form'))
+
+def parse_generation_request(max_duration: float = 30.0) -> Dict[str, Any]:
+    """Validate the JSON body shared by /generate and /jobs"""
+    data = request.get_json(silent=True)
+    if not data:
+        raise BadRequest("No JSON data provided")
+    
+    prompt = data.get('prompt', '')
+    style = data.get('style', 'ambient')
+    try:
+        duration = float(data.get('duration', 10.0))
+    except (TypeError, ValueError):
+        raise BadRequest("Duration must be a number")
+    if not math.isfinite(duration) or duration <= 0:
+        raise BadRequest("Duration must be a positive number of seconds")
+    # Max 30 seconds unless long-form generation was requested
+    duration = min(max(duration, MIN_DURATION_SECONDS), max_duration)
+    
+    if not prompt.strip():
+        raise BadRequest("Prompt is required")
+    
+    seed = data.get('seed')
+    if seed is not None:
+        if isinstance(seed, bool) or not isinstance(seed, int) or not 0 <= seed < 2 ** 32:
+            raise BadRequest("Seed must be an integer between 0 and 2^32 - 1")
+    
+    return {"prompt": prompt, "style": style, "duration": duration, "seed": seed}
+
+def requested_model() -> str:
+    """Resolve the optional "model" field of the JSON body"""
+    data = request.get_json(silent=True) or {}
+    try:
+        return model_registry.resolve(data.get('model'))
+    except ValueError as e:
+        raise BadRequest(str(e))
+
+def wants_stream(data: Optional[Dict[str, Any]]) -> bool:
+    """True when the client asked for a streamed response via JSON or query string"""
+    value = request.args.get('stream')
+    if value is None and data:
+        value = data.get('stream')
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+def streaming_response(model: str, params: Dict[str, Any], audio_format: str) -> Response:
+    """Chunked response carrying audio while it is being generated"""
+    server = model_registry.acquire(model)
+    try:
+        chunks = server.stream_music(**params)
+    except Exception:
+        model_registry.release(server)
+        raise
+    
+    def body():
+        if audio_format == 'wav':
+            yield wav_header(SAMPLE_RATE)
+        for chunk in chunks:
+            yield bytes(encode_pcm(chunk))
+    
+    if audio_format == 'wav':
+        response = Response(stream_with_context(body()), mimetype='audio/wav')
+    else:
+        response = Response(stream_with_context(body()), mimetype='audio/L16')
+        response.headers['X-Sample-Rate'] = str(SAMPLE_RATE)
+        response.headers['X-Channels'] = '1'
+    response.headers['Cache-Control'] = 'no-cache'
+    # Keep the model pinned until the client has received the whole stream
+    response.call_on_close(lambda: model_registry.release(server))
+    return response
+
+def long_form_response(model: str, params: Dict[str, Any]) -> Response:
+    """Chunked 16-bit WAV response that grows one long-form segment at a time"""
+    total_samples = int(params['duration'] * SAMPLE_RATE)
+    server = model_registry.acquire(model)
+    chunks = server.generate_long_form(**params)
+    
+    def body():
+        # The total length is known up front, so the header can carry exact sizes
+        yield wav_header(SAMPLE_RATE, total_samples, sample_format='int16')
+        for chunk in chunks:
+            yield bytes(encode_pcm(chunk))
+    
+    response = Response(stream_with_context(body()), mimetype='audio/wav')
+    response.headers['Content-Disposition'] = f'attachment; filename=generated_music_{uuid.uuid4()}.wav'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.call_on_close(lambda: model_registry.release(server))
+    return response
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "healthy", "model_loaded": music_server.model is not None})
+    response = jsonify({
+        "status": "warming_up" if music_server.warming_up else "healthy",
+        "ready": music_server.ready,
+        "model_loaded": music_server.model is not None,
+        "precision": music_server.precision,
+        "models": model_registry.stats(),
+        "batching": batch_scheduler.stats(),
+        "jobs": job_queue.stats(),
+        "cache": result_cache.stats() if result_cache is not None else None
+    })
+    # Keep load balancers away until warm-up has finished
+    if music_server.warming_up:
+        response.status_code = 503
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics"""
+    # Queue depth and model memory are sampled at scrape time
+    metrics.set_queue_depth(
+        [("batch", style_label(style), duration) for style, duration in batch_scheduler.waiting()] +
+        [("jobs", style_label(style), duration) for style, duration in job_queue.waiting()]
+    )
+    metrics.set_model_memory(model_registry.resident())
+    
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
 
 @app.route('/generate', methods=['POST'])
 def generate_music():
     """Generate music endpoint"""
     try:
-        data = request.get_json()
-        if not data:
-            raise BadRequest("No JSON data provided")
+        model = requested_model()
+        if wants_long_form():
+            return long_form_response(model, parse_generation_request(LONG_FORM_MAX_SECONDS))
         
-        prompt = data.get('prompt', '')
-        style = data.get('style', 'ambient')
-        duration = min(float(data.get('duration', 10.0)), 30.0)  # Max 30 seconds
+        params = parse_generation_request()
         
-        if not prompt.strip():
-            raise BadRequest("Prompt is required")
+        if wants_stream(request.get_json(silent=True)):
+            audio_format = request.args.get('format', 'wav').lower()
+            if audio_format not in ('wav', 'pcm'):
+                raise BadRequest("Format must be 'wav' or 'pcm'")
+            return streaming_response(model, params, audio_format)
         
         # Generate music
-        wav_bytes = music_server.generate_music(prompt, style, duration)
+        with model_registry.use(model) as server:
+            wav_bytes = server.generate_music(**params)
         
-        # Create temporary file to return
-        temp_id = str(uuid.uuid4())
-        temp_path = f"/tmp/music_{temp_id}.wav"
+        # Serve straight from the in-memory buffer
+        return wav_response(wav_bytes, f'generated_music_{uuid.uuid4()}.wav')
         
-        with open(temp_path, 'wb') as f:
-            f.write(wav_bytes)
+    except BadRequest as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Generation endpoint error: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue a generation job and return immediately"""
+    try:
+        model = requested_model()
+        long_form = wants_long_form()
+        params = parse_generation_request(LONG_FORM_MAX_SECONDS if long_form else 30.0)
+        job = job_queue.submit(**params, long_form=long_form, model=model)
         
-        return send_file(
-            temp_path,
-            mimetype='audio/wav',
-            as_attachment=True,
-            download_name=f'generated_music_{temp_id}.wav'
-        )
+        response = jsonify({
+            **job_queue.describe(job),
+            "status_url": f"/jobs/{job.id}",
+            "audio_url": f"/jobs/{job.id}/audio"
+        })
+        response.status_code = 202
+        response.headers['Location'] = f"/jobs/{job.id}"
+        return response
         
     except BadRequest as e:
         return jsonify({"error": str(e)}), 400
+    except QueueFullError as e:
+        response = jsonify({"error": str(e)})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
     except Exception as e:
-        logger.error(f"Generation endpoint error: {e}")
+        logger.error(f"Job submission error: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Report job status, queue position and ETA"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_queue.describe(job))
+
+@app.route('/jobs/<job_id>/audio', methods=['GET'])
+def get_job_audio(job_id):
+    """Return the audio of a completed job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    
+    if job.status == "failed":
+        return jsonify({"error": job.error or "Generation failed"}), 500
+    if job.status != "completed":
+        info = job_queue.describe(job)
+        response = jsonify(info)
+        response.status_code = 202
+        response.headers['Retry-After'] = str(max(1, int(info['eta_seconds'])))
+        return response
+    
+    if job.output_path:
+        return send_file(
+            job.output_path,
+            mimetype='audio/wav',
+            as_attachment=True,
+            download_name=f'generated_music_{job.id}.wav'
+        )
+    
+    return wav_response(job.result, f'generated_music_{job.id}.wav')
+
 @app.route('/load-model', methods=['POST'])
 def load_model():
-    """Load model endpoint"""
+    """Load model endpoint (idempotent unless {"force": true} is sent)"""
     try:
-        music_server.load_model()
-        return jsonify({"status": "Model loaded successfully"})
+        data = request.get_json(silent=True) or {}
+        server = model_registry.server(requested_model())
+        if server.load_model(force=bool(data.get('force'))):
+            model_registry.enforce_budget(keep=server)
+            if WARMUP_ON_STARTUP and server is music_server:
+                start_warm_up()
+            return jsonify({"status": "Model loaded successfully", "model": server.model_name})
+        return jsonify({"status": "Model already loaded", "model": server.model_name})
+    except BadRequest as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Model loading failed: {e}")
         return jsonify({"error": str(e)}), 500
 
+def warm_up_buckets() -> List[int]:
+    """Token budget of every batching bucket up to the 30 second cap"""
+    max_tokens = batch_scheduler.bucket_for(30.0)
+    return list(range(batch_scheduler.bucket_tokens, max_tokens + 1, batch_scheduler.bucket_tokens))
+
+def start_warm_up():
+    """Load and warm up the model in the background while /health reports warming_up"""
+    def run():
+        try:
+            music_server.warm_up(warm_up_buckets(), WARMUP_BATCH_SIZE)
+        except Exception as e:
+            logger.warning(f"Warm-up failed: {e}")
+            logger.info("Model will be loaded on first request")
+    
+    music_server.warming_up = True
+    threading.Thread(target=run, name="warm-up", daemon=True).start()
+
 if __name__ == '__main__':
     # Load model on startup
-    try:
-        music_server.load_model()
-    except Exception as e:
-        logger.warning(f"Failed to load model on startup: {e}")
-        logger.info("Model will be loaded on first request")
+    if WARMUP_ON_STARTUP:
+        start_warm_up()
+    else:
+        try:
+            music_server.load_model()
+        except Exception as e:
+            logger.warning(f"Failed to load model on startup: {e}")
+            logger.info("Model will be loaded on first request")
+    
+    # Chunked transfer encoding for streamed responses needs HTTP/1.1
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
     
     # Start server
     port = int(os.environ.get('PORT', 8080))
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    # threaded=True lets concurrent requests reach the batch scheduler together
+    app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
\ No newline at end of file
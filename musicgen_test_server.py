@@ -6,11 +6,11 @@ This version doesn't require local model installation
 
 import os
 import requests
-import tempfile
 import uuid
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify
 import logging
 from werkzeug.exceptions import BadRequest
+from audio_encoding import wav_response
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -117,19 +117,8 @@ def generate_music():
         # Generate music
         audio_bytes = music_server.generate_music(prompt, style, duration)
         
-        # Create temporary file to return
-        temp_id = str(uuid.uuid4())
-        temp_path = f"/tmp/music_{temp_id}.wav"
-        
-        with open(temp_path, 'wb') as f:
-            f.write(audio_bytes)
-        
-        return send_file(
-            temp_path,
-            mimetype='audio/wav',
-            as_attachment=True,
-            download_name=f'generated_music_{temp_id}.wav'
-        )
+        # Serve straight from memory instead of a /tmp copy
+        return wav_response(audio_bytes, f'generated_music_{uuid.uuid4()}.wav')
         
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Per-stage timing and memory profiling for AudioPreprocessingPipeline
+
+The pipeline wraps each step in ``with stage("load.decode"):``. A stage only
+records anything while a StageProfiler is tracking a file or a batch in this
+process; otherwise it costs a global lookup. Stages of batched steps (the
+MusicGen and Whisper processors) are split evenly between the rows of the
+batch, so every file gets its share.
+
+Per file the profiler records wall time, the time of each stage and the
+peak resident memory of the process. With ``trace_memory`` it also records
+the peak memory traced by tracemalloc while the file was analyzed (NumPy
+arrays included, torch tensors not); tracing slows allocations, so stage
+times of such a run are inflated and should be taken from a run without it.
+
+Optionally the analysis of each file and each processor batch runs under
+cProfile. The profile of a file covers its analysis (loading, features,
+segmentation, encoding); the MusicGen and Whisper processors run once per
+batch of rows from several files, so they are profiled per batch and each
+file lists the batches it took part in. The stats of the slowest files are
+kept, merged with their whole batches. Records are plain dictionaries so
+pool workers can send them back to the parent.
+"""
+
+import cProfile
+import os
+import pstats
+import re
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# (record, weight) pairs that stages in this process currently add their time to
+_targets: Optional[List[Tuple[Dict[str, Any], float]]] = None
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed block as stage ``name`` of the file or batch being profiled"""
+    targets = _targets
+    if targets is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        for record, weight in targets:
+            record['stages'][name] = record['stages'].get(name, 0.0) + elapsed * weight
+
+
+@contextmanager
+def _recording(targets: List[Tuple[Dict[str, Any], float]]) -> Iterator[None]:
+    global _targets
+    previous = _targets
+    _targets = targets
+    try:
+        yield
+    finally:
+        _targets = previous
+
+
+def max_rss_mb(children: bool = False) -> Optional[float]:
+    """Peak resident memory of this process so far, or of its largest finished child process, in MB"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux
+    return max_rss / 2**20 if sys.platform == 'darwin' else max_rss / 1024
+
+
+class StageProfiler:
+    """
+    Collects one record per processed file
+
+    Args:
+        enabled: Record anything at all; a disabled profiler's context managers do nothing
+        profile_dir: Run every file and batch under cProfile and dump its stats here
+        trace_memory: Measure each file's peak traced memory with tracemalloc, which slows it down
+    """
+
+    def __init__(self, enabled: bool = False, profile_dir: Optional[str] = None, trace_memory: bool = False):
+        self.enabled = enabled or profile_dir is not None or trace_memory
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self.trace_memory = trace_memory
+        self.records: List[Dict[str, Any]] = []
+        self._batches = 0
+
+    @contextmanager
+    def file(self, audio_file: str) -> Iterator[Optional[Dict[str, Any]]]:
+        """Profile the analysis of one file; yields its record (None when disabled)"""
+        if not self.enabled:
+            yield None
+            return
+
+        record = {'audio_file': audio_file, 'seconds': 0.0, 'stages': {}}
+        # Traced only while the file is analyzed, so nothing else pays for it
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        profile = cProfile.Profile() if self.profile_dir else None
+
+        start = time.perf_counter()
+        try:
+            with _recording([(record, 1.0)]):
+                if profile:
+                    profile.enable()
+                try:
+                    yield record
+                finally:
+                    if profile:
+                        profile.disable()
+        finally:
+            record['seconds'] += time.perf_counter() - start
+            record['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 2**20 if self.trace_memory else None
+            if started_tracing:
+                tracemalloc.stop()
+            record['max_rss_mb'] = max_rss_mb()
+            if profile:
+                self.profile_dir.mkdir(parents=True, exist_ok=True)
+                path = self.profile_dir / f"{re.sub(r'[^A-Za-z0-9._-]', '_', audio_file)}.prof"
+                profile.dump_stats(str(path))
+                record['profile'] = str(path)
+                record['batch_profiles'] = []
+            self.records.append(record)
+
+    @contextmanager
+    def batch(self, records: List[Optional[Dict[str, Any]]]) -> Iterator[None]:
+        """
+        Profile a step run once for several rows; ``records`` holds the record of each row's file
+
+        With cProfile enabled the batch gets its own dump, listed under
+        ``batch_profiles`` in the record of every file in it.
+        """
+        records = [record for record in records if record is not None]
+        if not self.enabled or not records:
+            yield
+            return
+
+        # A file with several rows in the batch gets a share per row
+        shares = {}
+        for record in records:
+            shares.setdefault(id(record), [record, 0.0])[1] += 1.0 / len(records)
+        targets = [(record, weight) for record, weight in shares.values()]
+        profile = cProfile.Profile() if self.profile_dir else None
+
+        start = time.perf_counter()
+        try:
+            with _recording(targets):
+                if profile:
+                    profile.enable()
+                try:
+                    yield
+                finally:
+                    if profile:
+                        profile.disable()
+        finally:
+            elapsed = time.perf_counter() - start
+            for record, weight in targets:
+                record['seconds'] += elapsed * weight
+            if profile:
+                # Workers profile batches concurrently, so the process id keeps the names apart
+                batch_dir = self.profile_dir / "batches"
+                batch_dir.mkdir(parents=True, exist_ok=True)
+                path = batch_dir / f"batch-{os.getpid()}-{self._batches:05d}.prof"
+                self._batches += 1
+                profile.dump_stats(str(path))
+                for record, _ in targets:
+                    record.setdefault('batch_profiles', []).append(str(path))
+
+    def take_records(self) -> List[Dict[str, Any]]:
+        """Records collected so far, removing them from the profiler (to send them to another process)"""
+        records, self.records = self.records, []
+        return records
+
+    def report(self, slowest: int = 0) -> Dict[str, Any]:
+        """
+        Per-file records and per-stage aggregates
+
+        With cProfile enabled, the stats of each of the ``slowest`` files,
+        merged with the stats of the whole batches it was part of, are written
+        next to its .prof file as text, sorted by cumulative time. The .prof
+        files of all other files and of batches none of them took part in are
+        deleted.
+        """
+        records = self.records
+        total = sum(record['seconds'] for record in records)
+
+        stages = {}
+        for record in records:
+            untimed = record['seconds'] - sum(record['stages'].values())
+            for name, seconds in list(record['stages'].items()) + [('other', max(untimed, 0.0))]:
+                stages.setdefault(name, []).append(seconds)
+
+        aggregate = {}
+        for name, values in sorted(stages.items(), key=lambda item: -sum(item[1])):
+            values = sorted(values)
+            aggregate[name] = {
+                'total_seconds': sum(values),
+                'mean_ms': sum(values) / len(values) * 1000,
+                'p50_ms': values[len(values) // 2] * 1000,
+                'max_ms': values[-1] * 1000,
+                'share': sum(values) / total if total else 0.0
+            }
+
+        ranked = sorted(records, key=lambda record: -record['seconds'])
+        slowest_files = []
+        kept_batches = set()
+        for rank, record in enumerate(ranked):
+            path = record.get('profile')
+            if rank < slowest:
+                slowest_files.append(record['audio_file'])
+                if path and os.path.exists(path):
+                    batch_paths = [batch for batch in record.get('batch_profiles', []) if os.path.exists(batch)]
+                    kept_batches.update(batch_paths)
+                    with open(Path(path).with_suffix('.txt'), 'w') as f:
+                        pstats.Stats(path, *batch_paths, stream=f).sort_stats('cumulative').print_stats(40)
+            elif path:
+                if os.path.exists(path):
+                    os.remove(path)
+                record.pop('profile')
+                record.pop('batch_profiles', None)
+
+        if self.profile_dir and (self.profile_dir / "batches").exists():
+            for path in (self.profile_dir / "batches").glob('*.prof'):
+                if str(path) not in kept_batches:
+                    path.unlink()
+
+        traced = [record['peak_traced_mb'] for record in records if record.get('peak_traced_mb') is not None]
+        rss = [record['max_rss_mb'] for record in records if record.get('max_rss_mb') is not None]
+        return {
+            'files': len(records),
+            'total_seconds': total,
+            'peak_traced_mb': max(traced, default=None),
+            'max_rss_mb': max(rss, default=None),
+            'stages': aggregate,
+            'slowest': slowest_files,
+            'per_file': records
+        }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """The per-stage aggregate of a report as a text table"""
+    lines = [
+        f"{'stage':<22} {'total s':>9} {'mean ms':>9} {'p50 ms':>9} {'max ms':>9} {'share':>7}"
+    ]
+    for name, stats in report['stages'].items():
+        lines.append(f"{name:<22} {stats['total_seconds']:>9.2f} {stats['mean_ms']:>9.1f} "
+                     f"{stats['p50_ms']:>9.1f} {stats['max_ms']:>9.1f} {stats['share']:>7.1%}")
+
+    lines.append(f"{report['files']} files in {report['total_seconds']:.1f}s of processing")
+    if report['peak_traced_mb'] is not None:
+        lines.append(f"Peak traced memory per file: {report['peak_traced_mb']:.0f} MB")
+    if report['max_rss_mb'] is not None:
+        lines.append(f"Peak resident memory of any process: {report['max_rss_mb']:.0f} MB")
+    for audio_file in report['slowest']:
+        lines.append(f"Slow: {audio_file}")
+    return "\n".join(lines)
@@ -10,14 +10,17 @@ import os
 import sys
 import json
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional
 
-def check_dependencies():
-    """Check if required packages are installed"""
-    required_packages = [
-        'transformers', 'datasets', 'torch', 'torchaudio', 
-        'librosa', 'numpy', 'matplotlib', 'tqdm'
-    ]
+STAGES = ("features", "musicgen", "whisper", "audio")
+
+def check_dependencies(stages: Iterable[str] = STAGES, visualizations: bool = True, audio_codes: bool = False):
+    """Check if the packages needed for the selected stages are installed"""
+    required_packages = ['datasets', 'librosa', 'soundfile', 'numpy', 'tqdm']
+    if 'musicgen' in stages or 'whisper' in stages or audio_codes:
+        required_packages += ['transformers', 'torch']
+    if visualizations:
+        required_packages.append('matplotlib')
     
     missing_packages = []
     
@@ -96,17 +99,46 @@ def run_preprocessing_pipeline(
     target_sample_rate: int = 32000,
     max_audio_length: int = 30,
     model_name: str = "facebook/musicgen-small",
+    audio_dtype: str = "float32",
+    resample_quality: str = "high",
+    segment: bool = False,
+    window_hop: Optional[float] = None,
+    max_silent_fraction: float = 1.0,
+    batch_size: int = 8,
+    num_workers: int = 1,
+    use_cache: bool = True,
+    hash_contents: bool = False,
+    shard_size: int = 256,
+    audio_codes: bool = False,
+    codes_shards: Optional[int] = None,
+    timing_report: bool = False,
+    profile_slowest: int = 0,
+    profile_memory: bool = False,
     create_visualizations: bool = True,
-    create_splits: bool = True
+    visualization_samples: Optional[int] = 5,
+    create_splits: bool = True,
+    export_audio_store: bool = False,
+    stages: Iterable[str] = STAGES
 ):
     """Run the complete preprocessing pipeline"""
     
     print("🎵 Audio Preprocessing Pipeline - Quick Start")
     print("=" * 50)
     
+    # Steps that read stored waveforms or librosa features are skipped when those stages are left out
+    stages = set(stages)
+    if 'audio' not in stages:
+        for step, enabled in (("audio codes", audio_codes), ("audio store", export_audio_store)):
+            if enabled:
+                print(f"⚠️  Skipping the {step}: needs the 'audio' stage")
+        audio_codes = export_audio_store = False
+    if create_visualizations and not {'audio', 'features'} <= stages:
+        print("⚠️  Skipping visualizations: need the 'audio' and 'features' stages")
+        create_visualizations = False
+    
     # Step 1: Check dependencies
     print("\n📦 Step 1: Checking dependencies...")
-    if not check_dependencies():
+    if not check_dependencies(stages, visualizations=create_visualizations, audio_codes=audio_codes):
         return False
     
     # Step 2: Validate dataset structure
@@ -126,12 +158,36 @@ def run_preprocessing_pipeline(
             output_dir=output_dir,
             target_sample_rate=target_sample_rate,
             max_audio_length=max_audio_length,
-            model_name=model_name
+            model_name=model_name,
+            audio_dtype=audio_dtype,
+            resample_quality=resample_quality,
+            segment=segment,
+            window_hop=window_hop,
+            max_silent_fraction=max_silent_fraction,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            use_cache=use_cache,
+            hash_contents=hash_contents,
+            shard_size=shard_size,
+            profile_stages=timing_report,
+            profile_slowest=profile_slowest,
+            profile_memory=profile_memory,
+            stages=stages
         )
         
         # Process dataset
         dataset = pipeline.process_dataset()
         
+        if pipeline.profile_report:
+            from pipeline_profiling import format_report
+            print("\n⏱️  Time per stage:")
+            print(format_report(pipeline.profile_report))
+        
+        # Precompute EnCodec training targets; the splits below then carry them
+        if audio_codes:
+            print("\n🎼 Encoding audio codes...")
+            dataset = pipeline.tokenize_audio(dataset, num_shards=codes_shards)
+        
         # Create train/validation splits
         if create_splits:
             print("\n📈 Creating train/validation splits...")
@@ -140,7 +196,12 @@ def run_preprocessing_pipeline(
         # Generate visualizations
         if create_visualizations:
             print("\n📊 Generating visualizations...")
-            pipeline.visualize_features(dataset, num_samples=5)
+            pipeline.visualize_features(dataset, num_samples=visualization_samples)
+        
+        # Export waveforms for random-access training loaders
+        if export_audio_store:
+            print("\n💽 Exporting audio store...")
+            pipeline.export_audio_store(dataset)
         
         # Generate summary
         print("\n📋 Generating dataset summary...")
@@ -160,6 +221,30 @@ def run_preprocessing_pipeline(
         print(f"❌ Error in preprocessing pipeline: {e}")
         return False
 
+def encode_audio_codes_shard(
+    output_dir: str,
+    num_shards: int,
+    shard_index: int,
+    target_sample_rate: int = 32000,
+    resample_quality: str = "high",
+    batch_size: int = 8
+):
+    """Encode the audio codes of one shard of an already processed dataset"""
+    
+    from audio_preprocessing_pipeline import AudioPreprocessingPipeline
+    from datasets import load_from_disk
+    
+    pipeline = AudioPreprocessingPipeline(
+        output_dir=output_dir,
+        target_sample_rate=target_sample_rate,
+        resample_quality=resample_quality,
+        batch_size=batch_size,
+        verbose=False
+    )
+    dataset = load_from_disk(str(pipeline.output_dir / "processed_dataset"))
+    codes = pipeline.tokenize_audio(dataset, num_shards=num_shards, shard_index=shard_index)
+    print(f"✅ Encoded shard {shard_index} of {num_shards} ({len(codes)} rows)")
+
 def create_example_dataset():
     """Create an example dataset for testing"""
     
@@ -227,18 +312,150 @@ def main():
         help="MusicGen model name (default: facebook/musicgen-small)"
     )
     
+    parser.add_argument(
+        "--audio-dtype",
+        choices=["float32", "int16"],
+        default="float32",
+        help="Storage dtype for processed audio (default: float32)"
+    )
+    
+    parser.add_argument(
+        "--resample-quality",
+        choices=["best", "high", "medium", "low", "polyphase"],
+        default="high",
+        help="Resampler quality for files not at the target sample rate (default: high)"
+    )
+    
+    parser.add_argument(
+        "--segment",
+        action="store_true",
+        help="Split long recordings into --max-length windows instead of truncating them"
+    )
+    
+    parser.add_argument(
+        "--window-hop",
+        type=float,
+        help="Seconds between window starts when segmenting (default: --max-length, no overlap)"
+    )
+    
+    parser.add_argument(
+        "--max-silent-fraction",
+        type=float,
+        default=1.0,
+        help="Drop windows with more than this fraction of silent frames (default: 1.0, keep all)"
+    )
+    
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=8,
+        help="Clips per MusicGen processor and Whisper feature extractor call (default: 8)"
+    )
+    
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes (default: 1)"
+    )
+    
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Reprocess every file instead of reusing unchanged results"
+    )
+    
+    parser.add_argument(
+        "--hash-contents",
+        action="store_true",
+        help="Detect changed files by content hash instead of size and modification time"
+    )
+    
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=256,
+        help="Rows per dataset shard written while processing (default: 256)"
+    )
+    
+    parser.add_argument(
+        "--audio-codes",
+        action="store_true",
+        help="Precompute MusicGen's EnCodec audio tokens as an int16 audio_codes column"
+    )
+    
+    parser.add_argument(
+        "--codes-shards",
+        type=int,
+        help="Number of shards the audio codes are encoded in (default: --workers)"
+    )
+    
+    parser.add_argument(
+        "--codes-shard-index",
+        type=int,
+        help="Only encode this shard of --codes-shards for the already processed dataset and exit"
+    )
+    
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=STAGES,
+        default=list(STAGES),
+        help="Parts of each row to produce; e.g. --stages features for librosa features only, "
+             "without loading transformers or torch (default: all)"
+    )
+    
+    parser.add_argument(
+        "--timing-report",
+        action="store_true",
+        help="Time every stage of every processed file and print a per-stage table"
+    )
+    
+    parser.add_argument(
+        "--profile",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Also run each file under cProfile and keep the stats of the N slowest files"
+    )
+    
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="Also trace each file's peak memory with tracemalloc; slows processing, so time stages in another run"
+    )
+    
     parser.add_argument(
         "--no-visualizations",
         action="store_true",
         help="Skip generating visualizations"
     )
     
+    parser.add_argument(
+        "--visualize-samples",
+        type=int,
+        default=5,
+        help="Samples to visualize, rendered in --workers processes; 0 for all (default: 5)"
+    )
+    
     parser.add_argument(
         "--no-splits",
         action="store_true",
         help="Skip creating train/validation splits"
     )
     
+    parser.add_argument(
+        "--audio-store",
+        action="store_true",
+        help="Also export all waveforms to a memory-mapped audio store"
+    )
+    
+    parser.add_argument(
+        "--migrate",
+        metavar="DATASET_DIR",
+        help="Convert a dataset saved with list-based columns to typed arrays and exit"
+    )
+    
     parser.add_argument(
         "--create-example",
         action="store_true",
@@ -254,6 +471,24 @@ def main():
             print("   python quick_start.py")
         return
     
+    # Handle migration of datasets written with the old list-based schema
+    if args.migrate:
+        from audio_preprocessing_pipeline import migrate_processed_dataset
+        migrate_processed_dataset(args.migrate, audio_dtype=args.audio_dtype)
+        return
+    
+    # Encode one shard of audio codes, e.g. one of several processes sharing the work
+    if args.codes_shard_index is not None:
+        encode_audio_codes_shard(
+            args.output_dir,
+            num_shards=args.codes_shards or args.workers,
+            shard_index=args.codes_shard_index,
+            target_sample_rate=args.sample_rate,
+            resample_quality=args.resample_quality,
+            batch_size=args.batch_size
+        )
+        return
+    
     # Run preprocessing pipeline
     success = run_preprocessing_pipeline(
         audio_dir=args.audio_dir,
@@ -262,8 +497,26 @@ def main():
         target_sample_rate=args.sample_rate,
         max_audio_length=args.max_length,
         model_name=args.model,
+        audio_dtype=args.audio_dtype,
+        resample_quality=args.resample_quality,
+        segment=args.segment,
+        window_hop=args.window_hop,
+        max_silent_fraction=args.max_silent_fraction,
+        batch_size=args.batch_size,
+        num_workers=args.workers,
+        use_cache=not args.no_cache,
+        hash_contents=args.hash_contents,
+        shard_size=args.shard_size,
+        audio_codes=args.audio_codes,
+        codes_shards=args.codes_shards,
+        timing_report=args.timing_report or args.profile > 0 or args.profile_memory,
+        profile_slowest=args.profile,
+        profile_memory=args.profile_memory,
         create_visualizations=not args.no_visualizations,
-        create_splits=not args.no_splits
+        visualization_samples=args.visualize_samples or None,
+        create_splits=not args.no_splits,
+        export_audio_store=args.audio_store,
+        stages=args.stages
     )
     
     if success:
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Behaviour tests for the MusicGen server
+
+Run with ``python -m pytest test_musicgen_server.py``. Requests go through the
+Flask test client to a tiny, randomly initialized MusicGen saved to a temporary
+directory, so no model is downloaded. Its audio is noise, but it is generated
+and decoded by the same code paths as the real model's.
+"""
+
+import os
+import struct
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("flask")
+
+import musicgen_server
+from benchmark_preprocessing import create_standin_models
+from musicgen_server import SAMPLE_RATE, BatchScheduler, Job, JobQueue, ResultCache
+
+MODEL = "musicgen"
+
+
+@pytest.fixture(scope="module")
+def models_dir(tmp_path_factory):
+    """A tiny MusicGen checkpoint, saved where the registry looks for fine-tuned models"""
+    import torch
+    from transformers import (
+        AutoProcessor, EncodecConfig, MusicgenConfig, MusicgenDecoderConfig,
+        MusicgenForConditionalGeneration, T5Config
+    )
+
+    root = tmp_path_factory.mktemp("models")
+    texts = list(musicgen_server.STYLE_CONTEXTS.values()) + ["calm evening"]
+    path = create_standin_models(root, texts)["model_name"]
+    vocab_size = len(AutoProcessor.from_pretrained(path).tokenizer)
+
+    torch.manual_seed(0)
+    model = MusicgenForConditionalGeneration(MusicgenConfig(
+        text_encoder=T5Config(vocab_size=vocab_size, d_model=16, d_kv=4, d_ff=32,
+                              num_layers=1, num_heads=2).to_dict(),
+        audio_encoder=EncodecConfig(sampling_rate=SAMPLE_RATE, target_bandwidths=[2.2],
+                                    upsampling_ratios=[8, 5, 4, 4], codebook_size=2048, num_filters=4,
+                                    hidden_size=16, num_lstm_layers=1).to_dict(),
+        decoder=MusicgenDecoderConfig(vocab_size=2048, hidden_size=16, num_hidden_layers=1,
+                                      num_attention_heads=2, ffn_dim=32, num_codebooks=4,
+                                      pad_token_id=2048, bos_token_id=2048,
+                                      max_position_embeddings=4096).to_dict()
+    ))
+    model.generation_config.decoder_start_token_id = 2048
+    model.generation_config.pad_token_id = 2048
+    model.save_pretrained(path)
+    return root
+
+
+@pytest.fixture
+def client(models_dir, monkeypatch):
+    monkeypatch.setattr(musicgen_server.model_registry, "models_dir", str(models_dir))
+    monkeypatch.setattr(musicgen_server, "result_cache", None)
+    monkeypatch.setattr(musicgen_server, "batch_scheduler", BatchScheduler(window_ms=10))
+    return musicgen_server.app.test_client()
+
+
+def tiny_server():
+    return musicgen_server.model_registry.server(MODEL)
+
+
+def wav_samples(data: bytes) -> int:
+    """Mono sample count from the size of the data chunk in a 44-byte WAV header"""
+    bits_per_sample, = struct.unpack_from("<H", data, 34)
+    data_size, = struct.unpack_from("<I", data, 40)
+    return data_size // (bits_per_sample // 8)
+
+
+def test_stream_finishes_with_requested_length(client):
+    response = client.post("/generate?stream=true&format=pcm",
+                           json={"prompt": "calm evening", "duration": 2.0, "model": MODEL})
+
+    assert response.status_code == 200
+    # 16-bit mono PCM
+    assert len(response.get_data()) == 2 * 2 * SAMPLE_RATE
+
+
+def test_concurrent_requests_share_one_batch(client, monkeypatch):
+    scheduler = BatchScheduler(window_ms=2000, max_batch_size=3)
+    monkeypatch.setattr(musicgen_server, "batch_scheduler", scheduler)
+    tiny_server().load_model()
+
+    responses = []
+    def request():
+        responses.append(musicgen_server.app.test_client().post(
+            "/generate", json={"prompt": "calm evening", "duration": 1.0, "model": MODEL}
+        ))
+    threads = [threading.Thread(target=request) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [response.status_code for response in responses] == [200] * 3
+    assert all(wav_samples(response.get_data()) == SAMPLE_RATE for response in responses)
+    stats = scheduler.stats()
+    assert stats["total_batches"] == 1
+    assert stats["last_batch_size"] == 3
+
+
+def test_seeded_request_is_served_from_cache(client, monkeypatch):
+    cache = ResultCache(memory_bytes=16 * 1024 * 1024)
+    monkeypatch.setattr(musicgen_server, "result_cache", cache)
+    body = {"prompt": "calm evening", "duration": 1.0, "seed": 7, "model": MODEL}
+
+    first = client.post("/generate", json=body)
+    batches = musicgen_server.batch_scheduler.stats()["total_batches"]
+    second = client.post("/generate", json=body)
+
+    assert first.status_code == second.status_code == 200
+    assert first.get_data() == second.get_data()
+    # The second response did not generate anything
+    assert musicgen_server.batch_scheduler.stats()["total_batches"] == batches
+
+
+def test_full_job_queue_returns_429_with_retry_after(client, monkeypatch, tmp_path):
+    jobs = JobQueue(musicgen_server.model_registry, num_workers=1, max_queue_size=1,
+                    output_dir=str(tmp_path))
+    monkeypatch.setattr(musicgen_server, "job_queue", jobs)
+    server = tiny_server()
+    server.load_model()
+    body = {"prompt": "calm evening", "duration": 1.0, "model": MODEL}
+
+    # Keep the worker busy with the first job while the second fills the queue
+    with server.inference_lock:
+        running = client.post("/jobs", json=body)
+        assert running.status_code == 202
+        while jobs.get(running.get_json()["job_id"]).status != "running":
+            threading.Event().wait(0.01)
+
+        assert client.post("/jobs", json=body).status_code == 202
+        response = client.post("/jobs", json=body)
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_long_form_has_requested_length(client, monkeypatch):
+    monkeypatch.setattr(musicgen_server, "LONG_FORM_WINDOW_SECONDS", 2.0)
+    monkeypatch.setattr(musicgen_server, "LONG_FORM_CONTEXT_SECONDS", 1.0)
+    monkeypatch.setattr(musicgen_server, "LONG_FORM_CROSSFADE_SECONDS", 0.5)
+
+    response = client.post("/generate", json={
+        "prompt": "calm evening", "duration": 5.0, "seed": 3, "long_form": True, "model": MODEL
+    })
+
+    assert response.status_code == 200
+    data = response.get_data()
+    assert wav_samples(data) == 5 * SAMPLE_RATE
+    # The header's length matches the samples that were actually sent
+    assert len(data) - 44 == 2 * 5 * SAMPLE_RATE
+
+
+@pytest.mark.parametrize("duration", [0, -5, "nan", "inf"])
+def test_invalid_duration_is_rejected(duration):
+    response = musicgen_server.app.test_client().post(
+        "/generate", json={"prompt": "calm evening", "duration": duration}
+    )
+
+    assert response.status_code == 400
+
+
+def test_finished_jobs_are_purged_beyond_the_cap(tmp_path):
+    jobs = JobQueue(musicgen_server.model_registry, max_finished=2, output_dir=str(tmp_path))
+    finished = []
+    for index in range(3):
+        job = Job("calm evening", "ambient", 1.0, long_form=True)
+        job.status = "completed"
+        job.finished_at = time.time() + index
+        job.output_path = str(tmp_path / f"{job.id}.wav")
+        open(job.output_path, "wb").close()
+        jobs._jobs[job.id] = job
+        finished.append(job)
+
+    # Reading any job's status purges the oldest finished job and its audio
+    assert jobs.get(finished[-1].id) is finished[-1]
+    assert jobs.get(finished[0].id) is None
+    assert not os.path.exists(finished[0].output_path)
+    assert all(os.path.exists(job.output_path) for job in finished[1:])
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Regression tests for the audio preprocessing pipeline
+
+Run with ``python -m pytest test_preprocessing_pipeline.py``. The corpus is
+synthesized and only the librosa features and waveforms are produced, so no
+model is downloaded.
+"""
+
+import json
+import types
+
+import numpy as np
+import pytest
+
+pytest.importorskip("librosa")
+pytest.importorskip("datasets")
+
+import audio_preprocessing_pipeline
+from audio_preprocessing_pipeline import AudioPreprocessingPipeline
+from benchmark_preprocessing import create_suite_corpus
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    metadata = create_suite_corpus(tmp_path / "corpus", num_clips=3, duration=5.0, source_rate=22050, seed=0)
+    return tmp_path, metadata
+
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_process_dataset_without_cache(corpus, num_workers):
+    root, metadata = corpus
+    pipeline = AudioPreprocessingPipeline(
+        audio_dir=str(root / "corpus" / "audio"),
+        metadata_file=str(root / "corpus" / "metadata.json"),
+        output_dir=str(root / "output"),
+        max_audio_length=10,
+        num_workers=num_workers,
+        use_cache=False,
+        stages=("features", "audio"),
+        verbose=False
+    )
+
+    dataset = pipeline.process_dataset()
+
+    assert len(dataset) == len(metadata)
+    assert dataset["audio_file"] == [item["audio_file"] for item in metadata]
+    assert not (root / "output" / "cache").exists()
+    with open(root / "output" / "processing_metadata.json") as f:
+        processing_metadata = json.load(f)
+    assert processing_metadata["failures"] == []
+    assert processing_metadata["cache"] == {"enabled": False, "hits": 0, "misses": len(metadata)}
+
+
+@pytest.mark.parametrize("whole_file", [False, True])
+def test_load_audio_file_with_overestimated_duration(tmp_path, monkeypatch, whole_file):
+    import soundfile as sf
+
+    # 12 s of silence, more than DECODE_MARGIN, then a 2 s tone
+    sample_rate = 22050
+    tone = 0.5 * np.sin(2 * np.pi * 440 * np.arange(2 * sample_rate) / sample_rate)
+    path = tmp_path / "quiet_start.wav"
+    sf.write(path, np.concatenate([np.zeros(12 * sample_rate), tone]), sample_rate)
+
+    # Take the librosa fallback, whose duration estimate claims far more audio than decodes
+    def unsupported(*args, **kwargs):
+        raise RuntimeError("unsupported format")
+    monkeypatch.setattr(audio_preprocessing_pipeline, "sf", types.SimpleNamespace(SoundFile=unsupported))
+    monkeypatch.setattr(audio_preprocessing_pipeline.librosa, "get_duration", lambda **kwargs: 1000.0)
+
+    pipeline = AudioPreprocessingPipeline(output_dir=str(tmp_path / "output"), max_audio_length=10, verbose=False)
+    audio, sample_rate = pipeline.load_audio_file(str(path), whole_file=whole_file)
+
+    assert audio is not None
+    assert len(audio) / sample_rate == pytest.approx(2.0, abs=0.1)
+
+
+def test_tokenize_audio_keeps_only_current_shards(corpus):
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    from benchmark_preprocessing import create_standin_models
+
+    root, metadata = corpus
+    models = create_standin_models(root / "models", [item["text"] for item in metadata])
+    pipeline = AudioPreprocessingPipeline(
+        audio_dir=str(root / "corpus" / "audio"),
+        metadata_file=str(root / "corpus" / "metadata.json"),
+        output_dir=str(root / "output"),
+        max_audio_length=10,
+        use_cache=False,
+        stages=("audio",),
+        codec_model=models["codec_model"],
+        verbose=False
+    )
+    dataset = pipeline.process_dataset()
+
+    pipeline.tokenize_audio(dataset, num_shards=2)
+    codes = pipeline.tokenize_audio(dataset, num_shards=1)
+
+    assert len(codes) == len(metadata)
+    # Both calls used the same directory, keyed by the recorded content hash
+    (codes_dir,) = (root / "output" / "audio_codes").iterdir()
+    assert sorted(path.name for path in codes_dir.iterdir()) == ["codes-00000-of-00001.arrow"]